@@ -0,0 +1,99 @@
+# Verus Network Data API - cold start benchmark
+# Starts the API twice on the same disk cache file (DISK_CACHE_PATH) and asks /block for the same
+# blocks after each start. The first start is cold: the file is new and every block comes from the
+# RPC. The second start is warm: the memory caches are empty again but the blocks are on disk.
+# The block store is turned off for both runs, so only the caches are measured. Needs a running
+# verus daemon, the RPC settings are read from the .env file like the APIs do.
+#
+# Usage: python benchmarks/cold_start.py --app fastapi --start 100000 --count 500 --disk-cache /tmp/rosetta-cache.db
+
+
+# Module imports.
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+import requests
+
+
+# Folder of the API files.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Helps to read a percentile from a sorted list of latencies.
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+# Starts the API in a new process and waits until it answers.
+def start_api(app, port, env):
+    if app == "fastapi":
+        command = [sys.executable, "-m", "uvicorn", "rosettaapi_fastapi:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "flask", "run", "--port", str(port)]
+        env = dict(env, FLASK_APP="rosettaapi_flask")
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.post(f"http://127.0.0.1:{port}/network/list", json={}, timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise Exception("The API did not start within 30 seconds")
+
+
+# Asks /block for every height once and returns the sorted latencies in seconds.
+def fetch_blocks(port, heights):
+    session = requests.Session()
+    latencies = []
+    for height in heights:
+        start = time.perf_counter()
+        response = session.post(f"http://127.0.0.1:{port}/block", json={"block_identifier": {"index": height}})
+        response.content
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise Exception(f"/block {height} failed with status {response.status_code}")
+    session.close()
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the disk cache of the Verus Rosetta API")
+    parser.add_argument("--app", choices=["fastapi", "flask"], default="fastapi", help="API to start")
+    parser.add_argument("--port", type=int, default=5599, help="port of the started API")
+    parser.add_argument("--start", type=int, default=100000, help="first height of the requested blocks")
+    parser.add_argument("--count", type=int, default=500, help="number of requested blocks")
+    parser.add_argument("--disk-cache", default="rosetta-bench-cache.db", help="disk cache file, it is deleted before the cold run")
+    parser.add_argument("--compression", type=int, default=0, help="zlib level of the disk cache, 0 stores the entries as they are")
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.disk_cache + suffix):
+            os.remove(args.disk_cache + suffix)
+    env = dict(os.environ, DISK_CACHE_PATH=os.path.abspath(args.disk_cache), DISK_CACHE_COMPRESSION=str(args.compression),
+               BLOCK_STORE_PATH="", PREFETCH_MAX_BYTES="0", RUN_PRODUCTION="False")
+    # Shuffled so the blocks are not fetched ahead of the requests
+    heights = list(range(args.start, args.start + args.count))
+    random.shuffle(heights)
+
+    print(f"{'run':<6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for run in ("cold", "warm"):
+        process = start_api(args.app, args.port, env)
+        try:
+            latencies = fetch_blocks(args.port, heights)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{run:<6} {percentile(latencies, 0.5) * 1000:>9.2f} {percentile(latencies, 0.9) * 1000:>9.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.2f} {latencies[-1] * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Verus Network Data API - concurrency benchmark
+# Sends the same request to a running API from an increasing number of concurrent clients
+# and prints the throughput and latency for every concurrency level. A server that handles
+# requests cooperatively scales with the concurrency until the RPC becomes the bottleneck,
+# a server that handles one request at a time stays at the same throughput.
+#
+# Usage: python benchmarks/concurrency.py --url http://127.0.0.1:5500 --path /block --body '{"block_identifier": {"index": 100}}'
+
+
+# Module imports.
+import argparse
+import json
+import statistics
+import threading
+import time
+import requests
+
+
+# Helps to read a percentile from a sorted list of latencies.
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+# Sends `total` requests from `concurrency` threads, every thread keeps its own keep-alive connection.
+def run_level(url, body, concurrency, total):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                response = session.post(url, data=body, headers={"content-type": "application/json"})
+                failed = response.status_code != 200
+            except requests.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if failed:
+                    errors[0] += 1
+        session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors[0],
+        "throughput": total / duration if duration else 0.0,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95": percentile(latencies, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency benchmark of the Verus Rosetta API")
+    parser.add_argument("--url", default="http://127.0.0.1:5500", help="base url of the running API")
+    parser.add_argument("--path", default="/network/list", help="endpoint to request")
+    parser.add_argument("--body", default="{}", help="JSON body of the request")
+    parser.add_argument("--requests", type=int, default=200, help="number of requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64", help="comma separated concurrency levels")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/") + args.path
+    body = json.dumps(json.loads(args.body))
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"POST {url} {body}")
+    print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'scaling':>8}")
+    baseline = None
+    for level in levels:
+        result = run_level(url, body, level, max(args.requests, level))
+        if baseline is None:
+            baseline = result["throughput"] or 1.0
+        print(f"{result['concurrency']:>8} {result['requests']:>9} {result['errors']:>7} {result['throughput']:>9.1f} "
+              f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['throughput'] / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Verus Network Data API - JSON encoding benchmark
+# Compares the json module with the encoder of rosettaapi_json (orjson when it is installed) on
+# the payloads the API handles most: the getblock verbosity 2 response of a large block and the
+# /block response built from it, and the getrawmempool response of a large mempool and the
+# /mempool response built from it. Decoding is measured on the RPC responses, encoding on both.
+#
+# Usage: python benchmarks/json_encoding.py --transactions 2000 --mempool 50000
+
+
+# Module imports.
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rosettaapi_json
+from rosettaapi_builders import block_response_chunks
+
+
+# Helps to build a txid.
+def txid(seed):
+    return hashlib.sha256(str(seed).encode()).hexdigest()
+
+
+# Builds a getblock verbosity 2 result with `count` transactions of two inputs and three outputs.
+def large_block(count):
+    transactions = []
+    for index in range(count):
+        transactions.append({
+            "txid": txid(index),
+            "version": 4,
+            "locktime": 0,
+            "vin": [{"coinbase": "03a0b12c"}] if index == 0 else [
+                {"txid": txid(f"in{index}-{n}"), "vout": n, "address": f"RAddressOfTheInput{index}x{n}",
+                 "value": 1.5, "valueSat": 150000000, "scriptSig": {"asm": "3045" * 18, "hex": "47" * 72}, "sequence": 4294967295}
+                for n in range(2)
+            ],
+            "vout": [
+                {"value": 0.99, "valueSat": 99000000, "n": n, "scriptPubKey": {
+                    "asm": "OP_DUP OP_HASH160 " + "ab" * 20 + " OP_EQUALVERIFY OP_CHECKSIG", "hex": "76a914" + "ab" * 20 + "88ac",
+                    "reqSigs": 1, "type": "pubkeyhash", "addresses": [f"RAddressOfTheOutput{index}x{n}"]}}
+                for n in range(3)
+            ]
+        })
+    return {"hash": txid("block"), "confirmations": 200, "size": count * 400, "height": 3000000, "version": 4,
+            "merkleroot": txid("merkle"), "time": 1707138632, "blocktype": "minted", "previousblockhash": txid("parent"),
+            "chainwork": "00" * 32, "tx": transactions}
+
+
+# Helps to time a function, returns the best time of `repeat` runs in milliseconds.
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Encodes with the json module the way the APIs used to.
+def json_dumps(value):
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON encoding benchmark of the Verus Rosetta API")
+    parser.add_argument("--transactions", type=int, default=2000, help="number of transactions of the large block")
+    parser.add_argument("--mempool", type=int, default=50000, help="number of transactions of the large mempool")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    block = large_block(args.transactions)
+    block_rpc = json_dumps({"result": block, "error": None, "id": 0})
+    block_response = json.loads(b"".join(block_response_chunks(3000000, block["hash"], 2999999, block["previousblockhash"],
+                                                                 block["time"], block["tx"], "confirmed", True, block["blocktype"])))
+    mempool = [txid(f"mempool{index}") for index in range(args.mempool)]
+    mempool_rpc = json_dumps({"result": mempool, "error": None, "id": 0})
+    mempool_response = {"transaction_identifiers": [{"hash": mempool}]}
+
+    cases = [
+        ("decode getblock 2", len(block_rpc), lambda: json.loads(block_rpc), lambda: rosettaapi_json.loads(block_rpc)),
+        ("encode /block", len(json_dumps(block_response)), lambda: json_dumps(block_response), lambda: rosettaapi_json.dumps(block_response)),
+        ("decode getrawmempool", len(mempool_rpc), lambda: json.loads(mempool_rpc), lambda: rosettaapi_json.loads(mempool_rpc)),
+        ("encode /mempool", len(json_dumps(mempool_response)), lambda: json_dumps(mempool_response), lambda: rosettaapi_json.dumps(mempool_response)),
+    ]
+    print(f"rosettaapi_json backend: {rosettaapi_json.backend()}")
+    print(f"{'case':<22} {'bytes':>11} {'json ms':>9} {rosettaapi_json.backend() + ' ms':>10} {'speedup':>8}")
+    for name, size, baseline, fast in cases:
+        baseline_ms = best_time(baseline, args.repeat)
+        fast_ms = best_time(fast, args.repeat)
+        print(f"{name:<22} {size:>11} {baseline_ms:>9.2f} {fast_ms:>10.2f} {baseline_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+# Verus Network Data API - historical backfill
+# Fills the local block store (BLOCK_STORE_PATH) with a range of confirmed blocks, so a Rosetta
+# client that syncs from genesis is answered from disk instead of making millions of /block
+# calls that each cost several RPC round trips.
+# Blocks are fetched with their transaction bodies (getblock verbosity 2) in JSON-RPC batches by several
+# threads, turned into the /block and /block/transaction responses in a process pool and written in bulk
+# transactions.
+# The last written height is checkpointed in the store, an interrupted backfill resumes from there.
+#
+# Usage: python rosettaapi_backfill.py [--start 0] [--end 100000] [--fetchers 4] [--converters 2]
+
+
+# Module imports.
+import argparse
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+from rosettaapi_builders import block_response_body, block_transaction_responses, encode_response
+from rosettaapi_rpc import RPCTransport, env_flag, env_int
+from rosettaapi_store import BlockStore
+
+
+# Default backfill settings, used when the env variables or arguments are not set.
+DEFAULT_BACKFILL_FETCHERS = 4
+DEFAULT_BACKFILL_CONVERTERS = 2
+DEFAULT_BACKFILL_BATCH = 50
+DEFAULT_BACKFILL_MAX_BATCH = 1000
+DEFAULT_BACKFILL_TARGET_LATENCY = 2.0
+DEFAULT_BACKFILL_RETRIES = 5
+
+# Name of the checkpoint the backfill keeps in the block store.
+CHECKPOINT_NAME = "backfill"
+
+# Headers of the RPC requests, the same ones the APIs send.
+RPC_HEADERS = {'content-type': 'text/plain;'}
+
+
+# Builds the encoded store rows of a fetched batch, runs in a worker process of the conversion pool.
+# blocks are getblock verbosity 2 results in height order.
+# Returns the block rows (height, hash, body) and the transaction rows (txid, height, body) for BlockStore.put_many().
+def convert_blocks(blocks, chainid, block_production, transaction_production):
+    block_rows = []
+    transaction_rows = []
+    for block in blocks:
+        height = block["height"]
+        # Same body as the /block endpoint streams for the same RPC response
+        block_rows.append((height, block["hash"], block_response_body(block, block_production)))
+        for txid, response in block_transaction_responses(block, chainid, transaction_production):
+            transaction_rows.append((str(txid), height, encode_response(response)))
+    return block_rows, transaction_rows
+
+
+# Ingests a height range into the block store.
+# Up to `fetchers` batches are fetched at the same time, every batch is a single JSON-RPC batch of verbose
+# getblock calls. The batch size adapts to the node: it doubles while a batch takes less than half of
+# target_latency seconds and halves when it takes longer than target_latency or fails.
+# Converted batches are written strictly in height order, so the checkpoint is always the end of a contiguous range.
+class Backfill:
+    def __init__(self, transport, store, chainid, fetchers=DEFAULT_BACKFILL_FETCHERS, converters=DEFAULT_BACKFILL_CONVERTERS,
+                 batch_size=DEFAULT_BACKFILL_BATCH, max_batch=DEFAULT_BACKFILL_MAX_BATCH,
+                 target_latency=DEFAULT_BACKFILL_TARGET_LATENCY, retries=DEFAULT_BACKFILL_RETRIES,
+                 block_production=False, transaction_production=False, report_interval=5):
+        self.transport = transport
+        self.store = store
+        self.chainid = chainid
+        self.fetchers = max(1, fetchers)
+        self.converters = converters
+        self.batch_size = max(1, batch_size)
+        self.max_batch = max(self.batch_size, max_batch)
+        self.target_latency = target_latency
+        self.retries = retries
+        self.block_production = block_production
+        self.transaction_production = transaction_production
+        self.report_interval = report_interval
+        self.lock = threading.Lock()
+        self.start_height = None
+        self.end_height = None
+        self.written_height = None
+        self.blocks = 0
+        self.transactions = 0
+        self.rpc_errors = 0
+        self.started_at = None
+        self.reported_at = 0.0
+
+    # Helps to send a batch of RPC calls and return their results, raises on any RPC error.
+    def call(self, calls):
+        results = []
+        for response in self.transport.batch(None, RPC_HEADERS, calls):
+            if response is None or response.get("error"):
+                raise Exception(f"RPC error: {response.get('error') if response else 'no response'}")
+            results.append(response["result"])
+        return results
+
+    # Fetches the blocks of a height range with the bodies of their transactions.
+    def fetch_range(self, start, end):
+        return self.call([("getblock", [f"{height}", 2]) for height in range(start, end + 1)])
+
+    # Fetches a height range, a failed fetch is split into two halves that are fetched on their own.
+    # A single block is retried after a backoff, `attempt` counts the retries and splits of the range.
+    def fetch(self, start, end, attempt=0):
+        began = time.monotonic()
+        try:
+            blocks = self.fetch_range(start, end)
+        except Exception as e:
+            with self.lock:
+                self.rpc_errors += 1
+                self.batch_size = max(1, self.batch_size // 2)
+            if attempt == self.retries:
+                raise
+            if start < end:
+                middle = (start + end) // 2
+                print(f"Failed to fetch blocks {start}-{end}, retrying as {start}-{middle} and {middle + 1}-{end}: {e}")
+                return self.fetch(start, middle, attempt + 1) + self.fetch(middle + 1, end, attempt + 1)
+            print(f"Failed to fetch block {start}, retrying: {e}")
+            time.sleep(min(2 ** attempt, 30))
+            return self.fetch(start, end, attempt + 1)
+        self.adapt(end - start + 1, time.monotonic() - began)
+        return blocks
+
+    # Adapts the batch size to the time the node took for a batch of `count` blocks.
+    def adapt(self, count, elapsed):
+        with self.lock:
+            if count < self.batch_size:
+                return
+            if elapsed > self.target_latency:
+                self.batch_size = max(1, self.batch_size // 2)
+            elif elapsed < self.target_latency / 2:
+                self.batch_size = min(self.max_batch, self.batch_size * 2)
+
+    # Converts a fetched batch in the conversion pool, or in this process when no pool is used.
+    def convert(self, pool, blocks):
+        arguments = (blocks, self.chainid, self.block_production, self.transaction_production)
+        if pool is None:
+            return None, convert_blocks(*arguments)
+        return pool.submit(convert_blocks, *arguments), None
+
+    # Writes a converted batch and moves the checkpoint to its last height.
+    def write(self, end, rows):
+        block_rows, transaction_rows = rows
+        self.store.put_many(block_rows, transaction_rows, checkpoint=(CHECKPOINT_NAME, end))
+        self.written_height = end
+        self.blocks += len(block_rows)
+        self.transactions += len(transaction_rows)
+        self.report()
+
+    # Prints the progress at most every report_interval seconds, or always when force is True.
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.reported_at < self.report_interval:
+            return
+        self.reported_at = now
+        stats = self.stats()
+        print(f"Backfilled up to {stats['height']} of {stats['end']} ({stats['progress']:.2%}), "
+              f"{stats['blocks_per_second']:.1f} blocks/s, {stats['transactions']} transactions, "
+              f"batch size {stats['batch_size']}, eta {stats['eta']}s")
+
+    # Ingests the blocks from start to end (both included), returns the last written height.
+    def run(self, start, end):
+        self.start_height = start
+        self.end_height = end
+        self.started_at = time.monotonic()
+        if start > end:
+            return self.written_height
+        pool = ProcessPoolExecutor(self.converters) if self.converters > 0 else None
+        fetches = deque()
+        conversions = deque()
+        height = start
+        try:
+            with ThreadPoolExecutor(self.fetchers, thread_name_prefix="backfill-fetch") as fetchpool:
+                while height <= end or fetches or conversions:
+                    # Keep every fetcher busy with the next ranges
+                    while height <= end and len(fetches) < self.fetchers:
+                        last = min(end, height + self.batch_size - 1)
+                        fetches.append((last, fetchpool.submit(self.fetch, height, last)))
+                        height = last + 1
+                    # Hand the oldest range to the conversion pool as soon as it is fetched
+                    if fetches:
+                        last, future = fetches.popleft()
+                        conversions.append((last,) + self.convert(pool, future.result()))
+                    # Write the converted ranges in order, wait for the oldest one when the pool is full or nothing is left to fetch
+                    while conversions and (conversions[0][1] is None or conversions[0][1].done()
+                                           or len(conversions) > max(1, self.converters) or not fetches):
+                        last, future, rows = conversions.popleft()
+                        self.write(last, rows if future is None else future.result())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self.report(force=True)
+        return self.written_height
+
+    # Returns the progress and throughput of the backfill.
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        total = self.end_height - self.start_height + 1 if self.end_height is not None else 0
+        rate = self.blocks / elapsed if elapsed else 0.0
+        remaining = total - self.blocks
+        return {
+            "start": self.start_height,
+            "end": self.end_height,
+            "height": self.written_height,
+            "blocks": self.blocks,
+            "transactions": self.transactions,
+            "progress": self.blocks / total if total else 1.0,
+            "blocks_per_second": round(rate, 2),
+            "eta": round(remaining / rate) if rate else None,
+            "batch_size": self.batch_size,
+            "rpc_errors": self.rpc_errors,
+        }
+
+
+def main():
+    load_dotenv(find_dotenv())
+    run_production = env_flag(os.environ.get("RUN_PRODUCTION"))
+    parser = argparse.ArgumentParser(description="Backfill the block store of the Verus Rosetta API")
+    parser.add_argument("--store", default=os.environ.get("BLOCK_STORE_PATH"), help="block store file (BLOCK_STORE_PATH)")
+    parser.add_argument("--start", type=int, default=None, help="first height, defaults to the height after the checkpoint")
+    parser.add_argument("--end", type=int, default=None, help="last height, defaults to the last block with enough confirmations")
+    parser.add_argument("--fetchers", type=int, default=env_int(os.environ.get("BACKFILL_FETCHERS"), DEFAULT_BACKFILL_FETCHERS),
+                        help="number of concurrent RPC fetchers")
+    parser.add_argument("--converters", type=int, default=env_int(os.environ.get("BACKFILL_CONVERTERS"), DEFAULT_BACKFILL_CONVERTERS),
+                        help="number of conversion processes, 0 converts in the main process")
+    parser.add_argument("--batch", type=int, default=env_int(os.environ.get("BACKFILL_BATCH"), DEFAULT_BACKFILL_BATCH),
+                        help="initial number of blocks per RPC batch")
+    parser.add_argument("--max-batch", type=int, default=env_int(os.environ.get("BACKFILL_MAX_BATCH"), DEFAULT_BACKFILL_MAX_BATCH),
+                        help="largest number of blocks per RPC batch")
+    args = parser.parse_args()
+    if not args.store:
+        parser.error("set BLOCK_STORE_PATH or pass --store")
+
+    store = BlockStore(args.store, confirmations=env_int(os.environ.get("BLOCK_STORE_CONFIRMATIONS"), 101))
+    transport = RPCTransport(os.environ.get("RPCURL"), os.environ.get("RPCUSER"), os.environ.get("RPCPASS"),
+                             pool_maxsize=max(1, args.fetchers))
+    blockchain_info = transport.batch(None, RPC_HEADERS, [("getblockchaininfo", [])])[0]["result"]
+
+    # Only blocks that can no longer be replaced by a reorg are stored
+    end = blockchain_info["blocks"] - store.confirmations + 1
+    if args.end is not None:
+        end = min(end, args.end)
+    start = args.start
+    if start is None:
+        checkpoint = store.checkpoint(CHECKPOINT_NAME)
+        start = checkpoint + 1 if checkpoint is not None else 0
+        if checkpoint is not None:
+            print(f"Resuming the backfill after the checkpoint at height {checkpoint}")
+
+    # RUN_PRODUCTION is read with the same helper as the APIs, so the stored bodies match the ones they serve
+    backfill = Backfill(transport, store, blockchain_info["chainid"], fetchers=args.fetchers, converters=args.converters,
+                        batch_size=args.batch, max_batch=args.max_batch,
+                        block_production=run_production, transaction_production=run_production)
+    print(f"Backfilling blocks {start} to {end} into {args.store}")
+    try:
+        backfill.run(start, end)
+    except KeyboardInterrupt:
+        print(f"Backfill interrupted, it resumes after height {backfill.written_height} on the next run")
+    finally:
+        transport.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+# Verus Network Data API - Rosetta response builders
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Turns the RPC data of a block or a transaction into the /block and /block/transaction
+# responses. The functions only take plain values, so the same responses can be built by
+# the endpoints and ahead of time for the local block store.
+
+
+# Module imports.
+from rosettaapi_json import dumps
+
+
+# Size in bytes of the chunks a streamed /block response is sent in.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Size cap in bytes of a streamed response that is kept to be stored or cached, bigger responses are only streamed.
+DEFAULT_TEE_MAX_BYTES = 16 * 1024 * 1024
+
+# Currency of every amount.
+VRSC_CURRENCY = {
+    "symbol": "VRSC",
+    "decimals": 8,
+    "metadata": None
+}
+
+# Operation types of the outputs of a coinbase transaction, taken from the block type.
+COINBASE_OPERATION_TYPES = {"mined", "minted"}
+
+
+# Helps to encode a response the way it is stored and served.
+def encode_response(response):
+    return dumps(response)
+
+
+# Helps to tell the operation status of a block from its confirmations.
+def block_status(confirmations):
+    return "confirmed" if int(confirmations) > 15 else "unconfirmed"
+
+
+# Helps to tell the operation status of a transaction from its confirmations.
+def transaction_status(confirmations):
+    return "confirmed" if confirmations > 100 else "unconfirmed"
+
+
+# Returns the txid, amount and address of the operation of a verbose transaction.
+def transaction_values(transaction, production):
+    txid = transaction["txid"]
+    vouts = transaction.get("vout") or []
+    if production:
+        # A fully shielded transaction has no transparent output, its value is reported as 0
+        value = vouts[0].get("valueSat", 0) if vouts else 0
+    else:
+        value = "00000000"
+    try:
+        address = transaction["vout"][0]["scriptPubKey"]["addresses"]
+    except Exception:
+        address = "RJJBTXXfgE5DjiPQpZSnYrQe73NhrBZ3ao"
+    return txid, value, address
+
+
+# Builds the /block/transaction responses of every transaction of a getblock verbosity 2 result.
+# Yields (txid, response) tuples one at a time, the transactions share the confirmations of their block.
+def block_transaction_responses(block, chainid, production):
+    status = transaction_status(block["confirmations"])
+    for transaction in block.get("tx") or []:
+        if isinstance(transaction, dict):
+            txid, value, address = transaction_values(transaction, production)
+            yield txid, transaction_response(txid, status, address, value, chainid)
+
+
+# Returns the amount value of an operation, amounts are only reported in production mode and spent coins are negative.
+def operation_value(value_sat, production, spent=False):
+    if not production:
+        return "00000000"
+    return f"-{value_sat}" if spent and value_sat else f"{value_sat}"
+
+
+# Builds the operations of a verbose transaction: one coin_spent operation per transparent input and one
+# coin_created operation per output with an address. Inputs are only described when the node reports their
+# address and value (-insightexplorer), the outputs of a coinbase transaction get the type of their block.
+def transaction_operations(transaction, status, production, coinbase_type="Transfer"):
+    operations = []
+    coinbase = False
+    for network_index, vin in enumerate(transaction.get("vin") or []):
+        if "coinbase" in vin:
+            coinbase = True
+            continue
+        if "txid" not in vin or "address" not in vin:
+            continue
+        operations.append({
+            "operation_identifier": {
+                "index": len(operations),
+                "network_index": network_index
+            },
+            "type": "Transfer",
+            "status": status,
+            "account": {
+                "address": vin["address"],
+                "metadata": None
+            },
+            "amount": {
+                "value": operation_value(vin.get("valueSat", 0), production, spent=True),
+                "currency": VRSC_CURRENCY,
+                "metadata": None
+            },
+            "coin_change": {
+                "coin_identifier": {
+                    "identifier": f"{vin['txid']}:{vin['vout']}"
+                },
+                "coin_action": "coin_spent"
+            },
+            "metadata": None
+        })
+    for vout in transaction.get("vout") or []:
+        addresses = (vout.get("scriptPubKey") or {}).get("addresses")
+        if not addresses:
+            continue
+        operations.append({
+            "operation_identifier": {
+                "index": len(operations),
+                "network_index": vout["n"]
+            },
+            "type": coinbase_type if coinbase else "Transfer",
+            "status": status,
+            "account": {
+                "address": addresses[0],
+                "metadata": None
+            },
+            "amount": {
+                "value": operation_value(vout.get("valueSat", 0), production),
+                "currency": VRSC_CURRENCY,
+                "metadata": None
+            },
+            "coin_change": {
+                "coin_identifier": {
+                    "identifier": f"{transaction['txid']}:{vout['n']}"
+                },
+                "coin_action": "coin_created"
+            },
+            "metadata": None
+        })
+    return operations
+
+
+# Builds a transaction of the /block response from a verbose transaction.
+def block_transaction(transaction, status, production, coinbase_type="Transfer"):
+    return {
+        "transaction_identifier": {
+            "hash": transaction["txid"]
+        },
+        "operations": transaction_operations(transaction, status, production, coinbase_type),
+        "metadata": None
+    }
+
+
+# Encodes the /block response of a getblock verbosity 2 result while it walks the transactions of the block.
+# Yields chunks of about chunk_size bytes, only one encoded transaction is held at a time on top of the
+# current chunk, so the memory does not grow with the size of the block.
+def block_response_chunks(index, block_hash, parent_index, parent_hash, timestamp, transactions, status, production,
+                          blocktype=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    coinbase_type = blocktype if blocktype in COINBASE_OPERATION_TYPES else "Transfer"
+    chunk = bytearray(b'{"block":{"block_identifier":')
+    chunk += encode_response({"index": index, "hash": block_hash})
+    chunk += b',"parent_block_identifier":'
+    chunk += encode_response({"index": parent_index, "hash": parent_hash})
+    chunk += b',"timestamp":' + encode_response(timestamp) + b',"transactions":['
+    first = True
+    for transaction in transactions:
+        if not isinstance(transaction, dict):
+            continue
+        if not first:
+            chunk += b","
+        first = False
+        chunk += encode_response(block_transaction(transaction, status, production, coinbase_type))
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b'],"metadata":null}}'
+    yield bytes(chunk)
+
+
+# Builds the whole /block response of a getblock verbosity 2 result requested by its height.
+def block_response_body(block, production):
+    height = block["height"]
+    # The genesis block is its own parent
+    parent_hash = block.get("previousblockhash", block["hash"])
+    return b"".join(block_response_chunks(height, block["hash"], max(height - 1, 0), parent_hash, block["time"],
+                                          block.get("tx") or [], block_status(block["confirmations"]), production,
+                                          block.get("blocktype")))
+
+
+# Passes the chunks of a streamed response through and calls consume with the whole body once the last chunk was sent.
+# The body is kept once however many places it goes to, a body over max_bytes is only streamed and consume is not called.
+# Nothing is consumed when the stream is not read to the end.
+def tee_chunks(chunks, consume, max_bytes=DEFAULT_TEE_MAX_BYTES):
+    body, size = [], 0
+    for chunk in chunks:
+        if body is not None:
+            size += len(chunk)
+            if size > max_bytes:
+                body = None
+            else:
+                body.append(chunk)
+        yield chunk
+    if body is not None:
+        consume(b"".join(body))
+
+
+# Builds the /block/transaction response.
+def transaction_response(txid, status, address, value, chainid):
+    return {
+        "transaction": {
+            "transaction_identifier": {
+                "hash": str(txid)
+            },
+            "operations": [
+                {
+                    "operation_identifier": {
+                        "index": 0,
+                        "network_index": 0
+                    },
+                    "related_operations": [
+                        {
+                            "index": -3,
+                            "network_index": 0
+                        }
+                    ],
+                    "type": "Transfer",
+                    "status": status,
+                    "account": {
+                        "address": str(address),
+                        "sub_account": {
+                            "address": str(address),
+                            "metadata": None
+                        },
+                        "metadata": None
+                    },
+                    "amount": {
+                        "value": f"{value}0",
+                        "currency": {
+                            "symbol": "VRSC",
+                            "decimals": 8,
+                            "metadata": None
+                        },
+                        "metadata": None
+                    },
+                    "coin_change": {
+                        "coin_identifier": {
+                            "identifier": f"{txid}:0"
+                        },
+                        "coin_action": "coin_spent"
+                    },
+                    "metadata": None
+                }
+            ],
+            "related_transactions": [
+                {
+                    "network_identifier": {
+                        "blockchain": "VRSC",
+                        "network": chainid,
+                        "sub_network_identifier": {
+                            "network": chainid,
+                            "metadata": None
+                        }
+                    },
+                    "transaction_identifier": {
+                        "hash": str(txid)
+                    },
+                    "direction": "forward"
+                }
+            ],
+            "metadata": None
+        }
+    }
@@ -0,0 +1,416 @@
+# Verus Network Data API - in-memory caches
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Blocks and transactions buried deeper than a confirmation depth never change, so they
+# are kept in bounded LRU caches instead of being fetched from the RPC again on every request.
+
+
+# Module imports.
+import gzip
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from rosettaapi_json import dumps, loads
+from rosettaapi_responses import make_etag
+
+
+# Default cache settings, used when the env variables are not set.
+DEFAULT_BLOCK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BLOCK_CACHE_CONFIRMATIONS = 100
+DEFAULT_BLOCK_CACHE_TIP_TTL = 5
+DEFAULT_TX_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TX_CACHE_CONFIRMATIONS = 101
+DEFAULT_TX_CACHE_NEGATIVE_TTL = 30
+DEFAULT_RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_RESPONSE_CACHE_CONFIRMATIONS = 100
+DEFAULT_RESPONSE_CACHE_GZIP = 0
+
+# Smallest encoded response that gets a gzip variant, smaller bodies do not shrink enough to be worth it.
+GZIP_MIN_SIZE = 1024
+
+# Error message verusd returns for a transaction it does not know about.
+TX_NOT_FOUND_MESSAGE = "No information available"
+
+
+# Helps to estimate how many bytes a cached RPC result takes.
+def entry_size(value):
+    return len(dumps(value))
+
+
+# Encoded response body with its strong ETag, gzip_body is its gzip variant or None.
+EncodedResponse = namedtuple("EncodedResponse", ["body", "etag", "gzip_body", "gzip_etag", "height"])
+
+
+# Least recently used cache bounded by the estimated size of its entries in bytes.
+# Entries stored with a ttl expire after that many seconds, entries without one
+# stay until they are evicted.
+# With a disk cache (rosettaapi_diskcache.DiskCache) the entries without a ttl are also written to
+# disk under `namespace`, and a key that is not in memory is looked up on disk before it is a miss.
+class LRUCache:
+    def __init__(self, max_bytes, disk=None, namespace=""):
+        self.max_bytes = max_bytes
+        self.disk = disk if disk is not None and disk.enabled() else None
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the cached value of a key or None.
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        return self.load(key)
+
+    # Returns the value of a key from the disk cache or None, the value is kept in memory again.
+    def load(self, key):
+        if self.disk is None:
+            return None
+        found = self.disk.get(self.namespace + key)
+        if found is None:
+            return None
+        key = found[0][len(self.namespace):]
+        value = self.deserialize(found[1])
+        self.remember(key, value, size=len(found[1]))
+        self.restored(key, value)
+        return value
+
+    # Stores a value, ttl is the number of seconds the value stays valid (None keeps it until evicted).
+    # Values without a ttl also go to the disk cache, aliases are other keys that lead to the value there.
+    def put(self, key, value, ttl=None, size=None, aliases=()):
+        if ttl is None and self.disk is not None:
+            data = self.serialize(value)
+            self.disk.put(self.namespace + key, data, [self.namespace + alias for alias in aliases], self.height_of(value))
+            if size is None:
+                size = len(data)
+        self.remember(key, value, ttl, size)
+
+    # Stores a value in memory only.
+    def remember(self, key, value, ttl=None, size=None):
+        if size is None:
+            size = entry_size(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    # Removes a key from the cache.
+    def discard(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    # Removes every entry from the cache.
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._remove(key)
+
+    # Removes every entry of a block from `height` up, called when the node switched to another chain.
+    # Returns the number of removed entries, the disk cache is rolled back on its own.
+    def rollback(self, height):
+        with self.lock:
+            stale = [key for key, entry in self.entries.items() if (self.height_of(entry[0]) or -1) >= height]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    # Removes an entry, the lock must be held by the caller.
+    def _remove(self, key):
+        value, size, expires = self.entries.pop(key)
+        self.bytes -= size
+        self.removed(key, value)
+
+    # Called for every removed entry, lets subclasses keep their secondary indexes in sync.
+    def removed(self, key, value):
+        pass
+
+    # Called for every entry loaded from the disk cache, lets subclasses keep their secondary indexes in sync.
+    def restored(self, key, value):
+        pass
+
+    # Returns the block height a value belongs to or None, lets rollback() find the entries of replaced blocks.
+    def height_of(self, value):
+        return None
+
+    # Helps to encode a value for the disk cache.
+    def serialize(self, value):
+        return dumps(value)
+
+    # Helps to decode a value of the disk cache.
+    def deserialize(self, data):
+        return loads(data)
+
+    # Returns the hit/miss counters and the size of the cache.
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Cache of getblock results keyed by both block hash and block height.
+# Blocks fetched with transaction bodies (verbosity 2) are kept apart from the ones with txids only.
+# Blocks with at least `confirmations` confirmations are kept until evicted, blocks
+# near the tip are kept for `tip_ttl` seconds (or not at all when tip_ttl is 0)
+# because a reorg can still replace them.
+class BlockCache(LRUCache):
+    def __init__(self, max_bytes=DEFAULT_BLOCK_CACHE_MAX_BYTES, confirmations=DEFAULT_BLOCK_CACHE_CONFIRMATIONS,
+                 tip_ttl=DEFAULT_BLOCK_CACHE_TIP_TTL, disk=None):
+        super().__init__(max_bytes, disk, "block:")
+        self.confirmations = confirmations
+        self.tip_ttl = tip_ttl
+        self.heights = {}
+        self.tip_hashes = set()
+
+    # Helps to tell a block height from a block hash.
+    @staticmethod
+    def is_height(identifier):
+        identifier = str(identifier)
+        return identifier.isdigit() and len(identifier) < 64
+
+    # Helps to build the cache key of a block hash, blocks with txids only are keyed by their hash.
+    @staticmethod
+    def block_key(block_hash, verbosity=1):
+        return block_hash if verbosity == 1 else f"{block_hash}:{verbosity}"
+
+    # Helps to read the verbosity back from a cache key.
+    @staticmethod
+    def key_verbosity(key):
+        return int(key.rsplit(":", 1)[1]) if ":" in key else 1
+
+    # Helps to read the verbosity of a getblock call, returns None for calls the cache does not handle.
+    @staticmethod
+    def call_verbosity(method, params):
+        if method != "getblock" or not params or len(params) > 2:
+            return None
+        verbosity = params[1] if len(params) == 2 else 1
+        return verbosity if verbosity in (1, 2) else None
+
+    # Returns the cached block of a block hash or block height or None.
+    def get(self, identifier, verbosity=1):
+        key = str(identifier)
+        if self.is_height(key):
+            # A height that is not in memory is looked up through its alias on disk
+            key = self.heights.get((int(key), verbosity)) or f"height:{key}:{verbosity}"
+        else:
+            key = self.block_key(key, verbosity)
+        return super().get(key)
+
+    # Stores a getblock result, blocks that are not final enough are stored with the tip ttl or skipped.
+    def put(self, block, verbosity=1):
+        if not isinstance(block, dict) or "hash" not in block:
+            return
+        confirmations = block.get("confirmations", 0)
+        if confirmations >= self.confirmations:
+            ttl = None
+        elif confirmations > 0 and self.tip_ttl > 0:
+            ttl = self.tip_ttl
+        else:
+            return
+        key = self.block_key(block["hash"], verbosity)
+        super().put(key, block, ttl, aliases=[f"height:{block['height']}:{verbosity}"])
+        self.index(key, block, ttl)
+
+    # Helps to add a cached block to the height index.
+    def index(self, key, block, ttl=None):
+        with self.lock:
+            if key in self.entries:
+                self.heights[(block["height"], self.key_verbosity(key))] = key
+                if ttl is not None:
+                    self.tip_hashes.add(key)
+
+    # Keeps the height index in sync with the blocks loaded from disk.
+    def restored(self, key, value):
+        self.index(key, value)
+
+    # Keeps the height index in sync with the cached blocks.
+    def removed(self, key, value):
+        height = (value["height"], self.key_verbosity(key))
+        if self.heights.get(height) == key:
+            del self.heights[height]
+        self.tip_hashes.discard(key)
+
+    # Returns the height of a cached block.
+    def height_of(self, value):
+        return value.get("height")
+
+    # Removes every block that was cached with the tip ttl, called when a new block arrives.
+    def invalidate_tip(self):
+        with self.lock:
+            for key in list(self.tip_hashes):
+                if key in self.entries:
+                    self._remove(key)
+            self.tip_hashes.clear()
+
+    # Helps to serve the getblock calls of a batch from the cache.
+    # Returns one entry per call, the response for a cached block or None when it has to be fetched.
+    def lookup_calls(self, calls):
+        responses = []
+        for index, (method, params) in enumerate(calls):
+            block = None
+            verbosity = self.call_verbosity(method, params)
+            if verbosity is not None:
+                block = self.get(params[0], verbosity)
+            responses.append({"result": block, "error": None, "id": index} if block is not None else None)
+        return responses
+
+    # Helps to store the getblock results of a batch in the cache.
+    def store_calls(self, calls, responses):
+        for (method, params), response in zip(calls, responses):
+            verbosity = self.call_verbosity(method, params)
+            if verbosity is not None and response and response.get("result"):
+                self.put(response["result"], verbosity)
+
+
+# Cache of verbose getrawtransaction results keyed by txid.
+# Transactions with at least `confirmations` confirmations are kept until evicted.
+# "No information available" errors are cached for `negative_ttl` seconds so unknown
+# txids that clients keep asking for do not reach the RPC every time.
+class TransactionCache(LRUCache):
+    def __init__(self, max_bytes=DEFAULT_TX_CACHE_MAX_BYTES, confirmations=DEFAULT_TX_CACHE_CONFIRMATIONS,
+                 negative_ttl=DEFAULT_TX_CACHE_NEGATIVE_TTL, disk=None):
+        super().__init__(max_bytes, disk, "tx:")
+        self.confirmations = confirmations
+        self.negative_ttl = negative_ttl
+
+    # Returns the cached RPC response of a txid or None.
+    def response(self, txid):
+        entry = self.get(str(txid))
+        if entry is None:
+            return None
+        if isinstance(entry, dict) and "txid" in entry:
+            return {"result": entry, "error": None}
+        return entry
+
+    # Stores the RPC response of a txid if it is final enough or a "No information available" error.
+    def store(self, txid, response_json):
+        result = response_json.get("result")
+        error = response_json.get("error")
+        if isinstance(result, dict) and result.get("confirmations", 0) >= self.confirmations:
+            self.put(str(txid), result)
+        elif error and TX_NOT_FOUND_MESSAGE in str(error.get("message", "")) and self.negative_ttl > 0:
+            self.put(str(txid), {"result": None, "error": error}, ttl=self.negative_ttl)
+
+    # Returns the height of the block of a cached transaction, None for the cached errors.
+    def height_of(self, value):
+        return value.get("height") if "txid" in value else None
+
+    # Forgets a cached "No information available" error, called when the node announces the txid.
+    def forget_missing(self, txid):
+        with self.lock:
+            entry = self.entries.get(str(txid))
+            if entry is not None and entry[2] is not None:
+                self._remove(str(txid))
+
+
+# Cache of the encoded /block and /block/transaction responses of final blocks and transactions.
+# Blocks are keyed by block hash and block height, transactions by txid. Every entry keeps the
+# body exactly as it is sent with its strong ETag, and a gzip variant when gzip_level is set,
+# so a repeated request costs a lookup and a write to the socket.
+class ResponseCache(LRUCache):
+    def __init__(self, max_bytes=DEFAULT_RESPONSE_CACHE_MAX_BYTES, confirmations=DEFAULT_RESPONSE_CACHE_CONFIRMATIONS,
+                 gzip_level=DEFAULT_RESPONSE_CACHE_GZIP, disk=None):
+        super().__init__(max_bytes, disk, "response:")
+        self.confirmations = confirmations
+        self.gzip_level = gzip_level
+        self.heights = {}
+
+    # Returns True when the cache is configured.
+    def enabled(self):
+        return self.max_bytes > 0
+
+    # Returns True when a response with this many confirmations never changes again.
+    def is_final(self, confirmations):
+        return self.enabled() and confirmations is not None and int(confirmations) >= self.confirmations
+
+    # Helps to build the cached entry of an encoded body, the gzip variant is compressed without a timestamp so it is stable.
+    def encode(self, body, height=None):
+        etag = make_etag(body)
+        if self.gzip_level > 0 and len(body) >= GZIP_MIN_SIZE:
+            return EncodedResponse(body, etag, gzip.compress(body, self.gzip_level, mtime=0), etag[:-1] + '-gzip"', height)
+        return EncodedResponse(body, etag, None, None, height)
+
+    # Helps to store an entry, its size is the size of the body and of the gzip variant.
+    def store(self, key, entry, aliases=()):
+        self.put(key, entry, size=len(entry.body) + len(entry.gzip_body or b""), aliases=aliases)
+        return entry
+
+    # Returns the cached /block response of a block height or block hash or None.
+    def block(self, identifier):
+        if not self.enabled():
+            return None
+        key = str(identifier)
+        if BlockCache.is_height(key):
+            # A height that is not in memory is looked up through its alias on disk
+            return self.get(self.heights.get(int(key)) or f"height:{key}")
+        return self.get(f"block:{key}")
+
+    # Caches the encoded /block response of a block, returns its entry.
+    def put_block(self, height, block_hash, body):
+        key = f"block:{block_hash}"
+        entry = self.store(key, self.encode(body, height), aliases=[f"height:{height}"])
+        self.restored(key, entry)
+        return entry
+
+    # Returns the cached /block/transaction response of a txid or None.
+    def transaction(self, txid):
+        if not self.enabled():
+            return None
+        return self.get(f"tx:{txid}")
+
+    # Caches the encoded /block/transaction response of a transaction, returns its entry.
+    def put_transaction(self, txid, body, height=None):
+        return self.store(f"tx:{txid}", self.encode(body, height))
+
+    # Keeps the height index in sync with the cached blocks.
+    def removed(self, key, value):
+        if key.startswith("block:") and self.heights.get(value.height) == key:
+            del self.heights[value.height]
+
+    # Adds a cached block to the height index, also for the blocks loaded from disk.
+    def restored(self, key, value):
+        if key.startswith("block:"):
+            with self.lock:
+                if key in self.entries:
+                    self.heights[value.height] = key
+
+    # Returns the height of the block of a cached response.
+    def height_of(self, value):
+        return value.height
+
+    # Helps to encode an entry for the disk cache: a JSON header line with the ETags, the height and the
+    # length of the body, followed by the body and the gzip variant.
+    def serialize(self, entry):
+        header = dumps([entry.etag, entry.gzip_etag, entry.height, len(entry.body)])
+        return header + b"\n" + entry.body + (entry.gzip_body or b"")
+
+    # Helps to decode an entry of the disk cache.
+    def deserialize(self, data):
+        newline = data.index(b"\n")
+        etag, gzip_etag, height, length = loads(data[:newline])
+        body = data[newline + 1:newline + 1 + length]
+        return EncodedResponse(body, etag, data[newline + 1 + length:] or None, gzip_etag, height)
@@ -0,0 +1,90 @@
+# Verus Network Data API - chain constants
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# The chain id, chain name, genesis block and node version never change for a running
+# node, so they are resolved once and only refreshed when the node restarts or its
+# version changes instead of being fetched from the RPC on every request.
+
+
+# Module imports.
+import time
+
+
+# Default number of seconds between two checks of the node version.
+DEFAULT_CHAIN_CHECK_INTERVAL = 300
+
+
+# Values of the chain that stay the same for a running node.
+# The API drives the RPC calls itself (synchronously or with await) through
+# resolve_calls()/update() and version_calls()/check_version().
+class ChainConstants:
+    def __init__(self, transport=None, check_interval=DEFAULT_CHAIN_CHECK_INTERVAL):
+        self.transport = transport
+        self.check_interval = check_interval
+        self.chain = None
+        self.name = None
+        self.chainid = None
+        self.genesis_hash = None
+        self.genesis_height = 0
+        self.node_version = None
+        self.resolved = False
+        self.errors_seen = 0
+        self.checked_at = 0.0
+        self.resolves = 0
+
+    # Returns True when the constants have to be resolved from the RPC.
+    # A failed RPC request means the node may have restarted, so the constants are resolved again.
+    def needs_resolve(self):
+        if self.transport is not None and self.transport.errors != self.errors_seen:
+            return True
+        return not self.resolved
+
+    # Returns True when it is time to check whether the node version changed.
+    def needs_version_check(self):
+        return time.monotonic() - self.checked_at >= self.check_interval
+
+    # Returns the RPC calls that resolve the constants.
+    def resolve_calls(self):
+        return [
+            ("getblockchaininfo", []),
+            ("getblockhash", [0]),
+            ("getnetworkinfo", [])
+        ]
+
+    # Stores the constants from the responses of resolve_calls().
+    def update(self, responses):
+        blockchain_info, genesis_hash, network_info = [response.get("result") for response in responses]
+        if not blockchain_info or not genesis_hash or not network_info:
+            raise Exception("Failed to resolve the chain constants from the RPC")
+        self.chain = blockchain_info["chain"]
+        self.name = blockchain_info["name"]
+        self.chainid = blockchain_info["chainid"]
+        self.genesis_hash = genesis_hash
+        self.genesis_height = 0
+        self.node_version = network_info["version"]
+        self.errors_seen = self.transport.errors if self.transport is not None else 0
+        self.checked_at = time.monotonic()
+        self.resolved = True
+        self.resolves += 1
+
+    # Returns the RPC calls that check the node version.
+    def version_calls(self):
+        return [("getnetworkinfo", [])]
+
+    # Marks the constants for resolving again when the node version changed.
+    def check_version(self, responses):
+        network_info = responses[0].get("result")
+        self.checked_at = time.monotonic()
+        if not network_info or network_info.get("version") != self.node_version:
+            self.resolved = False
+
+    # Returns the constants as a dictionary.
+    def stats(self):
+        return {
+            "chain": self.chain,
+            "name": self.name,
+            "chainid": self.chainid,
+            "genesis_hash": self.genesis_hash,
+            "genesis_height": self.genesis_height,
+            "node_version": self.node_version,
+            "resolves": self.resolves,
+        }
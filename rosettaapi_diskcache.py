@@ -0,0 +1,193 @@
+# Verus Network Data API - on-disk cache tier
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Optional SQLite file behind the in-memory block, transaction and response caches. Final
+# entries are written through to disk, so a restarted API or a new replica answers from the
+# file instead of asking the RPC again while its memory caches warm up.
+
+
+# Module imports.
+import time
+import zlib
+from rosettaapi_store import SQLiteDatabase
+
+
+# Default disk cache settings, used when the env variables are not set.
+DEFAULT_DISK_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_DISK_CACHE_COMPRESSION = 0
+DEFAULT_DISK_CACHE_READERS = 4
+
+# Number of entries evicted per query while the cache is over its size cap.
+EVICTION_BATCH = 64
+
+# Number of read entries whose last use is remembered in memory before it is written to disk.
+TOUCH_BATCH = 512
+
+# Entries keep an encoded value or the key of the entry they are an alias of (a block height points to its block hash).
+# used_at orders the entries for the least recently used eviction, size counts the stored bytes and height is the
+# height of the block the entry belongs to, so the entries of the blocks replaced by a reorg can be dropped.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    alias TEXT,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+CREATE INDEX IF NOT EXISTS entries_height ON entries (height);
+"""
+
+# Version of the schema, a cache file of another version is emptied when it is opened.
+SCHEMA_VERSION = 2
+RESET = "DROP TABLE IF EXISTS entries;"
+
+
+# Least recently used cache of encoded values in a SQLite file, bounded by max_bytes of stored data.
+# Values are compressed with zlib at `compression` level when it is set and the value shrinks.
+# Reads only remember the time of the last use in memory, it is written with the next write or
+# every TOUCH_BATCH reads, so lookups never wait for a write. A cache without a path is disabled.
+class DiskCache(SQLiteDatabase):
+    schema = SCHEMA
+    version = SCHEMA_VERSION
+    reset = RESET
+
+    def __init__(self, path=None, max_bytes=DEFAULT_DISK_CACHE_MAX_BYTES, compression=DEFAULT_DISK_CACHE_COMPRESSION,
+                 readers=DEFAULT_DISK_CACHE_READERS):
+        super().__init__(path, readers)
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.bytes = None
+        self.touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.rollbacks = 0
+
+    # Returns the key and the value of an entry or None, an alias is followed to the entry it points to.
+    def get(self, key):
+        if not self.enabled():
+            return None
+        with self.reader() as connection:
+            row = connection.execute("SELECT value, alias, compressed FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None:
+                self.touched[key] = time.time()
+                key = row[1]
+                row = connection.execute("SELECT value, alias, compressed FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched[key] = time.time()
+        if len(self.touched) >= TOUCH_BATCH:
+            self.flush()
+        return key, zlib.decompress(row[0]) if row[2] else row[0]
+
+    # Helps to write the remembered last uses, the lock must be held by the caller.
+    def _write_touches(self, writer):
+        touched, self.touched = self.touched, {}
+        if touched:
+            writer.executemany("UPDATE entries SET used_at = ? WHERE key = ?", [(used_at, key) for key, used_at in touched.items()])
+
+    # Helps to evict the least recently used entries until the cache fits max_bytes, returns the remaining size.
+    def _evict(self, writer, size):
+        while size > self.max_bytes:
+            rows = writer.execute("SELECT key, size FROM entries ORDER BY used_at LIMIT ?", (EVICTION_BATCH,)).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, row_size in rows:
+                if size <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                size -= row_size
+            writer.executemany("DELETE FROM entries WHERE key = ?", evicted)
+            self.evictions += len(evicted)
+        return size
+
+    # Stores an encoded value, aliases are other keys that lead to the same value.
+    # height is the height of the block the value belongs to or None.
+    def put(self, key, data, aliases=(), height=None):
+        if not self.enabled() or len(data) > self.max_bytes:
+            return
+        compressed = 0
+        if self.compression > 0:
+            packed = zlib.compress(data, self.compression)
+            if len(packed) < len(data):
+                data, compressed = packed, 1
+        now = time.time()
+        rows = [(key, data, None, compressed, len(key) + len(data), now, height)]
+        rows += [(alias, None, key, 0, len(alias) + len(key), now, height) for alias in aliases]
+        keys = [row[0] for row in rows]
+        writer = self.open()
+        with self.lock:
+            if self.bytes is None:
+                self.bytes = writer.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                replaced = writer.execute(f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE key IN ({','.join('?' * len(keys))})",
+                                          keys).fetchone()[0]
+                writer.executemany("INSERT OR REPLACE INTO entries (key, value, alias, compressed, size, used_at, height) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._write_touches(writer)
+                size = self._evict(writer, self.bytes - replaced + sum(row[4] for row in rows))
+                writer.execute("COMMIT")
+            except Exception:
+                writer.execute("ROLLBACK")
+                raise
+            self.bytes = size
+        self.writes += 1
+
+    # Deletes every entry of a block from `height` up in one SQLite transaction, called when the node switched to another chain.
+    def rollback(self, height):
+        if not self.enabled():
+            return
+        writer = self.open()
+        with self.lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                count, size = writer.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE height >= ?", (height,)).fetchone()
+                writer.execute("DELETE FROM entries WHERE height >= ?", (height,))
+                writer.execute("COMMIT")
+            except Exception:
+                writer.execute("ROLLBACK")
+                raise
+            if self.bytes is not None:
+                self.bytes -= size
+        self.rollbacks += count
+
+    # Writes the remembered last uses of the read entries.
+    def flush(self):
+        if not self.enabled() or not self.touched:
+            return
+        writer = self.open()
+        with self.lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_touches(writer)
+                writer.execute("COMMIT")
+            except Exception:
+                writer.execute("ROLLBACK")
+                raise
+
+    # Writes the remembered last uses and closes every connection of the cache.
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+        super().close()
+
+    # Returns the size and the counters of the cache.
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled(),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "rollbacks": self.rollbacks,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,111 @@
+# Verus Network Data API - block event log
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Numbered block_added / block_removed events of the best chain for the Rosetta /events/blocks
+# endpoint. The latest events are kept in a fixed size ring buffer, with a block store they
+# are also written to disk so indexers can catch up from events that left the ring.
+
+
+# Module imports.
+import threading
+
+
+# Default event log settings, used when the env variables are not set.
+DEFAULT_EVENTS_BUFFER_SIZE = 10000
+DEFAULT_EVENTS_LIMIT = 100
+MAX_EVENTS_LIMIT = 1000
+
+
+# Log of the block events of the reorg engine (extend() is its on_events callback), every event gets the next sequence number.
+# Event `sequence` lives in slot sequence % capacity of the ring, so a page of events is read without scanning the log.
+# Events are written to the block store (rosettaapi_store.BlockStore) in the same order when it is enabled: pages that
+# start before the ring are read from it, and the sequence numbers continue from the stored events after a restart.
+# Without a store the events that left the ring are gone and a page starts at the oldest event that is kept.
+class BlockEventLog:
+    def __init__(self, capacity=DEFAULT_EVENTS_BUFFER_SIZE, store=None):
+        self.capacity = max(1, capacity)
+        self.store = store if store is not None and store.enabled() else None
+        self.ring = [None] * self.capacity
+        self.first = None
+        self.next_sequence = None
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.store_reads = 0
+
+    # Helps to pick the first sequence number, the lock must be held by the caller.
+    def _resume(self):
+        if self.next_sequence is None:
+            last = self.store.last_event_sequence() if self.store is not None else None
+            self.next_sequence = last + 1 if last is not None else 0
+            self.first = self.next_sequence
+
+    # Appends block events (rosettaapi_reorg.BlockEvent) to the log.
+    def extend(self, events):
+        with self.lock:
+            self._resume()
+            rows = []
+            for event in events:
+                row = (self.next_sequence, event.type, event.height, event.hash)
+                self.ring[row[0] % self.capacity] = row
+                rows.append(row)
+                self.next_sequence += 1
+            if self.store is not None:
+                self.store.put_events(rows)
+            self.appended += len(rows)
+
+    # Returns the highest sequence number and the (sequence, type, height, hash) rows of up to `limit` events
+    # from `offset` on. Without an offset the latest `limit` events are returned.
+    def events(self, offset=None, limit=DEFAULT_EVENTS_LIMIT):
+        with self.lock:
+            self._resume()
+            end = self.next_sequence
+            if offset is None:
+                offset = max(end - limit, 0)
+            ring_start = max(end - self.capacity, self.first)
+            if self.store is None:
+                offset = max(offset, ring_start)
+            stop = min(offset + limit, end)
+            rows = [self.ring[sequence % self.capacity] for sequence in range(max(offset, ring_start), stop)]
+        if offset < min(ring_start, stop):
+            self.store_reads += 1
+            rows = self.store.events(offset, min(ring_start, stop)) + rows
+        return end - 1, rows
+
+    # Returns the size of the log and its counters.
+    def stats(self):
+        end = self.next_sequence
+        return {
+            "capacity": self.capacity,
+            "max_sequence": end - 1 if end is not None else None,
+            "buffered": min(end - self.first, self.capacity) if end is not None else 0,
+            "stored": self.store is not None,
+            "appended": self.appended,
+            "store_reads": self.store_reads,
+        }
+
+
+# Builds the /events/blocks response from the event log.
+# Takes in the request body: an optional "offset" (the first sequence number) and "limit" (at most MAX_EVENTS_LIMIT).
+# "max_sequence" is -1 while no event was written. Raises ValueError for a malformed body.
+def block_events_response(log, data):
+    if not isinstance(data, dict):
+        raise ValueError("The request body has to be a JSON object")
+    offset, limit = data.get("offset"), data.get("limit")
+    if offset is not None:
+        offset = int(offset)
+        if offset < 0:
+            raise ValueError("'offset' has to be a positive number")
+    limit = int(limit) if limit is not None else DEFAULT_EVENTS_LIMIT
+    if limit < 0:
+        raise ValueError("'limit' has to be a positive number")
+    max_sequence, rows = log.events(offset, min(limit, MAX_EVENTS_LIMIT))
+    return {
+        "max_sequence": max_sequence,
+        "events": [
+            {
+                "sequence": sequence,
+                "block_identifier": {"index": height, "hash": blockhash},
+                "type": event_type
+            }
+            for sequence, event_type, height, blockhash in rows
+        ]
+    }
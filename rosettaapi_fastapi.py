@@ -7,24 +7,75 @@
 
 # Module imports.
 # from flask import Flask, jsonify, request
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
-import requests
+import asyncio
+import httpx
 from dotenv import load_dotenv, find_dotenv
+from rosettaapi_builders import block_status, block_response_body, block_response_chunks, block_transaction_responses, encode_response, tee_chunks, transaction_status, transaction_values, transaction_response
+from rosettaapi_cache import BlockCache, ResponseCache, TransactionCache
+from rosettaapi_chain import ChainConstants
+from rosettaapi_diskcache import DiskCache
+from rosettaapi_events import BlockEventLog, block_events_response
+from rosettaapi_headers import HeaderIndex, block_time_response
+from rosettaapi_json import dumps, loads
+from rosettaapi_prefetch import BlockPrefetcher
+from rosettaapi_reorg import ReorgEngine
+from rosettaapi_responses import network_options_body, etag_matches, accepts_gzip
+from rosettaapi_store import BlockStore
+from rosettaapi_tip import TipTracker
+from rosettaapi_zmq import ZMQSubscriber
+from rosettaapi_rpc import result_or_error, AsyncRPCTransport, RequestMemo, request_memo, env_flag, env_int
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 import uvicorn
-import json
+
+# Encodes the JSON responses with the fast encoder of rosettaapi_json instead of the json module.
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
 
 # Initializing Flask module and getting the env variable values.
 # app = Flask(__name__)
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 load_dotenv(find_dotenv())
 RPCURL = os.environ.get("RPCURL")
 RPCUSER = os.environ.get("RPCUSER")
 RPCPASS = os.environ.get("RPCPASS")
 PORT = os.environ.get("APIPORT")
 RUN_PRODUCTION = os.environ.get("RUN_PRODUCTION")
+# Production values of the /block and /block/transaction responses, shared with rosettaapi_backfill.py so stored and served bodies match
+PRODUCTION_RESPONSES = env_flag(RUN_PRODUCTION)
+RPC_POOL_MAXSIZE = env_int(os.environ.get("RPC_POOL_MAXSIZE"), 32)
+BLOCK_CACHE_MAX_BYTES = env_int(os.environ.get("BLOCK_CACHE_MAX_BYTES"), 64 * 1024 * 1024)
+BLOCK_CACHE_CONFIRMATIONS = env_int(os.environ.get("BLOCK_CACHE_CONFIRMATIONS"), 100)
+BLOCK_CACHE_TIP_TTL = env_int(os.environ.get("BLOCK_CACHE_TIP_TTL"), 5)
+TX_CACHE_MAX_BYTES = env_int(os.environ.get("TX_CACHE_MAX_BYTES"), 64 * 1024 * 1024)
+TX_CACHE_CONFIRMATIONS = env_int(os.environ.get("TX_CACHE_CONFIRMATIONS"), 101)
+TX_CACHE_NEGATIVE_TTL = env_int(os.environ.get("TX_CACHE_NEGATIVE_TTL"), 30)
+CHAIN_CHECK_INTERVAL = env_int(os.environ.get("CHAIN_CHECK_INTERVAL"), 300)
+TIP_POLL_INTERVAL = env_int(os.environ.get("TIP_POLL_INTERVAL"), 2)
+TIP_MAX_STALENESS = env_int(os.environ.get("TIP_MAX_STALENESS"), 10)
+REORG_DEPTH = env_int(os.environ.get("REORG_DEPTH"), 100)
+EVENTS_BUFFER_SIZE = env_int(os.environ.get("EVENTS_BUFFER_SIZE"), 10000)
+ZMQ_HASHBLOCK_URL = os.environ.get("ZMQ_HASHBLOCK_URL")
+ZMQ_HASHTX_URL = os.environ.get("ZMQ_HASHTX_URL")
+HEADER_INDEX_PATH = os.environ.get("HEADER_INDEX_PATH")
+HEADER_SYNC_BATCH = env_int(os.environ.get("HEADER_SYNC_BATCH"), 500)
+BLOCK_STORE_PATH = os.environ.get("BLOCK_STORE_PATH")
+BLOCK_STORE_CONFIRMATIONS = env_int(os.environ.get("BLOCK_STORE_CONFIRMATIONS"), 101)
+BLOCK_STORE_READERS = env_int(os.environ.get("BLOCK_STORE_READERS"), 4)
+RESPONSE_CACHE_MAX_BYTES = env_int(os.environ.get("RESPONSE_CACHE_MAX_BYTES"), 64 * 1024 * 1024)
+RESPONSE_CACHE_CONFIRMATIONS = env_int(os.environ.get("RESPONSE_CACHE_CONFIRMATIONS"), 100)
+RESPONSE_CACHE_GZIP = env_int(os.environ.get("RESPONSE_CACHE_GZIP"), 0)
+DISK_CACHE_PATH = os.environ.get("DISK_CACHE_PATH")
+DISK_CACHE_MAX_BYTES = env_int(os.environ.get("DISK_CACHE_MAX_BYTES"), 1024 * 1024 * 1024)
+DISK_CACHE_COMPRESSION = env_int(os.environ.get("DISK_CACHE_COMPRESSION"), 0)
+PREFETCH_MAX_BYTES = env_int(os.environ.get("PREFETCH_MAX_BYTES"), 64 * 1024 * 1024)
+PREFETCH_MAX_AHEAD = env_int(os.environ.get("PREFETCH_MAX_AHEAD"), 128)
+PREFETCH_CONFIRMATIONS = env_int(os.environ.get("PREFETCH_CONFIRMATIONS"), 100)
+BLOCK_TEE_MAX_BYTES = env_int(os.environ.get("BLOCK_TEE_MAX_BYTES"), 16 * 1024 * 1024)
 
 # Initialize the rate limiter only in production mode
 if RUN_PRODUCTION == "True" or RUN_PRODUCTION == "true":
@@ -43,62 +94,177 @@ baldata = []
 
 # Function definitions.
 
-# Helps to send the request to the RPC.
-def send_request(method, url, headers, data):
-    response = requests.request(method, url, headers=headers, json=data, auth=(RPCUSER, RPCPASS), timeout=10000)
-    return response.json()
-
-# Fetches the network options from the RPC.
-def get_network_options():
-    # Define the JSON-RPC request payload
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getnetworkinfo",
-        "params": []
-    }
+# Pooled keep-alive connection to the RPC, shared by every request.
+rpc = AsyncRPCTransport(RPCURL, RPCUSER, RPCPASS, max_connections=RPC_POOL_MAXSIZE, max_keepalive=RPC_POOL_MAXSIZE, timeout=10000)
 
-    # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
-
-    # Check if the request was successful
-    if "result" in response_json:
-        # Parse the response JSON and extract relevant information
-        network_status = {
-            "version": response_json["result"]["version"],
-            "subversion": response_json["result"]["subversion"],
-            "protocolversion": response_json["result"]["protocolversion"],
-            "localservices": response_json["result"]["localservices"],
-            "timeoffset": response_json["result"]["timeoffset"],
-            "connections": response_json["result"]["connections"],
-            "networks": [
-                {
-                    "name": network["name"],
-                    "limited": network["limited"],
-                    "reachable": network["reachable"],
-                    "proxy": network.get("proxy", "")
-                }
-                for network in response_json["result"]["networks"]
-            ],
-            "relayfee": response_json["result"]["relayfee"],
-            "localaddresses": [
-                {
-                    "address": address["address"],
-                    "port": address["port"],
-                    "score": address["score"]
-                }
-                for address in response_json["result"]["localaddresses"]
-            ],
-            "warnings": response_json["result"].get("warnings", "")
-        }
+# Resolves the chain constants when the API starts, they are resolved on the first request if the RPC is not reachable yet.
+@app.on_event("startup")
+async def resolve_chain_constants():
+    try:
+        await get_chain_constants()
+    except Exception as e:
+        print(f"Could not resolve the chain constants from the RPC: {e}")
+    # Keep the chain tip snapshot up to date in the background
+    if TIP_POLL_INTERVAL > 0:
+        app.state.tiptask = asyncio.create_task(tiptracker.run_async(send_batch))
+    # Check every new chain tip for a reorganization
+    app.state.reorgtask = asyncio.create_task(reorgengine.run_async(send_batch))
+    # Keep the header index in sync with the node
+    if HEADER_INDEX_PATH:
+        app.state.headertask = asyncio.create_task(headerindex.run_async(send_batch))
+    # Push new blocks and transactions into the API as soon as the node announces them
+    zmqsubscriber.start()
+
+# Closes the pooled RPC connections when the API shuts down.
+@app.on_event("shutdown")
+async def close_rpc():
+    zmqsubscriber.stop()
+    blockstore.close()
+    diskcache.close()
+    await rpc.close()
+
+# Chain id, genesis block and node version, resolved once and refreshed when the node restarts or its version changes.
+chainconstants = ChainConstants(rpc, check_interval=CHAIN_CHECK_INTERVAL)
+
+# Hands every new chain tip to the reorg engine, the blocks it confirmed are prefetched for the clients that sync up to the tip.
+def on_new_tip(snapshot):
+    reorgengine.notify(snapshot)
+    heights = prefetcher.advance(snapshot.height)
+    if heights:
+        prefetcher.start_async(prefetch_batch, heights, build_prefetched_block)
+
+# Snapshot of the chain tip, sync state and peers, kept up to date in the background.
+tiptracker = TipTracker(poll_interval=TIP_POLL_INTERVAL, max_staleness=TIP_MAX_STALENESS, on_tip=on_new_tip)
+
+# Height -> hash index of the best chain kept in HEADER_INDEX_PATH, height/hash translation and block time lookups need no RPC call.
+headerindex = HeaderIndex(HEADER_INDEX_PATH, sync_batch=HEADER_SYNC_BATCH, poll_interval=TIP_POLL_INTERVAL or 2)
+
+# SQLite store of the confirmed blocks and transactions in BLOCK_STORE_PATH, their responses are served from disk without calling the RPC.
+blockstore = BlockStore(BLOCK_STORE_PATH, confirmations=BLOCK_STORE_CONFIRMATIONS, readers=BLOCK_STORE_READERS)
+
+# Prebuilt /block responses of the next blocks of the clients that sync sequentially, blocks within PREFETCH_CONFIRMATIONS of the tip are not prefetched.
+prefetcher = BlockPrefetcher(max_bytes=PREFETCH_MAX_BYTES, max_ahead=PREFETCH_MAX_AHEAD, confirmations=PREFETCH_CONFIRMATIONS, hash_at=headerindex.hash_at)
+
+# Handles a new block announced by the node, the blocks near the tip are dropped and the tip tracker fetches the new tip.
+# The notification only carries the hash, the blocks are prefetched by on_new_tip() once the tip tracker has the new height.
+def on_new_block(blockhash):
+    blockcache.invalidate_tip()
+    tiptracker.notify()
+    headerindex.notify()
+
+# Handles a new transaction announced by the node, a cached "No information available" for it is dropped.
+def on_new_transaction(txid):
+    txcache.forget_missing(txid)
+
+# Optional subscriber to the zmqpubhashblock / zmqpubhashtx notifications of the node, the API falls back to polling without it.
+zmqsubscriber = ZMQSubscriber([ZMQ_HASHBLOCK_URL, ZMQ_HASHTX_URL],
+                              on_block=on_new_block if ZMQ_HASHBLOCK_URL else None,
+                              on_tx=on_new_transaction if ZMQ_HASHTX_URL else None)
+
+# SQLite file in DISK_CACHE_PATH behind the block, transaction and response caches, their final entries survive a restart.
+diskcache = DiskCache(DISK_CACHE_PATH, max_bytes=DISK_CACHE_MAX_BYTES, compression=DISK_CACHE_COMPRESSION)
+
+# Cache of the blocks fetched from the RPC, blocks deeper than BLOCK_CACHE_CONFIRMATIONS never change.
+blockcache = BlockCache(max_bytes=BLOCK_CACHE_MAX_BYTES, confirmations=BLOCK_CACHE_CONFIRMATIONS, tip_ttl=BLOCK_CACHE_TIP_TTL, disk=diskcache)
+
+# Cache of the transactions fetched from the RPC, unknown txids are remembered for TX_CACHE_NEGATIVE_TTL seconds.
+txcache = TransactionCache(max_bytes=TX_CACHE_MAX_BYTES, confirmations=TX_CACHE_CONFIRMATIONS, negative_ttl=TX_CACHE_NEGATIVE_TTL, disk=diskcache)
+
+# Cache of the encoded /block and /block/transaction responses with at least RESPONSE_CACHE_CONFIRMATIONS confirmations, with gzip variants when RESPONSE_CACHE_GZIP is set.
+responsecache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES, confirmations=RESPONSE_CACHE_CONFIRMATIONS, gzip_level=RESPONSE_CACHE_GZIP, disk=diskcache)
+
+# Drops everything the API derived from the blocks from `height` up, called by the reorg engine when the node switched to another chain.
+# The files go first, so a memory miss in between cannot load a replaced block from disk again.
+def rollback_blocks(height):
+    blockstore.rollback(height)
+    diskcache.rollback(height)
+    blockcache.invalidate_tip()
+    blockcache.rollback(height)
+    txcache.rollback(height)
+    responsecache.rollback(height)
+    prefetcher.invalidate(height)
+    if headerindex.count > height:
+        headerindex.truncate(height)
+        headerindex.notify()
+
+# Numbered block_added / block_removed events of /events/blocks, the last EVENTS_BUFFER_SIZE are kept in memory and all of them in the block store.
+blockevents = BlockEventLog(capacity=EVENTS_BUFFER_SIZE, store=blockstore)
+
+# Compares every new chain tip with the last REORG_DEPTH blocks and rolls the caches, indexes and stores back when the node switched to another chain.
+reorgengine = ReorgEngine(depth=REORG_DEPTH, poll_interval=TIP_POLL_INTERVAL or 2, on_rollback=rollback_blocks, on_events=blockevents.extend)
 
-        return network_status
-    else:
-        # Handle the error case
-        return None
+# Helps to send the request to the RPC.
+async def send_request(method, url, headers, data):
+    return await rpc.request(method, url, headers, data)
+
+# Helps to send several calls to the RPC in a single request, takes in a list of (method, params) entries.
+# Blocks that are in the block cache are served from it and left out of the request.
+async def send_batch(calls):
+    responses = blockcache.lookup_calls(calls)
+    pending = [index for index, response in enumerate(responses) if response is None]
+    if pending:
+        fetched = await rpc.batch(RPCURL, {'content-type': 'text/plain;'}, [calls[index] for index in pending])
+        for index, response in zip(pending, fetched):
+            responses[index] = response
+        blockcache.store_calls(calls, responses)
+    return responses
+
+# Helps to fetch the blocks of the prefetcher, they are built into responses right away and are left out of the block cache.
+async def prefetch_batch(calls):
+    return await rpc.batch(RPCURL, {'content-type': 'text/plain;'}, calls)
+
+# Builds the /block response of a prefetched block, blocks that can no longer be replaced by a reorg also go to the local block store.
+def build_prefetched_block(block):
+    body = block_response_body(block, PRODUCTION_RESPONSES)
+    if blockstore.is_final(block['confirmations']) and chainconstants.chainid is not None:
+        blockstore.put_block(block['height'], block['hash'], body, block_transaction_responses(
+            block, chainconstants.chainid, PRODUCTION_RESPONSES))
+    return body
+
+# Keeps the encoded /block response of a final block in the local block store and the encoded response cache.
+# The /block/transaction responses of its transactions are built and stored one at a time.
+def keep_block(block, body, chainid, store, cache):
+    if store:
+        blockstore.put_block(block['height'], block['hash'], body, block_transaction_responses(
+            block, chainid, PRODUCTION_RESPONSES))
+    if cache:
+        responsecache.put_block(block['height'], block['hash'], body)
+
+# Starts fetching the blocks ahead of a client that asks for the blocks one after another.
+async def prefetch_blocks(client, height):
+    tip = await get_tip_snapshot()
+    heights = prefetcher.observe(client, height, tip.height if tip else None)
+    if heights:
+        prefetcher.start_async(prefetch_batch, heights, build_prefetched_block)
+
+# Sends a cached encoded response, answers 304 when the client already has it and sends the gzip variant when the client accepts it.
+def cached_response(request, entry):
+    compressed = entry.gzip_body is not None and accepts_gzip(request.headers.get("accept-encoding"))
+    etag = entry.gzip_etag if compressed else entry.etag
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=entry.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+# Returns the chain constants, resolving them from the RPC the first time and after the node restarted or its version changed.
+async def get_chain_constants():
+    if not chainconstants.needs_resolve() and chainconstants.needs_version_check():
+        chainconstants.check_version(await send_batch(chainconstants.version_calls()))
+    if chainconstants.needs_resolve():
+        chainconstants.update(await send_batch(chainconstants.resolve_calls()))
+    return chainconstants
+
+# Returns the chain tip snapshot, polls the RPC first if the snapshot is older than TIP_MAX_STALENESS seconds.
+async def get_tip_snapshot():
+    if tiptracker.is_stale():
+        await tiptracker.poll_async(send_batch)
+    return tiptracker.current
 
 # Helps to create a new verus address
-def getnewaddress():
+async def getnewaddress():
     # Define the JSON-RPC request payload
     payload = {
         "jsonrpc": "1.0",
@@ -108,12 +274,12 @@ def getnewaddress():
     }
 
     # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+    response_json = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
     return response_json
 
 
 # Helps to create an unsigned raw transaction, takes in a few arguments to create a transaction.
-def create_unsigned_transaction(txid, vout, address, amount):
+async def create_unsigned_transaction(txid, vout, address, amount):
     # Define the JSON-RPC request payload
     request_data = {
         "jsonrpc": "1.0",
@@ -125,7 +291,7 @@ def create_unsigned_transaction(txid, vout, address, amount):
         ]
     }
     try:
-        result = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, request_data)
+        result = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, request_data)
         unsigned_transaction = result.get("transaction")
         return unsigned_transaction
     except Exception as e:
@@ -133,7 +299,7 @@ def create_unsigned_transaction(txid, vout, address, amount):
 
 
 # Helps to parse, verify and sign the unsigned raw transaction, takes in an argument called hex.
-def parse_and_sign_transaction(unsigned_hex):
+async def parse_and_sign_transaction(unsigned_hex):
     # Define the JSON-RPC request payload
     request_data = {
         "jsonrpc": "1.0",
@@ -143,14 +309,14 @@ def parse_and_sign_transaction(unsigned_hex):
     }
 
     try:
-        result = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, request_data)
+        result = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, request_data)
         return result
     except Exception as e:
         raise Exception(f"Failed to parse and sign transaction: {str(e)}")
 
 
 # Helps to broadcast a signed raw transaction into the network, takes in an argument called hex (signed hex).
-def submit_signed_transaction(signed_hex):
+async def submit_signed_transaction(signed_hex):
     request_data = {
         "jsonrpc": "1.0",
         "id": "flask-app",
@@ -159,103 +325,24 @@ def submit_signed_transaction(signed_hex):
     }
 
     try:
-        result = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, request_data)
+        result = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, request_data)
         return result
     except Exception as e:
         raise Exception(f"Failed to submit signed transaction: {str(e)}")
 
-# Fetches the network status from the RPC.
-def get_network_status():
-    # Define the JSON-RPC request payload
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getblockchaininfo",
-        "params": []
-    }
-
-    # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
-
-    # Check if the request was successful
-    if "result" in response_json:
-        # Parse the response JSON and extract relevant information
-        blockchain_info = response_json["result"]
-
-        network_options = {
-            "chain": blockchain_info["chain"],
-            "name": blockchain_info["name"],
-            "chainid": blockchain_info["chainid"],
-        }
-        return network_options
-    else:
-        # Handle the error case
-        return None
-
-# Get the current block identifier
-def getcurrentblockidentifier():
-    # Define the JSON-RPC request payload
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getbestblockhash",
-        "params": []
-    }
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
-    return response_json['result']
-
 # Get genesis block identifier
-def getgenesisblockidentifier():
-    # Define the JSON-RPC request payload
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getblockhash",
-        "params": [0]
-    }
-
-    # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
-    resp = get_block_info(response_json['result'])
-    resp = resp['height']
-    return response_json['result'], resp
-
-# Get current block height 
-def getcurrentblockheight():
-    # Define the JSON-RPC request payload
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getblockchaininfo",
-        "params": []
-    }
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
-    return int(response_json["result"]["blocks"])
-
-def getpeerinfo():
-    # Define the JSON-RPC request payload
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getpeerinfo",
-        "params": []
-    }
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
-    formatted_data = []
-    for item in response_json['result']:
-        item_id = item.pop('id')  # Extract and remove the 'id' key from the dictionary
-        formatted_data.append({'id': item_id, 'data': item})
-
-    formatted_json = json.dumps(formatted_data, indent=2)
-    formatted_data = json.loads(formatted_json)
-
-    ids = [item['id'] for item in formatted_data]
-    data_without_id = [item['data'] for item in formatted_data]
-    return ids
+async def getgenesisblockidentifier():
+    chain = await get_chain_constants()
+    return chain.genesis_hash, chain.genesis_height
 
 
 # Gets the block information, takes in an argument called identifier which should be a transaction ID or a block number.
-def get_block_info(identifier):
+async def get_block_info(identifier):
+    # Serve the block from the cache if it was already fetched
+    block_info = blockcache.get(identifier)
+    if block_info is not None:
+        return block_info
+
     # Define the JSON-RPC request payload
     payload = {
         "jsonrpc": "1.0",
@@ -265,11 +352,12 @@ def get_block_info(identifier):
     }
 
     # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+    response_json = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
 
     # Check if the request was successful
     if "result" in response_json:
         block_info = response_json["result"]
+        blockcache.put(block_info)
 
         return block_info
     elif "error" in response_json:
@@ -277,18 +365,8 @@ def get_block_info(identifier):
     else:
         return None
 
-# Get current block identifier height from a hash
-def getcurrentblockidentifierheight(hash):
-    resp = get_block_info(hash)
-    resp = resp['height']
-    return resp
-
-# Get the syncing status
-def getsyncstatus():
-    # Calculate the block sync status
-    hash0 = getcurrentblockidentifier()
-    height0 = getcurrentblockidentifierheight(hash0)
-    height = getcurrentblockheight()
+# Calculate the syncing status from the best block height and the current block height
+def calcsyncstatus(height0, height):
     calc = int(height) / int(height0)
     if calc == 1:
         syncstat = "Synced"
@@ -299,7 +377,7 @@ def getsyncstatus():
     return syncstat, height0, height, boolean
 
 # Gets the transaction information, takes in an argument called transaction ID.
-def get_transaction_info(txid):
+async def get_transaction_info(txid):
     # Define the JSON-RPC request payload
     payload = {
         "jsonrpc": "1.0",
@@ -308,8 +386,11 @@ def get_transaction_info(txid):
         "params": [txid, 1]
     }
 
-    # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+    # Serve the transaction from the cache or make the request using the provided function
+    response_json = txcache.response(txid)
+    if response_json is None:
+        response_json = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+        txcache.store(txid, response_json)
 
     # Check if the request was successful
     if "result" in response_json:
@@ -323,7 +404,7 @@ def get_transaction_info(txid):
 
 
 # Gets all the unconfirmed transactions from the mempool.
-def get_mempool_info():
+async def get_mempool_info():
     # Define the JSON-RPC request payload
     payload = {
         "jsonrpc": "1.0",
@@ -333,7 +414,7 @@ def get_mempool_info():
     }
 
     # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+    response_json = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
 
     # Check if the request was successful
     if "result" in response_json:
@@ -344,38 +425,8 @@ def get_mempool_info():
         # Handle the error case
         return None
 
-# Get transaction amount from a transaction id
-def gettxamt(txid):
-    txid = str(txid)
-    cleaned_string = txid.replace("[", "").replace("]", "").replace("'", "")
-    try:
-        # resp = requests.get(f"https://explorer.verus.io/ext/gettx/{cleaned_string}")
-        # amount = resp.json()['tx']['vin'][0]['amount']
-        # addr1 = resp.json()['tx']['vout'][0]['addresses']
-        # try:
-        #     addr2 = resp.json()['tx']['vout'][1]['addresses']
-        # except IndexError:
-        #     addr2 = addr1
-        transaction = get_transaction_info(cleaned_string)
-        # Extract valueSat from each vout
-        valuesats = [vout["valueSat"] for vout in transaction["vout"]]
-
-        # Extract addresses from scriptPubKey for the first two vouts
-        addresses = [vout["scriptPubKey"]["addresses"] for vout in transaction["vout"][:2]]
-        amount = valuesats
-        addr1 = addresses[0][0]
-        try:
-            addr2 = addresses[1][0]
-        except IndexError:
-            addr2 = addr1
-    except:
-        amount = "00000000"
-        addr1 = "iCRUc98jcJCP3JEntuud7Ae6eeaWtfZaZK"
-        addr2 = "iCRUc98jcJCP3JEntuud7Ae6eeaWtfZaZK"
-    return amount, addr1, addr2
-
 # Gets the balance of an address, takes in an argument called address.
-def get_address_balance(address):
+async def get_address_balance(address):
     # Define the JSON-RPC request payload
     payload = {
         "jsonrpc": "1.0",
@@ -385,7 +436,7 @@ def get_address_balance(address):
     }
 
     # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+    response_json = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
 
     # Check if the request was successful
     if "result" in response_json:
@@ -399,7 +450,7 @@ def get_address_balance(address):
 
 
 # Gets the unspent transactions of an address, takes in an argument called address.
-def get_address_utxos(address):
+async def get_address_utxos(address):
     # Define the JSON-RPC request payload
     payload = {
         "jsonrpc": "1.0",
@@ -409,7 +460,7 @@ def get_address_utxos(address):
     }
 
     # Make the request using the provided function
-    response_json = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+    response_json = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
 
     # Check if the request was successful
     if "result" in response_json:
@@ -424,12 +475,21 @@ def get_address_utxos(address):
 
 # API Endpoints
 
+# Gives every request its own memo of read-only RPC responses, so helpers that repeat a call within the request share the first response.
+@app.middleware("http")
+async def memoize_rpc_calls(request: Request, call_next):
+    token = request_memo.set(RequestMemo())
+    try:
+        return await call_next(request)
+    finally:
+        request_memo.reset(token)
+
 # Endpoint that is used to get the network lists.
 @app.post('/network/list')
 async def network_list():
     # request chainid from the vrsc daemon
-    chain = get_network_status()
-    newchainid = chain["chainid"]
+    chain = await get_chain_constants()
+    newchainid = chain.chainid
     netinfo = {
   "network_identifiers":
   [
@@ -453,28 +513,28 @@ async def network_list():
   "details": None
 }
     try:
-        return netinfo
+        return FastJSONResponse(netinfo)
     except:
         return HTTPException(status_code=500, detail=errnetinfo)
 
 # Endpoint that is used to get the network status.
 @app.post('/network/status')
 async def network_status(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if data:
-        ids = getpeerinfo()
-        hashhe = get_block_info(1500)
-        hash = getcurrentblockidentifier()
-        indexval = getcurrentblockidentifierheight(hash)
-        ghash, gindex = getgenesisblockidentifier()
-        syncstat, height0, height, boolean = getsyncstatus()
+        # Answer from the chain tip snapshot, the RPC is only asked when the snapshot is too old
+        tip, (ghash, gindex) = await asyncio.gather(get_tip_snapshot(), getgenesisblockidentifier())
+        hash = tip.hash
+        indexval = tip.height
+        ids = tip.peers
+        syncstat, height0, height, boolean = calcsyncstatus(indexval, tip.blocks)
         if RUN_PRODUCTION == "True" or RUN_PRODUCTION == "true":
             hash = hash
             indexval = indexval
         else:
             hash = hash
             indexval = indexval
-        timestamp = hashhe['time']
+        timestamp = tip.time
         milliseconds = timestamp * 1000
         info = {
         "current_block_identifier": {
@@ -503,7 +563,7 @@ async def network_status(request: Request):
             }
         ]
         }
-        return info
+        return FastJSONResponse(info)
     else:
         return HTTPException(status_code=500, detail={
             "code": 500,
@@ -514,122 +574,14 @@ async def network_status(request: Request):
 
 # Endpoint that is used to get network options.
 @app.post('/network/options')
-async def network_options():
-    nodeversion = get_network_options()
-    chain = get_network_status()
-    newchainid = chain["chainid"]
+async def network_options(request: Request):
     try:
-    # Add the specified text to the output
-        versioninfo = {
-        "version": {
-        "rosetta_version": "1.2.5",
-        "node_version": f'{nodeversion["version"]}',
-        "middleware_version": "0.2.7",
-        "metadata": None
-    },
-        "allow": {
-        "operation_statuses": [
-        {
-            "status": "confirmed",
-            "successful": True
-        },
-        {
-            "status": "unconfirmed",
-            "successful": True
-        },
-        {
-            "status": "processing",
-            "successful": True
-        },
-        {
-            "status": "pubkey",
-            "successful": True
-        },
-        ],
-        "operation_types": [
-        "Transfer",
-        "mined",
-        "minted"
-        "pubkey"
-        ],
-        "errors": [
-        {
-            "code": 12,
-            "message": "Invalid account format",
-            "description": "This error is returned when the requested AccountIdentifier is improperly formatted.",
-            "retriable": True,
-            "details": None
-        }, 
-        {
-            "code": 14,
-            "message": "Failed to fetch network version",
-            "description": "There was an error while fetching network version from the RPC",
-            "retriable": True,
-            "details": None
-        },
-        {
-            "code": 16,
-            "message": "Failed to fetch block information",
-            "description": "There was an error while fetching block information from the RPC",
-            "retriable": True,
-            "details": None
-        },
-        {
-            "code": 18,
-            "message": "Failed to fetch transaction information",
-            "description": "There was an error while fetching transaction information from the RPC",
-            "retriable": True,
-            "details": None
-        },
-        {
-            "code": 20,
-            "message": "Failed to fetch mempool information",
-            "description": "There was an error while fetching mempool information from the RPC",
-            "retriable": True,
-            "details": None
-        },
-        {
-            "code": 22,
-            "message": "Failed to fetch balance information",
-            "description": "There was an error while fetching balance information from the API",
-            "retriable": True,
-            "details": None
-        },
-        {
-            "code": 24,
-            "message": "Failed to fetch UTXOs",
-            "description": "There was an error while fetching UTXOs from the API",
-            "retriable": True,
-            "details": None
-        },
-        {
-            "code": 26,
-            "message": "Failed to create new verus wallet address",
-            "description": "There was an error while fetching the information from the Local RPC",
-            "retriable": True,
-            "details": None
-        }
-        ],
-        "historical_balance_lookup": True,
-        "timestamp_start_index": 1231006505,
-        "call_methods": [
-        "POST"
-        ],
-        "balance_exemptions": [
-        {
-            "sub_account_address": newchainid,
-            "currency": {
-            "symbol": "VRSC",
-            "decimals": 8,
-            "metadata": None
-            },
-            "exemption_type": "dynamic"
-        }
-        ],
-        "mempool_coins": False
-    }
-}
-        return versioninfo
+        # Only the node version and the chain id can change, they are spliced into the pre-encoded body
+        chain = await get_chain_constants()
+        body, etag = network_options_body(chain.node_version, chain.chainid)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
     except Exception as e:
         return HTTPException(status_code=500, detail={
             "code": 500,
@@ -641,7 +593,7 @@ async def network_options():
 # Endpoint that is used to get the information of a block.
 @app.post('/block')
 async def block_info(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
 
@@ -654,123 +606,52 @@ async def block_info(request: Request):
         block_identifier = data.get("index")
     try:
         newblkidentifier = block_identifier['index']
-        data = get_block_info(newblkidentifier)
     except:
-        data = get_block_info(block_identifier)
+        newblkidentifier = block_identifier
+    if index_value == 0:
+        newindexv = 0
+    else:
+        newindexv = index_value - 1
+    # Final blocks are answered from the encoded response cache, then from the local block store
+    entry = responsecache.block(newblkidentifier)
+    if entry is not None:
+        return cached_response(request, entry)
+    row = blockstore.block_row(newblkidentifier)
+    if row is not None:
+        return cached_response(request, responsecache.put_block(*row))
+    # Clients that sync block after block get the next blocks fetched and built ahead of their requests
+    if isinstance(newblkidentifier, int) and prefetcher.enabled():
+        await prefetch_blocks(request.client.host if request.client else None, newblkidentifier)
+        body = await prefetcher.take_async(newblkidentifier)
+        if body is not None:
+            return Response(content=body, media_type="application/json")
+    # Fetch the block with the bodies of its transactions in a single RPC call, the chain constants are resolved meanwhile
+    calls = [("getblock", [f"{newblkidentifier}", 2])]
+    blocks, chain = await asyncio.gather(send_batch(calls), get_chain_constants())
+    data = result_or_error(blocks[0])
     # data = json.dumps(block_data)
-    try:
-        txid = data['tx']
-    except TypeError:
-        txid = None
     hash_value = data['hash']
+    # The parent hash is part of the block, the genesis block is its own parent
+    parent_hash = data.get('previousblockhash', hash_value)
     height = data['height']
     time = data['time']
     blocktype = data['blocktype']
     confirmations = data['confirmations']
-    if int(confirmations) > 15:
-        status = "confirmed"
-    else:
-        status = "unconfirmed"
-    value, addr1, addr2 = gettxamt(txid)
-    chain = get_network_status()
-    newchainid = chain["chainid"]
-    if index_value == 0:
-        newindexv = 0
-    else:
-        newindexv = index_value - 1
-    parent_hash = get_block_info(newindexv)
-    parent_hash = parent_hash['hash']
-    RUN_PRODUCTION = os.environ.get("RUN_PRODUCTION")
-    if RUN_PRODUCTION == True or RUN_PRODUCTION == "true":
-        value = int(str(value).replace(".", ""))
-    else:
-        value = "00000000"
+    status = block_status(confirmations)
+    newchainid = chain.chainid
     if data:
-        data = {
-        "block": {
-            "block_identifier": {
-            "index": index_value,
-            "hash": hash_value
-            },
-            "parent_block_identifier": {
-            "index": newindexv,
-            "hash": parent_hash
-            },
-            "timestamp": time,
-            "transactions": [
-            {
-                "transaction_identifier": {
-                "hash": str(txid[:1])
-                },
-                "operations": [
-                {
-                    "operation_identifier": {
-                    "index": 0,
-                    "network_index": 0
-                    },
-                    "related_operations": [
-                    {
-                        "index": -3,
-                        "network_index": 0
-                    }
-                    ],
-                    "type": "Transfer",
-                    "status": status,
-                    "account": {
-                    "address": addr1,
-                    "sub_account": {
-                        "address": addr2,
-                        "metadata": None
-                    },
-                    "metadata": None
-                    },
-                    "amount": {
-                    "value": f"{value}",
-                    "currency": {
-                        "symbol": "VRSC",
-                        "decimals": 8,
-                        "metadata": None
-                    },
-                    "metadata": None
-                    },
-                    "coin_change": {
-                    "coin_identifier": {
-                        "identifier": newchainid
-                    },
-                    "coin_action": "coin_spent"
-                    },
-                    "metadata": None
-                }
-                ],
-                "related_transactions": [
-                {
-                    "network_identifier": {
-                    "blockchain": "VRSC",
-                    "network": newchainid,
-                    "sub_network_identifier":
-                    {
-                        "network": newchainid,
-                        "metadata": None
-                    }
-                    },
-                    "transaction_identifier": {
-                    "hash": str(txid[:1])
-                    },
-                    "direction": "forward"
-                }
-                ],
-                "metadata": None
-            }
-            ],
-            "metadata": None
-        },
-        "other_transactions": [
-            {
-            "hash": str(txid[:1])
-            }
-        ]
-        }
-        return data
+        # Every transaction and its operations are encoded while the response is sent, one transaction at a time
+        chunks = block_response_chunks(index_value, hash_value, newindexv, parent_hash, time, data.get('tx') or [], status,
+                                       PRODUCTION_RESPONSES, blocktype)
+        # Blocks that can no longer be replaced by a reorg are kept in the local block store and the response cache once the
+        # whole response was sent, the body is kept once for both and responses over BLOCK_TEE_MAX_BYTES are only streamed.
+        # The /block/transaction responses of all its transactions are built from the same RPC response
+        store = index_value == height and blockstore.is_final(confirmations)
+        cache = index_value == height and responsecache.is_final(confirmations)
+        if store or cache:
+            chunks = tee_chunks(chunks, lambda body: keep_block(data, body, newchainid, store, cache), BLOCK_TEE_MAX_BYTES)
+        # Streamed without an ETag, the body is only known once it was sent. Later requests for a cached block get one
+        return StreamingResponse(chunks, media_type="application/json")
     else:
         return HTTPException(status_code=500, detail={
             "code": 500,
@@ -782,15 +663,13 @@ async def block_info(request: Request):
 # Endpoint that is used to get the information about a block transaction.
 @app.post('/block/transaction')
 async def block_transaction_info(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
-    # Parse JSON data
-    parsed_data = json.loads(json.dumps(data))
+    # The request body is already parsed
+    parsed_data = data
     # Access the desired hash value
     try:
-        chain = get_network_status()
-        newchainid = chain["chainid"]
         transaction_hash = parsed_data['transaction_identifier']['hash'][2:-2]  #Remove the square brackets and quotes
         if transaction_hash == "4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b":
             txid = "4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b"
@@ -800,6 +679,8 @@ async def block_transaction_info(request: Request):
                 value = "00000000"
             address = "RJJBTXXfgE5DjiPQpZSnYrQe73NhrBZ3ao"
             status = "confirmed"
+            confirmations = None
+            chain = await get_chain_constants()
         else:
             # Split the variable by comma, strip whitespace, and remove single quotes
             strings = [s.strip().strip("'") for s in transaction_hash.split(',')]
@@ -809,85 +690,29 @@ async def block_transaction_info(request: Request):
                 result = strings[0]  # Return the first string
             else:
                 result = transaction_hash.strip("'")
-            data = get_transaction_info(result)
+            # Final transactions are answered from the encoded response cache, then from the local block store
+            entry = responsecache.transaction(result)
+            if entry is not None:
+                return cached_response(request, entry)
+            row = blockstore.transaction_row(result)
+            if row is not None:
+                return cached_response(request, responsecache.put_transaction(result, row[1], row[0]))
+            # The transaction and the chain constants do not depend on each other
+            chain, data = await asyncio.gather(get_chain_constants(), get_transaction_info(result))
             # Extracting values
-            txid = data["txid"]
-            if RUN_PRODUCTION == "True" or RUN_PRODUCTION == "true":
-                value = data["vout"][0]["valueSat"]
-            else:
-                value = "00000000"
-            try:
-                address = data["vout"][0]["scriptPubKey"]["addresses"]
-            except:
-                address = "RJJBTXXfgE5DjiPQpZSnYrQe73NhrBZ3ao"
+            txid, value, address = transaction_values(data, RUN_PRODUCTION == "True" or RUN_PRODUCTION == "true")
             confirmations = data["confirmations"]
             # Checking confirmations and setting status
-            status = "confirmed" if confirmations > 100 else "unconfirmed"
-        senddata = {
-            "transaction": {
-                "transaction_identifier": {
-                "hash": str(txid)
-                },
-                "operations": [
-                {
-                    "operation_identifier": {
-                    "index": 0,
-                    "network_index": 0
-                    },
-                    "related_operations": [
-                    {
-                        "index": -3,
-                        "network_index": 0
-                    }
-                    ],
-                    "type": "Transfer",
-                    "status": status,
-                    "account": {
-                    "address": str(address),
-                    "sub_account": {
-                        "address": str(address),
-                        "metadata": None
-                    },
-                    "metadata": None
-                    },
-                    "amount": {
-                    "value": f"{value}0",
-                    "currency": {
-                        "symbol": "VRSC",
-                        "decimals": 8,
-                        "metadata": None
-                    },
-                    "metadata": None
-                    },
-                    "coin_change": {
-                    "coin_identifier": {
-                        "identifier": f"{txid}:0"
-                    },
-                    "coin_action": "coin_spent"
-                    },
-                    "metadata": None
-                }
-                ],
-                "related_transactions": [
-                {
-                    "network_identifier": {
-                    "blockchain": "VRSC",
-                    "network": newchainid,
-                    "sub_network_identifier": {
-                        "network": newchainid,
-                        "metadata": None
-                    }
-                    },
-                    "transaction_identifier": {
-                    "hash": str(txid)
-                    },
-                    "direction": "forward"
-                }
-                ],
-                "metadata": None
-            }
-            }
-        return senddata
+            status = transaction_status(confirmations)
+        newchainid = chain.chainid
+        senddata = transaction_response(txid, status, address, value, newchainid)
+        # Transactions that can no longer be replaced by a reorg are kept in the local block store
+        if blockstore.is_final(confirmations):
+            blockstore.put_transaction(txid, data.get("height"), senddata)
+        # Final transactions are sent from the encoded response cache, so the ETag is the same on every request
+        if responsecache.is_final(confirmations):
+            return cached_response(request, responsecache.put_transaction(txid, encode_response(senddata), data.get("height")))
+        return FastJSONResponse(senddata)
     except Exception as e:
         return HTTPException(status_code=500, detail={
             "code": 500,
@@ -897,10 +722,41 @@ async def block_transaction_info(request: Request):
 
 
 
+# Endpoint that is used to find the blocks of timestamps, answered from the header index without calling the RPC.
+# Takes in a "timestamp", a list of "timestamps" and/or a "start_timestamp" / "end_timestamp" range in milliseconds.
+@app.post('/block/time')
+async def block_time_info(request: Request):
+    data = loads(await request.body())
+    # The errors are sent with their status code and the same bodies as the Flask API
+    if not data:
+        return FastJSONResponse({"error": "No data provided"}, status_code=400)
+    if headerindex.count == 0:
+        return FastJSONResponse({
+            "code": 500,
+            "message": "Failed to fetch block time information",
+            "description": "The header index is empty, set HEADER_INDEX_PATH and wait for the index to sync"
+        }, status_code=500)
+    try:
+        return FastJSONResponse(block_time_response(headerindex, data))
+    except (TypeError, ValueError) as e:
+        return FastJSONResponse({"error": str(e)}, status_code=400)
+
+
+# Endpoint that is used to follow the blocks added to and removed from the best chain, answered from the event log without calling the RPC.
+# Takes in an optional "offset" (the first sequence number) and "limit", without an offset the latest events are returned.
+@app.post('/events/blocks')
+async def events_blocks(request: Request):
+    body = await request.body()
+    try:
+        return FastJSONResponse(block_events_response(blockevents, loads(body) if body else {}))
+    except (TypeError, ValueError) as e:
+        return FastJSONResponse({"error": str(e)}, status_code=400)
+
+
 # Endpoint that is used to fetch mempool transactions.
 @app.post('/mempool')
 async def mempool_info():
-    mempool_data = get_mempool_info()
+    mempool_data = await get_mempool_info()
     if mempool_data:
         data = {
         "transaction_identifiers": [
@@ -909,7 +765,7 @@ async def mempool_info():
             }
         ]
         }
-        return data
+        return FastJSONResponse(data)
     else:
         return HTTPException(status_code=500, detail={
             "code": 500,
@@ -922,24 +778,28 @@ async def mempool_info():
 @app.post('/account/balance')
 async def account_balance(request: Request):
     global baldata
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
     address = data['account_identifier']['address']
-    balance_data = get_address_balance(address)
+    index_value = data['block_identifier']['index']
+    # The block hash comes from the header index when it covers the height, otherwise the block is fetched next to the balance
+    hash = headerindex.hash_at(index_value)
+    if hash is None:
+        balance_data, data = await asyncio.gather(get_address_balance(address), get_block_info(index_value))
+        hash = data['hash']
+    else:
+        balance_data = await get_address_balance(address)
     baldata.append(balance_data)
     try:
         value_satt = baldata[0]['balance']
     except:
         value_satt = "00000000"
     value_sat = int(str(value_satt)[:8])
-    index_value = data['block_identifier']['index']
-    data = get_block_info(index_value)
     if RUN_PRODUCTION == "True" or RUN_PRODUCTION == "true":
         value_sat = value_sat
     else:
         value_sat = "00000000"
-    hash = data['hash']
     data = {
         "block_identifier": {
             "index": index_value,
@@ -958,7 +818,7 @@ async def account_balance(request: Request):
         ],
         "metadata": None
         }
-    return data
+    return FastJSONResponse(data)
     # else:
     #     return jsonify({
     #         "code": 500,
@@ -970,7 +830,7 @@ async def account_balance(request: Request):
 # Endpoint that is used to fetch the unspend amount of coins/transaction in an account.
 @app.post('/account/coins')
 async def account_coins(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
 
@@ -979,12 +839,11 @@ async def account_coins(request: Request):
     if not address:
         return HTTPException(status_code=400, detail={"error": "Address not provided"})
 
-    utxos_data = get_address_utxos(address)
+    utxos_data, chain = await asyncio.gather(get_address_utxos(address), get_chain_constants())
     heights = [entry['height'] for entry in utxos_data]
     txids = [entry['txid'] for entry in utxos_data]
     satoshis = [entry['satoshis'] for entry in utxos_data]
-    chain = get_network_status()
-    newchainid = chain["chainid"]
+    newchainid = chain.chainid
     if utxos_data:
         data = {
         "block_identifier": {
@@ -1009,7 +868,7 @@ async def account_coins(request: Request):
         ],
         "metadata": None
         }
-        return data
+        return FastJSONResponse(data)
     else:
         return HTTPException(status_code=500, detail={
             "code": 500,
@@ -1020,7 +879,7 @@ async def account_coins(request: Request):
 @app.post('/call')
 async def call_rpc(request: Request):
     try:
-        data = await request.json()
+        data = loads(await request.body())
         # Check if the request has the necessary parameters
         if not data or "method" not in data:
             return HTTPException(status_code=400, detail={"error": "Invalid request. 'method' is a mandatory parameter."})
@@ -1034,16 +893,16 @@ async def call_rpc(request: Request):
         "params": parameter if parameter else []
     }
         # Call the send_request function to make a request to your RPC
-        response = send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
+        response = await send_request("POST", RPCURL, {'content-type': 'text/plain;'}, payload)
         # Return the response from your RPC
         return response
-    except requests.exceptions.RequestException as rpc_error:
+    except httpx.HTTPError as rpc_error:
         return HTTPException(status_code=500, detail={"error": str(rpc_error)})
 
 # Endpoint that is used to get a new verus address.
 @app.post('/construction/derive')
 async def networkstatus():
-    data = getnewaddress()
+    data = await getnewaddress()
     if data:
         return {"address": data}
     else:
@@ -1057,7 +916,7 @@ async def networkstatus():
 # Endpoint that is used to create a raw unsigned transaction.
 @app.post('/construction/payloads')
 async def create_unsigned_transaction_route(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
     txid = data.get("txid")
@@ -1069,7 +928,7 @@ async def create_unsigned_transaction_route(request: Request):
         return HTTPException(status_code=400, detail={"error": "Invalid arguments"})
 
     try:
-        unsigned_transaction = create_unsigned_transaction(txid, vout, address, amount)
+        unsigned_transaction = await create_unsigned_transaction(txid, vout, address, amount)
         return {"transaction": unsigned_transaction}
     except Exception as e:
         return HTTPException(status_code=500, detail={
@@ -1082,7 +941,7 @@ async def create_unsigned_transaction_route(request: Request):
 # Endpoint that is used to verify and sign a raw unsigned transaction.
 @app.post('/construction/parse')
 async def parse_and_sign_transaction_route(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
 
@@ -1091,7 +950,7 @@ async def parse_and_sign_transaction_route(request: Request):
     if not unsigned_hex:
         return HTTPException(status_code=400, detail={"error": "Unsigned hex not provided"})
     try:
-        result = parse_and_sign_transaction(unsigned_hex)
+        result = await parse_and_sign_transaction(unsigned_hex)
         return result
     except Exception as e:
         return HTTPException(status_code=500, detail={
@@ -1104,7 +963,7 @@ async def parse_and_sign_transaction_route(request: Request):
 # Endpoint that is used to broadcast a signed transaction into the blockchain.
 @app.post('/construction/submit')
 async def submit_signed_transaction_route(request: Request):
-    data = await request.json()
+    data = loads(await request.body())
     if not data:
         return HTTPException(status_code=400, detail={"error": "No data provided"})
 
@@ -1114,7 +973,7 @@ async def submit_signed_transaction_route(request: Request):
         return HTTPException(status_code=400, detail={"error": "Signed hex not provided"})
 
     try:
-        result = submit_signed_transaction(signed_hex)
+        result = await submit_signed_transaction(signed_hex)
         return result
     except Exception as e:
         return HTTPException(status_code=500, detail={
@@ -1123,6 +982,11 @@ async def submit_signed_transaction_route(request: Request):
             "description": "There was an error while fetching the information from the Local RPC"
         })
 
+# Endpoint that is used to fetch the connection and cache statistics of the API.
+@app.post('/stats')
+async def stats_info():
+    return {"rpc": rpc.stats(), "block_cache": blockcache.stats(), "tx_cache": txcache.stats(), "chain": chainconstants.stats(), "tip": tiptracker.stats(), "zmq": zmqsubscriber.stats(), "headers": headerindex.stats(), "store": blockstore.stats(), "prefetch": prefetcher.stats(), "response_cache": responsecache.stats(), "disk_cache": diskcache.stats(), "reorg": reorgengine.stats(), "events": blockevents.stats()}
+
 # Run the API
 if __name__ == '__main__':
     # Only use the debug=True in development environment.
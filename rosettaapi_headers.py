@@ -0,0 +1,498 @@
+# Verus Network Data API - block header index
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Compact height -> hash table of the best chain with the time and chainwork of every block.
+# The records live in a memory-mapped file, so a restart opens millions of headers without
+# asking the RPC again, and parent lookups and height/hash translation need no RPC call.
+
+
+# Module imports.
+import asyncio
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+
+# Default index settings, used when the env variables are not set.
+DEFAULT_HEADER_SYNC_BATCH = 500
+DEFAULT_HEADER_REORG_DEPTH = 100
+DEFAULT_HEADER_POLL_INTERVAL = 2
+
+# File layout: a 16 byte header (magic, format version, count) followed by one fixed size
+# record per height: 32 byte block hash, 4 byte block time and 32 byte chainwork.
+FILE_HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<32sI32s")
+RECORD_TIME = struct.Struct("<32xI32x")
+RECORDS_MAGIC = b"VRSCHDRS"
+FORMAT_VERSION = 1
+GROW_RECORDS = 65536
+
+# The hash -> height lookup is an open addressing table of 4 byte slots in its own file,
+# a slot holds height + 1, 0 for a free slot and TOMBSTONE for a slot freed by a rollback.
+TABLE_HEADER = struct.Struct("<8sIII")
+TABLE_MAGIC = b"VRSCHIDX"
+SLOT = struct.Struct("<I")
+MIN_SLOTS = 1 << 16
+EMPTY = 0
+TOMBSTONE = 0xFFFFFFFF
+
+
+# Helps to map a file of at least `size` bytes into memory, keeps the data in a bytearray when path is None.
+def map_buffer(path, size, current=None):
+    if path is None:
+        buffer = bytearray(size)
+        if current is not None:
+            buffer[:len(current)] = current
+        return buffer
+    if not os.path.exists(path):
+        open(path, "wb").close()
+    with open(path, "r+b") as file:
+        if os.path.getsize(path) < size:
+            file.truncate(size)
+        return mmap.mmap(file.fileno(), 0)
+
+
+# Helps to pick the first slot of a block hash, the low bytes of a block hash are uniformly distributed.
+def first_slot(digest, slots):
+    return int.from_bytes(digest[24:], "little") & (slots - 1)
+
+
+# Height -> hash index of the best chain, with the time and chainwork of every block.
+# The API passes in its own send_batch function, so the index is synced by a thread for the
+# Flask API and by an asyncio task for the FastAPI API. New heights are appended as the node
+# extends its chain and the heights above a fork are dropped when the node reorganizes.
+# Lookups read the buffers without taking the lock, every hash table hit is checked against the records.
+class HeaderIndex:
+    def __init__(self, path=None, sync_batch=DEFAULT_HEADER_SYNC_BATCH, reorg_depth=DEFAULT_HEADER_REORG_DEPTH,
+                 poll_interval=DEFAULT_HEADER_POLL_INTERVAL):
+        self.path = path or None
+        self.sync_batch = sync_batch
+        self.reorg_depth = reorg_depth
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.async_wakeup = None
+        self.loop = None
+        self.records = None
+        self.table = None
+        self.maxtimes = None
+        self.count = 0
+        self.slots = 0
+        self.used = 0
+        self.node_height = None
+        self.syncs = 0
+        self.rollbacks = 0
+        self.errors = 0
+        self.load()
+
+    # Returns the path of the hash table file.
+    def table_path(self):
+        return f"{self.path}.idx" if self.path else None
+
+    # Opens the index files, a missing or unreadable file starts an empty index.
+    def load(self):
+        records = map_buffer(self.path, FILE_HEADER.size + GROW_RECORDS * RECORD.size)
+        magic, version, count = FILE_HEADER.unpack_from(records, 0)
+        if magic != RECORDS_MAGIC or version != FORMAT_VERSION:
+            count = 0
+        self.records = records
+        self.count = min(count, (len(records) - FILE_HEADER.size) // RECORD.size)
+        table = map_buffer(self.table_path(), TABLE_HEADER.size + MIN_SLOTS * SLOT.size)
+        magic, slots, count, used = TABLE_HEADER.unpack_from(table, 0)
+        valid_slots = slots >= MIN_SLOTS and slots & (slots - 1) == 0 and TABLE_HEADER.size + slots * SLOT.size <= len(table)
+        if magic == TABLE_MAGIC and count == self.count and valid_slots:
+            self.table = table
+            self.slots = slots
+            self.used = used
+        else:
+            self.rebuild_table(max(MIN_SLOTS, self.table_size(self.count)))
+        self.write_headers()
+
+    # Helps to size the hash table so it stays at most a quarter full.
+    @staticmethod
+    def table_size(count):
+        slots = MIN_SLOTS
+        while slots < count * 4:
+            slots *= 2
+        return slots
+
+    # Returns the block hash of a height or None when the index does not cover it.
+    def hash_at(self, height):
+        records = self.records
+        try:
+            height = int(height)
+        except (TypeError, ValueError):
+            return None
+        if height < 0 or height >= self.count:
+            return None
+        offset = FILE_HEADER.size + height * RECORD.size
+        return records[offset:offset + 32].hex()
+
+    # Returns the block time of a height or None.
+    def time_at(self, height):
+        if height is None or height < 0 or height >= self.count:
+            return None
+        return RECORD.unpack_from(self.records, FILE_HEADER.size + height * RECORD.size)[1]
+
+    # Returns the chainwork of a height as a hex string or None.
+    def chainwork_at(self, height):
+        if height is None or height < 0 or height >= self.count:
+            return None
+        return RECORD.unpack_from(self.records, FILE_HEADER.size + height * RECORD.size)[2].hex()
+
+    # Returns the height of a block hash or None when it is not in the index.
+    def height_of(self, blockhash):
+        try:
+            digest = bytes.fromhex(str(blockhash))
+        except ValueError:
+            return None
+        if len(digest) != 32:
+            return None
+        records, table, slots, count = self.records, self.table, self.slots, self.count
+        slot = first_slot(digest, slots)
+        for _ in range(slots):
+            value = SLOT.unpack_from(table, TABLE_HEADER.size + slot * SLOT.size)[0]
+            if value == EMPTY:
+                return None
+            if value != TOMBSTONE and value - 1 < count:
+                offset = FILE_HEADER.size + (value - 1) * RECORD.size
+                if records[offset:offset + 32] == digest:
+                    return value - 1
+            slot = (slot + 1) & (slots - 1)
+        return None
+
+    # Returns the running maximum of the block times, the height aligned column the timestamp lookups binary search.
+    # Block times are not strictly increasing (a block can be a little older than its parent), their running maximum is.
+    # The column is built from the records on first use and kept up to date as heights are appended or dropped.
+    def time_column(self):
+        with self.lock:
+            if self.maxtimes is None:
+                with memoryview(self.records) as view:
+                    times = RECORD_TIME.iter_unpack(view[FILE_HEADER.size:FILE_HEADER.size + self.count * RECORD.size])
+                    self.maxtimes = array("I", accumulate((blocktime for blocktime, in times), max))
+            return self.maxtimes
+
+    # Returns the height of the last block mined at or before a unix time, or None when the time is before the genesis block.
+    def height_at_time(self, timestamp):
+        height = bisect_right(self.time_column(), timestamp) - 1
+        return height if height >= 0 else None
+
+    # Returns the heights of the last block at or before every unix time of a list.
+    def heights_at_times(self, timestamps):
+        column = self.time_column()
+        heights = [bisect_right(column, timestamp) - 1 for timestamp in timestamps]
+        return [height if height >= 0 else None for height in heights]
+
+    # Returns the heights of the first and the last block mined within a range of unix times, (None, None) when there is none.
+    def heights_between(self, start, end):
+        column = self.time_column()
+        first = bisect_left(column, start)
+        last = bisect_right(column, end) - 1
+        if first > last:
+            return None, None
+        return first, last
+
+    # Returns the height and hash of the highest indexed block or (None, None).
+    def tip(self):
+        count = self.count
+        if count == 0:
+            return None, None
+        return count - 1, self.hash_at(count - 1)
+
+    # Stores a hash in the hash table, the lock must be held by the caller.
+    def _insert(self, digest, height):
+        if (self.used + 1) * 2 > self.slots:
+            self.rebuild_table(self.table_size(self.count + 1))
+        table, slots = self.table, self.slots
+        slot = first_slot(digest, slots)
+        while True:
+            position = TABLE_HEADER.size + slot * SLOT.size
+            value = SLOT.unpack_from(table, position)[0]
+            if value == EMPTY or value == TOMBSTONE:
+                SLOT.pack_into(table, position, height + 1)
+                if value == EMPTY:
+                    self.used += 1
+                return
+            slot = (slot + 1) & (slots - 1)
+
+    # Frees the slot of a hash, the lock must be held by the caller.
+    def _delete(self, digest, height):
+        table, slots = self.table, self.slots
+        slot = first_slot(digest, slots)
+        for _ in range(slots):
+            position = TABLE_HEADER.size + slot * SLOT.size
+            value = SLOT.unpack_from(table, position)[0]
+            if value == EMPTY:
+                return
+            if value == height + 1:
+                SLOT.pack_into(table, position, TOMBSTONE)
+                return
+            slot = (slot + 1) & (slots - 1)
+
+    # Rebuilds the hash table with the given number of slots from the records, drops the tombstones.
+    def rebuild_table(self, slots):
+        table = bytearray(TABLE_HEADER.size + slots * SLOT.size)
+        records = self.records
+        for height in range(self.count):
+            offset = FILE_HEADER.size + height * RECORD.size
+            slot = first_slot(records[offset:offset + 32], slots)
+            while SLOT.unpack_from(table, TABLE_HEADER.size + slot * SLOT.size)[0] != EMPTY:
+                slot = (slot + 1) & (slots - 1)
+            SLOT.pack_into(table, TABLE_HEADER.size + slot * SLOT.size, height + 1)
+        TABLE_HEADER.pack_into(table, 0, TABLE_MAGIC, slots, self.count, self.count)
+        if self.path is not None:
+            # Written next to the old file and swapped in, readers keep using the old mapping until they are done
+            temporary = f"{self.table_path()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(table)
+            os.replace(temporary, self.table_path())
+            table = map_buffer(self.table_path(), len(table))
+        self.slots = slots
+        self.used = self.count
+        self.table = table
+
+    # Appends the header of the next height, the lock must be held by the caller.
+    def _append(self, digest, blocktime, chainwork):
+        needed = FILE_HEADER.size + (self.count + 1) * RECORD.size
+        if needed > len(self.records):
+            if isinstance(self.records, mmap.mmap):
+                self.records.flush()
+            self.records = map_buffer(self.path, needed + GROW_RECORDS * RECORD.size, self.records if self.path is None else None)
+        RECORD.pack_into(self.records, FILE_HEADER.size + self.count * RECORD.size, digest, blocktime, chainwork)
+        self._insert(digest, self.count)
+        if self.maxtimes is not None:
+            self.maxtimes.append(max(blocktime, self.maxtimes[-1]) if self.maxtimes else blocktime)
+        self.count += 1
+
+    # Drops every height from `height` up, called when the node reorganized its chain.
+    def truncate(self, height):
+        with self.lock:
+            height = max(height, 0)
+            for removed in range(self.count - 1, height - 1, -1):
+                offset = FILE_HEADER.size + removed * RECORD.size
+                self._delete(bytes(self.records[offset:offset + 32]), removed)
+            if height < self.count:
+                self.count = height
+                self.rollbacks += 1
+            if self.maxtimes is not None:
+                del self.maxtimes[height:]
+            self.write_headers()
+
+    # Writes the counts into the file headers.
+    def write_headers(self):
+        FILE_HEADER.pack_into(self.records, 0, RECORDS_MAGIC, FORMAT_VERSION, self.count)
+        TABLE_HEADER.pack_into(self.table, 0, TABLE_MAGIC, self.slots, self.count, self.used)
+
+    # Writes the mapped files to disk.
+    def flush(self):
+        with self.lock:
+            self.write_headers()
+            for buffer in (self.records, self.table):
+                if isinstance(buffer, mmap.mmap):
+                    buffer.flush()
+
+    # Returns the RPC calls that compare the index with the node: the block count and the node's hash of the top indexed height.
+    def check_calls(self):
+        calls = [("getblockcount", [])]
+        if self.count > 0:
+            calls.append(("getblockhash", [self.count - 1]))
+        return calls
+
+    # Reads the responses of check_calls(), returns the node height and whether the node left the indexed chain.
+    # An RPC error raises, only another hash at the top indexed height is a fork.
+    def check(self, responses):
+        height = responses[0].get("result")
+        if not isinstance(height, int):
+            raise Exception("Failed to fetch the block count from the RPC")
+        forked = False
+        if len(responses) > 1:
+            # The node has no block at the top indexed height when it switched to a shorter chain
+            forked = height < self.count - 1 or self.read_hash(responses[1]) != self.hash_at(self.count - 1)
+        self.node_height = height
+        return height, forked
+
+    # Helps to read the block hash of a getblockhash response, raises when the RPC returned an error.
+    @staticmethod
+    def read_hash(response):
+        result = response.get("result") if response else None
+        if not isinstance(result, str):
+            raise Exception("Failed to fetch the block hashes from the RPC")
+        return result
+
+    # Returns the RPC calls that fetch the node's hashes of the top reorg_depth indexed heights the node has.
+    def fork_calls(self):
+        top = self.count if self.node_height is None else min(self.count, self.node_height + 1)
+        return [("getblockhash", [height]) for height in range(max(self.count - self.reorg_depth, 0), top)]
+
+    # Drops the heights from the first one where the node has another hash, takes in the calls and responses of fork_calls().
+    # When the fork is deeper than reorg_depth every checked height is dropped and the next pass goes further back.
+    # An RPC error raises before anything is dropped.
+    def rewind(self, calls, responses):
+        hashes = [self.read_hash(response) for response in responses]
+        for (method, params), blockhash in zip(calls, hashes):
+            if blockhash != self.hash_at(params[0]):
+                self.truncate(params[0])
+                return
+        # The heights above the node's chain are dropped as well
+        if self.node_height is not None and self.count > self.node_height + 1:
+            self.truncate(self.node_height + 1)
+
+    # Returns the getblockhash calls of the next heights to index, up to the node height.
+    def hash_calls(self, height):
+        return [("getblockhash", [next_height]) for next_height in range(self.count, min(height + 1, self.count + self.sync_batch))]
+
+    # Returns the getblockheader calls for the responses of hash_calls().
+    def header_calls(self, responses):
+        hashes = [response.get("result") for response in responses]
+        if not all(hashes):
+            raise Exception("Failed to fetch the block hashes from the RPC")
+        return [("getblockheader", [blockhash]) for blockhash in hashes]
+
+    # Appends the responses of header_calls() to the index.
+    # Returns False when a header does not extend the indexed chain because the node reorganized meanwhile.
+    def append_headers(self, responses):
+        with self.lock:
+            for response in responses:
+                header = response.get("result")
+                if not isinstance(header, dict) or header.get("height") != self.count:
+                    raise Exception("Failed to fetch the block headers from the RPC")
+                if self.count > 0 and header.get("previousblockhash") != self.hash_at(self.count - 1):
+                    self.write_headers()
+                    return False
+                chainwork = bytes.fromhex(str(header.get("chainwork", "")).zfill(64))
+                self._append(bytes.fromhex(header["hash"]), int(header.get("time", 0)), chainwork)
+            self.write_headers()
+        return True
+
+    # Brings the index up to the node's best chain, send_batch is the batch function of the Flask API.
+    def sync(self, send_batch):
+        height, forked = self.check(send_batch(self.check_calls()))
+        while forked:
+            calls = self.fork_calls()
+            self.rewind(calls, send_batch(calls))
+            height, forked = self.check(send_batch(self.check_calls()))
+        while self.count <= height:
+            headers = send_batch(self.header_calls(send_batch(self.hash_calls(height))))
+            if not self.append_headers(headers):
+                break
+        self.flush()
+        self.syncs += 1
+
+    # Brings the index up to the node's best chain, send_batch is the batch coroutine of the FastAPI API.
+    async def sync_async(self, send_batch):
+        height, forked = self.check(await send_batch(self.check_calls()))
+        while forked:
+            calls = self.fork_calls()
+            self.rewind(calls, await send_batch(calls))
+            height, forked = self.check(await send_batch(self.check_calls()))
+        while self.count <= height:
+            headers = await send_batch(self.header_calls(await send_batch(self.hash_calls(height))))
+            if not self.append_headers(headers):
+                break
+        self.flush()
+        self.syncs += 1
+
+    # Wakes the index up so it syncs right away, for example when a new block was announced.
+    # Safe to call from any thread.
+    def notify(self):
+        self.wakeup.set()
+        if self.loop is not None and self.async_wakeup is not None:
+            self.loop.call_soon_threadsafe(self.async_wakeup.set)
+
+    # Starts syncing in a background thread.
+    def start(self, send_batch):
+        thread = threading.Thread(target=self.run, args=(send_batch,), name="header-index", daemon=True)
+        thread.start()
+        return thread
+
+    # Syncs every poll_interval seconds or as soon as notify() is called.
+    def run(self, send_batch):
+        while True:
+            try:
+                self.sync(send_batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to sync the header index: {e}")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    # Syncs every poll_interval seconds or as soon as notify() is called, runs as an asyncio task.
+    async def run_async(self, send_batch):
+        self.loop = asyncio.get_running_loop()
+        self.async_wakeup = asyncio.Event()
+        while True:
+            try:
+                await self.sync_async(send_batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to sync the header index: {e}")
+            try:
+                await asyncio.wait_for(self.async_wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.async_wakeup.clear()
+
+    # Returns the size of the index and its sync counters.
+    def stats(self):
+        height, blockhash = self.tip()
+        return {
+            "path": self.path,
+            "headers": self.count,
+            "height": height,
+            "hash": blockhash,
+            "node_height": self.node_height,
+            "slots": self.slots,
+            "syncs": self.syncs,
+            "rollbacks": self.rollbacks,
+            "errors": self.errors,
+        }
+
+
+# Helps to build the block identifier of an indexed height, None when the index has no block for it.
+def indexed_block_identifier(index, height):
+    if height is None:
+        return None
+    return {"index": height, "hash": index.hash_at(height)}
+
+
+# Builds the /block/time response from the header index.
+# Takes in the request body: a "timestamp", a list of "timestamps" and/or a "start_timestamp" / "end_timestamp" range,
+# all in milliseconds like the other timestamps of the API. Raises ValueError for a malformed body.
+def block_time_response(index, data):
+    if not isinstance(data, dict):
+        raise ValueError("The request body has to be a JSON object")
+    timestamps = data.get("timestamps") or []
+    if not isinstance(timestamps, list):
+        raise ValueError("'timestamps' has to be a list")
+    if data.get("timestamp") is not None:
+        timestamps = [data["timestamp"]] + timestamps
+    timestamps = [int(timestamp) for timestamp in timestamps]
+    start, end = data.get("start_timestamp"), data.get("end_timestamp")
+    if not timestamps and start is None and end is None:
+        raise ValueError("'timestamp', 'timestamps' or 'start_timestamp' / 'end_timestamp' is a mandatory parameter")
+    response = {}
+    if timestamps:
+        # A block belongs to a millisecond timestamp when it was mined in that second or before it
+        heights = index.heights_at_times([timestamp // 1000 for timestamp in timestamps])
+        response["blocks"] = [
+            {
+                "timestamp": timestamp,
+                "block_identifier": indexed_block_identifier(index, height),
+                "block_timestamp": index.time_at(height) * 1000 if height is not None else None
+            }
+            for timestamp, height in zip(timestamps, heights)
+        ]
+    if start is not None or end is not None:
+        start = int(start) if start is not None else 0
+        end = int(end) if end is not None else 0xFFFFFFFF * 1000
+        first, last = index.heights_between(-(-start // 1000), end // 1000)
+        response["range"] = {
+            "start_timestamp": start,
+            "end_timestamp": end,
+            "first_block_identifier": indexed_block_identifier(index, first),
+            "last_block_identifier": indexed_block_identifier(index, last)
+        }
+    return response
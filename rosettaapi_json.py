@@ -0,0 +1,43 @@
+# Verus Network Data API - JSON encoding
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Encodes the API responses and decodes the RPC responses and request bodies with orjson,
+# which is several times faster than the json module on large blocks and mempools.
+# Needs orjson (pip install orjson), falls back to the json module when it is not installed.
+
+
+# Module imports.
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Error raised for invalid JSON, the json module raises the same type.
+JSONDecodeError = orjson.JSONDecodeError if orjson is not None else json.JSONDecodeError
+
+
+# Returns the name of the encoder in use.
+def backend():
+    return "orjson" if orjson is not None else "json"
+
+
+# Encodes a value to compact JSON bytes, sort_keys sorts the keys of every object.
+# Values orjson can not encode (integers above 64 bits, Decimal) are encoded by the json module.
+def dumps(value, sort_keys=False):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(value, option=option)
+        except TypeError:
+            pass
+    return json.dumps(value, sort_keys=sort_keys, separators=(",", ":")).encode()
+
+
+# Decodes JSON from bytes or a string.
+# Also the json_module of the Flask requests, which call loads() without options.
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,338 @@
+# Verus Network Data API - sequential /block prefetcher
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Rosetta clients sync by asking /block for index N, N+1, N+2... A client whose requests walk up
+# the chain gets the next blocks fetched in a single JSON-RPC batch and built into their encoded
+# /block responses in the background, so its requests are answered from memory at its own pace
+# instead of waiting for a round trip to the node on every block.
+
+
+# Module imports.
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from rosettaapi_rpc import request_memo
+
+
+# Default prefetch settings, used when the env variables are not set.
+DEFAULT_PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_PREFETCH_MIN_AHEAD = 4
+DEFAULT_PREFETCH_MAX_AHEAD = 128
+DEFAULT_PREFETCH_CONFIRMATIONS = 100
+DEFAULT_PREFETCH_MAX_AGE = 60
+DEFAULT_PREFETCH_WAIT = 10
+
+# Number of requests in a row a client has to make near its previous height before it counts as syncing.
+SEQUENTIAL_STREAK = 3
+
+# Number of clients whose sync position is tracked.
+MAX_CLIENTS = 256
+
+# Weight of the newest sample in the moving averages of the consumption rate, the fetch latency and the block size.
+SMOOTHING = 0.2
+
+
+# Prefetched block, body is the encoded /block response and built_at the time.monotonic() it was built.
+PrefetchedBlock = namedtuple("PrefetchedBlock", ["hash", "parent_hash", "body", "built_at"])
+
+
+# Helps to update a moving average with a new sample.
+def smooth(average, sample):
+    return sample if average is None else average + SMOOTHING * (sample - average)
+
+
+# Sync position of a client, cursor is the highest height it asked for and rate the blocks it consumes per second.
+class SyncClient:
+    def __init__(self, height, now, ahead):
+        self.cursor = height
+        self.streak = 1
+        self.seen_at = now
+        self.rate = None
+        self.ahead = ahead
+
+
+# Buffer of prefetched /block responses of the clients that sync sequentially.
+# Every client keeps `ahead` blocks above its highest requested height buffered or being fetched. `ahead` covers
+# twice the time a batch takes at the pace the client consumes blocks, between min_ahead and max_ahead, and the
+# buffer never holds more than max_bytes of responses (the farthest blocks are dropped first).
+# Only blocks with at least `confirmations` confirmations are prefetched, the ones above can still be replaced
+# by a reorg. A buffered block that does not link to its buffered neighbours or differs from the hash_at()
+# lookup (the header index) is dropped, and invalidate() drops every block above a fork point.
+# The API passes in its own batch function, so the fetches run as threads for the Flask API and as asyncio
+# tasks for the FastAPI API.
+class BlockPrefetcher:
+    def __init__(self, max_bytes=DEFAULT_PREFETCH_MAX_BYTES, min_ahead=DEFAULT_PREFETCH_MIN_AHEAD,
+                 max_ahead=DEFAULT_PREFETCH_MAX_AHEAD, confirmations=DEFAULT_PREFETCH_CONFIRMATIONS,
+                 max_age=DEFAULT_PREFETCH_MAX_AGE, wait_timeout=DEFAULT_PREFETCH_WAIT, hash_at=None):
+        self.max_bytes = max_bytes
+        self.max_ahead = max_ahead
+        self.min_ahead = max(1, min(min_ahead, max_ahead))
+        self.confirmations = confirmations
+        self.max_age = max_age
+        self.wait_timeout = wait_timeout
+        self.hash_at = hash_at
+        self.buffer = {}
+        self.pending = {}
+        self.clients = OrderedDict()
+        self.tasks = set()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.latency = None
+        self.block_size = None
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.wasted = 0
+        self.discarded = 0
+        self.errors = 0
+
+    # Returns True when prefetching is configured.
+    def enabled(self):
+        return self.max_bytes > 0 and self.max_ahead > 0
+
+    # Helps to drop a buffered block.
+    def _remove(self, height):
+        entry = self.buffer.pop(height, None)
+        if entry is not None:
+            self.bytes -= len(entry.body)
+        return entry
+
+    # Helps to drop the blocks and clients nobody asked for in max_age seconds.
+    def _expire(self, now):
+        for height in [height for height, entry in self.buffer.items() if now - entry.built_at > self.max_age]:
+            self._remove(height)
+            self.wasted += 1
+        while self.clients and now - next(iter(self.clients.values())).seen_at > self.max_age:
+            self.clients.popitem(last=False)
+
+    # Helps to pick how many blocks to keep ahead of a client.
+    def _ahead(self, state):
+        ahead = state.ahead
+        if state.rate and self.latency:
+            ahead = math.ceil(2 * state.rate * self.latency)
+        ahead = max(self.min_ahead, min(self.max_ahead, ahead))
+        # The clients that sync at the same time share the memory budget
+        if self.block_size:
+            syncing = sum(1 for client in self.clients.values() if client.streak >= SEQUENTIAL_STREAK)
+            ahead = min(ahead, max(1, int(self.max_bytes // (self.block_size * max(1, syncing)))))
+        return ahead
+
+    # Registers a /block request of a client for a height.
+    # tip_height is the height of the chain tip, blocks within `confirmations` of it are not prefetched.
+    # Returns the heights to fetch for the client, they are marked as pending and have to be passed to fetch().
+    def observe(self, client, height, tip_height):
+        if not self.enabled() or tip_height is None:
+            return []
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            state = self.clients.get(client)
+            if state is None or not state.cursor - self.max_ahead < height <= state.cursor + self.max_ahead:
+                self.clients[client] = SyncClient(height, now, self.min_ahead)
+                self.clients.move_to_end(client)
+                while len(self.clients) > MAX_CLIENTS:
+                    self.clients.popitem(last=False)
+                return []
+            self.clients.move_to_end(client)
+            state.streak += 1
+            if height > state.cursor:
+                elapsed = now - state.seen_at
+                if elapsed > 0:
+                    state.rate = smooth(state.rate, (height - state.cursor) / elapsed)
+                state.cursor = height
+                state.seen_at = now
+            if state.streak < SEQUENTIAL_STREAK:
+                return []
+            state.ahead = self._ahead(state)
+            first = state.cursor + 1
+            last = min(tip_height - self.confirmations + 1, state.cursor + state.ahead)
+            missing = [height for height in range(first, last + 1) if height not in self.buffer and height not in self.pending]
+            # Refill once half of the window was consumed, so every fetch is a batch of several blocks
+            if not missing or len(missing) < max(1, (last - first + 1) // 2):
+                return []
+            for height in missing:
+                self.pending[height] = None
+            return missing
+
+    # Registers a new chain tip, the blocks it gave enough confirmations are fetched for the clients that sync up to them.
+    # Returns the heights to fetch, they are marked as pending and have to be passed to fetch().
+    def advance(self, tip_height):
+        if not self.enabled() or tip_height is None:
+            return []
+        with self.lock:
+            self._expire(time.monotonic())
+            confirmed = tip_height - self.confirmations + 1
+            missing = set()
+            for state in self.clients.values():
+                if state.streak < SEQUENTIAL_STREAK:
+                    continue
+                last = min(confirmed, state.cursor + state.ahead)
+                missing.update(height for height in range(state.cursor + 1, last + 1)
+                               if height not in self.buffer and height not in self.pending)
+            for height in missing:
+                self.pending[height] = None
+            return sorted(missing)
+
+    # Helps to hand out a buffered block once, a block that is no longer on the best chain is dropped.
+    def _take(self, height):
+        entry = self._remove(height)
+        if entry is None:
+            return None
+        expected = self.hash_at(height) if self.hash_at is not None else None
+        if expected is not None and expected != entry.hash:
+            self.discarded += 1
+            return None
+        self.hits += 1
+        return entry.body
+
+    # Helps to look a height up, returns (body, None) or (None, event to wait for) while the height is being fetched.
+    def _lookup(self, height, event_class):
+        with self.lock:
+            if height in self.buffer:
+                return self._take(height), None
+            if height not in self.pending:
+                self.misses += 1
+                return None, None
+            self.waits += 1
+            event = self.pending[height]
+            if event is None:
+                event = self.pending[height] = event_class()
+            return None, event
+
+    # Returns the prefetched /block response of a height or None, waits for it while it is being fetched.
+    def take(self, height):
+        body, event = self._lookup(height, threading.Event)
+        if event is None or not event.wait(self.wait_timeout):
+            return body
+        with self.lock:
+            return self._take(height)
+
+    # Returns the prefetched /block response of a height or None, waits for it while it is being fetched.
+    async def take_async(self, height):
+        body, event = self._lookup(height, asyncio.Event)
+        if event is None:
+            return body
+        try:
+            await asyncio.wait_for(event.wait(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            return None
+        with self.lock:
+            return self._take(height)
+
+    # Drops every buffered block at or above a height, for example above the fork point of a reorg.
+    def invalidate(self, height):
+        with self.lock:
+            for stale in [stale for stale in self.buffer if stale >= height]:
+                self._remove(stale)
+                self.discarded += 1
+
+    # Returns the RPC calls that fetch a list of heights with the bodies of their transactions.
+    def fetch_calls(self, heights):
+        return [("getblock", [f"{height}", 2]) for height in heights]
+
+    # Builds the responses of fetched blocks, build turns a getblock verbosity 2 result into the encoded /block response.
+    # Returns (height, hash, parent hash, body) tuples of the blocks that were returned for their height.
+    def build(self, heights, responses, build):
+        built = []
+        for height, response in zip(heights, responses):
+            block = response.get("result") if response else None
+            if not isinstance(block, dict) or block.get("height") != height:
+                continue
+            built.append((height, block["hash"], block.get("previousblockhash", block["hash"]), build(block)))
+        return built
+
+    # Adds the built blocks to the buffer and wakes up the requests that wait for the fetched heights.
+    def finish(self, heights, built, elapsed):
+        now = time.monotonic()
+        with self.lock:
+            if built:
+                self.latency = smooth(self.latency, elapsed)
+            for height, block_hash, parent_hash, body in built:
+                self.fetched += 1
+                self.block_size = smooth(self.block_size, len(body))
+                below = self.buffer.get(height - 1)
+                above = self.buffer.get(height + 1)
+                # A block that does not link to its buffered neighbours was fetched across a reorg
+                if (below is not None and below.hash != parent_hash) or (above is not None and above.parent_hash != block_hash):
+                    for stale in (height - 1, height + 1):
+                        if self._remove(stale) is not None:
+                            self.discarded += 1
+                    self.discarded += 1
+                    continue
+                if len(body) > self.max_bytes:
+                    self.wasted += 1
+                    continue
+                self._remove(height)
+                self.buffer[height] = PrefetchedBlock(block_hash, parent_hash, body, now)
+                self.bytes += len(body)
+                # The farthest blocks are needed last, they make room first
+                while self.bytes > self.max_bytes:
+                    self._remove(max(self.buffer))
+                    self.wasted += 1
+            events = [self.pending.pop(height, None) for height in heights]
+        return [event for event in events if event is not None]
+
+    # Fetches and builds a list of heights, send_batch is the batch function of the Flask API.
+    def fetch(self, send_batch, heights, build):
+        # The fetch outlives the request that started it, it must not use its memo
+        request_memo.set(None)
+        began = time.monotonic()
+        built = []
+        try:
+            built = self.build(heights, send_batch(self.fetch_calls(heights)), build)
+        except Exception as e:
+            self.errors += 1
+            print(f"Failed to prefetch blocks {heights[0]}-{heights[-1]}: {e}")
+        finally:
+            for event in self.finish(heights, built, time.monotonic() - began):
+                event.set()
+
+    # Fetches and builds a list of heights, send_batch is the batch coroutine of the FastAPI API.
+    async def fetch_async(self, send_batch, heights, build):
+        request_memo.set(None)
+        began = time.monotonic()
+        built = []
+        try:
+            built = self.build(heights, await send_batch(self.fetch_calls(heights)), build)
+        except Exception as e:
+            self.errors += 1
+            print(f"Failed to prefetch blocks {heights[0]}-{heights[-1]}: {e}")
+        finally:
+            for event in self.finish(heights, built, time.monotonic() - began):
+                event.set()
+
+    # Fetches a list of heights in a background thread.
+    def start(self, send_batch, heights, build):
+        thread = threading.Thread(target=self.fetch, args=(send_batch, heights, build), name="block-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    # Fetches a list of heights in an asyncio task.
+    def start_async(self, send_batch, heights, build):
+        task = asyncio.create_task(self.fetch_async(send_batch, heights, build))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    # Returns the buffer usage and the prefetch counters.
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled(),
+            "blocks": len(self.buffer),
+            "bytes": self.bytes,
+            "pending": len(self.pending),
+            "clients": sum(1 for client in self.clients.values() if client.streak >= SEQUENTIAL_STREAK),
+            "ahead": max((client.ahead for client in self.clients.values()), default=0),
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "hits": self.hits,
+            "waits": self.waits,
+            "misses": self.misses,
+            "fetched": self.fetched,
+            "wasted": self.wasted,
+            "discarded": self.discarded,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
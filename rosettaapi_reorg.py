@@ -0,0 +1,230 @@
+# Verus Network Data API - chain reorganization engine
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Keeps the hashes of the last blocks of the best chain and compares the ancestry of every
+# new tip with them. When the node switched to another chain the fork point is found, every
+# cache, index and stored response above it is rolled back and the removed and added blocks
+# are announced as events.
+
+
+# Module imports.
+import asyncio
+import threading
+from collections import namedtuple
+
+
+# Default engine settings, used when the env variables are not set.
+DEFAULT_REORG_DEPTH = 100
+DEFAULT_REORG_POLL_INTERVAL = 2
+
+# Types of the block events.
+BLOCK_ADDED = "block_added"
+BLOCK_REMOVED = "block_removed"
+
+# Number of heights compared below the known tip by the first check, every further check looks this many times deeper.
+LOOKBACK_GROWTH = 4
+
+
+# Block that was added to or removed from the best chain.
+BlockEvent = namedtuple("BlockEvent", ["type", "height", "hash"])
+
+
+# Follows the best chain of the node through the tips of the tip tracker (notify() is its on_tip callback).
+# The hashes of the last `depth` heights are kept in memory. A new tip is checked with the node's hashes of
+# the heights below it, the first check only compares the known tip and every further one looks deeper
+# until a height with the same hash is found: the fork point. on_rollback is called with the first height
+# that is no longer on the best chain before the chain is updated, then on_events gets the block_removed
+# events of the old chain (highest first) and the block_added events of the new one (lowest first).
+# A fork deeper than `depth` rolls back the whole window, the API cannot tell which older blocks changed.
+# The API passes in its own send_batch function, so the engine runs as a thread for the Flask API and as an
+# asyncio task for the FastAPI API.
+class ReorgEngine:
+    def __init__(self, depth=DEFAULT_REORG_DEPTH, poll_interval=DEFAULT_REORG_POLL_INTERVAL, on_rollback=None, on_events=None):
+        self.depth = max(1, depth)
+        self.poll_interval = poll_interval
+        self.on_rollback = on_rollback
+        self.on_events = on_events
+        self.hashes = {}
+        self.target = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.async_wakeup = None
+        self.loop = None
+        self.checks = 0
+        self.reorgs = 0
+        self.deepest = 0
+        self.deep_reorgs = 0
+        self.added = 0
+        self.removed = 0
+        self.errors = 0
+
+    # Returns the height and hash of the known tip or (None, None).
+    def tip(self):
+        hashes = self.hashes
+        if not hashes:
+            return None, None
+        height = max(hashes)
+        return height, hashes[height]
+
+    # Returns True when the tip snapshot is not the known tip yet.
+    def needs_check(self, target):
+        return target is not None and self.tip()[1] != target.hash
+
+    # Returns the heights whose hashes the node has to be asked for to check a tip at `height`.
+    # The known chain is compared `lookback` heights deep, the new heights above it are fetched
+    # up to `depth` below the tip, the tip's own hash is known from the snapshot.
+    def check_heights(self, height, lookback):
+        known = self.hashes
+        if not known:
+            return list(range(max(height - self.depth + 1, 0), height))
+        first, tip = min(known), max(known)
+        top = min(tip, height)
+        heights = list(range(max(top - lookback + 1, first), top + 1))
+        heights += range(max(tip + 1, height - self.depth + 1), height)
+        return [checked for checked in heights if checked != height]
+
+    # Returns the getblockhash calls of a list of heights.
+    def hash_calls(self, heights):
+        return [("getblockhash", [height]) for height in heights]
+
+    # Reads the responses of hash_calls() into a height -> hash dict.
+    def read_hashes(self, heights, responses):
+        hashes = {}
+        for height, response in zip(heights, responses):
+            result = response.get("result") if response else None
+            if not isinstance(result, str):
+                raise Exception("Failed to fetch the block hashes from the RPC")
+            hashes[height] = result
+        return hashes
+
+    # Returns the highest height where the node has the known hash, None when the check has to look deeper.
+    # A fork below the known window returns the height below the window.
+    def fork_point(self, height, lookback, hashes):
+        known = self.hashes
+        if not known:
+            return -1
+        first, tip = min(known), max(known)
+        top = min(tip, height)
+        low = max(top - lookback + 1, first)
+        for checked in range(top, low - 1, -1):
+            if hashes.get(checked) == known[checked]:
+                return checked
+        return first - 1 if low <= first else None
+
+    # Rolls back everything above the fork point, updates the known chain and announces the events.
+    # Returns the list of events.
+    def apply(self, fork, height, hashes):
+        with self.lock:
+            tip = max(self.hashes) if self.hashes else fork
+            removed = [BlockEvent(BLOCK_REMOVED, removed, self.hashes[removed]) for removed in range(tip, fork, -1) if removed in self.hashes]
+            seeding = not self.hashes
+            if removed:
+                if self.on_rollback is not None:
+                    self.on_rollback(fork + 1)
+                self.reorgs += 1
+                self.removed += len(removed)
+                self.deepest = max(self.deepest, len(removed))
+                if fork < min(self.hashes):
+                    self.deep_reorgs += 1
+                print(f"Chain reorganization: {len(removed)} blocks above height {fork} were replaced")
+            added = [BlockEvent(BLOCK_ADDED, added, hashes[added]) for added in sorted(hashes) if fork < added <= height]
+            # Swapped in as a whole, so lookups without the lock never see a half updated chain
+            chain = {known: blockhash for known, blockhash in self.hashes.items() if height - self.depth < known <= fork}
+            chain.update((event.height, event.hash) for event in added if event.height > height - self.depth)
+            self.hashes = chain
+            # Seeding the window announces nothing, the blocks were not new to the API
+            events = removed + added if not seeding else []
+            self.added += len(added) if not seeding else 0
+        if events and self.on_events is not None:
+            self.on_events(events)
+        return events
+
+    # Checks a tip snapshot against the known chain, send_batch is the batch function of the Flask API.
+    def check(self, send_batch, target):
+        height, lookback = target.height, 1
+        hashes = {height: target.hash}
+        while True:
+            heights = [checked for checked in self.check_heights(height, lookback) if checked not in hashes]
+            if heights:
+                hashes.update(self.read_hashes(heights, send_batch(self.hash_calls(heights))))
+            fork = self.fork_point(height, lookback, hashes)
+            if fork is not None:
+                break
+            lookback *= LOOKBACK_GROWTH
+        self.checks += 1
+        return self.apply(fork, height, hashes)
+
+    # Checks a tip snapshot against the known chain, send_batch is the batch coroutine of the FastAPI API.
+    async def check_async(self, send_batch, target):
+        height, lookback = target.height, 1
+        hashes = {height: target.hash}
+        while True:
+            heights = [checked for checked in self.check_heights(height, lookback) if checked not in hashes]
+            if heights:
+                hashes.update(self.read_hashes(heights, await send_batch(self.hash_calls(heights))))
+            fork = self.fork_point(height, lookback, hashes)
+            if fork is not None:
+                break
+            lookback *= LOOKBACK_GROWTH
+        self.checks += 1
+        return self.apply(fork, height, hashes)
+
+    # Hands a new tip snapshot to the engine and wakes it up, the on_tip callback of the tip tracker.
+    # Safe to call from any thread.
+    def notify(self, target):
+        self.target = target
+        self.wakeup.set()
+        if self.loop is not None and self.async_wakeup is not None:
+            self.loop.call_soon_threadsafe(self.async_wakeup.set)
+
+    # Starts checking the tips in a background thread.
+    def start(self, send_batch):
+        thread = threading.Thread(target=self.run, args=(send_batch,), name="reorg-engine", daemon=True)
+        thread.start()
+        return thread
+
+    # Checks the latest tip as soon as notify() is called, a failed check is retried every poll_interval seconds.
+    def run(self, send_batch):
+        while True:
+            target = self.target
+            if self.needs_check(target):
+                try:
+                    self.check(send_batch, target)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Failed to check the chain tip for a reorganization: {e}")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    # Checks the latest tip as soon as notify() is called, runs as an asyncio task.
+    async def run_async(self, send_batch):
+        self.loop = asyncio.get_running_loop()
+        self.async_wakeup = asyncio.Event()
+        while True:
+            target = self.target
+            if self.needs_check(target):
+                try:
+                    await self.check_async(send_batch, target)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Failed to check the chain tip for a reorganization: {e}")
+            try:
+                await asyncio.wait_for(self.async_wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.async_wakeup.clear()
+
+    # Returns the known tip and the reorganization counters.
+    def stats(self):
+        height, blockhash = self.tip()
+        return {
+            "height": height,
+            "hash": blockhash,
+            "window": len(self.hashes),
+            "checks": self.checks,
+            "reorgs": self.reorgs,
+            "deepest": self.deepest,
+            "deep_reorgs": self.deep_reorgs,
+            "added": self.added,
+            "removed": self.removed,
+            "errors": self.errors,
+        }
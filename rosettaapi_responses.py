@@ -0,0 +1,203 @@
+# Verus Network Data API - pre-encoded responses
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Responses that barely change are encoded to JSON bytes once and reused, only the
+# few dynamic values are spliced into the pre-encoded body.
+
+
+# Module imports.
+import hashlib
+import json
+
+
+# Placeholders for the dynamic values of the /network/options response.
+NODE_VERSION_PLACEHOLDER = "__NODE_VERSION__"
+CHAINID_PLACEHOLDER = "__CHAINID__"
+
+# Body of the /network/options response, node_version and the balance exemption address are filled in.
+NETWORK_OPTIONS_TEMPLATE = {
+    "version": {
+        "rosetta_version": "1.2.5",
+        "node_version": NODE_VERSION_PLACEHOLDER,
+        "middleware_version": "0.2.7",
+        "metadata": None
+    },
+    "allow": {
+        "operation_statuses": [
+            {
+                "status": "confirmed",
+                "successful": True
+            },
+            {
+                "status": "unconfirmed",
+                "successful": True
+            },
+            {
+                "status": "processing",
+                "successful": True
+            },
+            {
+                "status": "pubkey",
+                "successful": True
+            },
+        ],
+        "operation_types": [
+            "Transfer",
+            "mined",
+            "minted",
+            "pubkey"
+        ],
+        "errors": [
+            {
+                "code": 12,
+                "message": "Invalid account format",
+                "description": "This error is returned when the requested AccountIdentifier is improperly formatted.",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 14,
+                "message": "Failed to fetch network version",
+                "description": "There was an error while fetching network version from the RPC",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 16,
+                "message": "Failed to fetch block information",
+                "description": "There was an error while fetching block information from the RPC",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 18,
+                "message": "Failed to fetch transaction information",
+                "description": "There was an error while fetching transaction information from the RPC",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 20,
+                "message": "Failed to fetch mempool information",
+                "description": "There was an error while fetching mempool information from the RPC",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 22,
+                "message": "Failed to fetch balance information",
+                "description": "There was an error while fetching balance information from the API",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 24,
+                "message": "Failed to fetch UTXOs",
+                "description": "There was an error while fetching UTXOs from the API",
+                "retriable": True,
+                "details": None
+            },
+            {
+                "code": 26,
+                "message": "Failed to create new verus wallet address",
+                "description": "There was an error while fetching the information from the Local RPC",
+                "retriable": True,
+                "details": None
+            }
+        ],
+        "historical_balance_lookup": True,
+        "timestamp_start_index": 1231006505,
+        "call_methods": [
+            "POST"
+        ],
+        "balance_exemptions": [
+            {
+                "sub_account_address": CHAINID_PLACEHOLDER,
+                "currency": {
+                    "symbol": "VRSC",
+                    "decimals": 8,
+                    "metadata": None
+                },
+                "exemption_type": "dynamic"
+            }
+        ],
+        "mempool_coins": False
+    }
+}
+
+
+# Helps to build a strong ETag from an encoded response body.
+def make_etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+# Helps to check an If-None-Match request header against the ETag of a response.
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+# Helps to check an Accept-Encoding request header for gzip, "gzip;q=0" or a malformed quality refuses it.
+def accepts_gzip(accept_encoding):
+    if not accept_encoding:
+        return False
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.strip().lower()
+            if not quality.startswith("q="):
+                return True
+            try:
+                return float(quality[2:] or 0) != 0
+            except ValueError:
+                return False
+    return False
+
+
+# Pre-encoded template of a JSON response with placeholder strings for the dynamic values.
+# The template is encoded once and split around the placeholders, render() splices the
+# encoded values in and keeps the last rendered body so unchanged values cost nothing.
+class EncodedTemplate:
+    def __init__(self, template, placeholders):
+        self.placeholders = placeholders
+        encoded = json.dumps(template, separators=(",", ":")).encode()
+        self.parts = []
+        self.order = []
+        for placeholder in placeholders:
+            marker = json.dumps(placeholder).encode()
+            index = encoded.index(marker)
+            self.order.append((index, placeholder, marker))
+        self.order.sort()
+        position = 0
+        for index, placeholder, marker in self.order:
+            self.parts.append(encoded[position:index])
+            position = index + len(marker)
+        self.parts.append(encoded[position:])
+        self.rendered = None
+
+    # Returns the encoded body and its ETag for the given placeholder values.
+    def render(self, values):
+        key = tuple(values[placeholder] for placeholder in self.placeholders)
+        rendered = self.rendered
+        if rendered is None or rendered[0] != key:
+            chunks = [self.parts[0]]
+            for (index, placeholder, marker), part in zip(self.order, self.parts[1:]):
+                chunks.append(json.dumps(values[placeholder]).encode())
+                chunks.append(part)
+            body = b"".join(chunks)
+            rendered = (key, body, make_etag(body))
+            self.rendered = rendered
+        return rendered[1], rendered[2]
+
+
+# Pre-encoded /network/options response.
+network_options_template = EncodedTemplate(NETWORK_OPTIONS_TEMPLATE, [NODE_VERSION_PLACEHOLDER, CHAINID_PLACEHOLDER])
+
+
+# Returns the encoded /network/options body and its ETag.
+def network_options_body(node_version, chainid):
+    return network_options_template.render({
+        NODE_VERSION_PLACEHOLDER: f"{node_version}",
+        CHAINID_PLACEHOLDER: chainid
+    })
@@ -0,0 +1,419 @@
+# Verus Network Data API - RPC transport
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Keeps a bounded pool of keep-alive connections to the verusd RPC so every call
+# does not have to open a new TCP connection and redo the basic auth handshake.
+
+
+# Module imports.
+import asyncio
+import contextvars
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from rosettaapi_json import dumps, loads
+
+# httpx is only used by the FastAPI API, the Flask API runs without it.
+# Its import can also fail under gevent monkey patching (no select.epoll), which the Flask API uses in production.
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+
+# Default sizes of the connection pool, used when the env variables are not set.
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 32
+
+# RPC methods that only read from the node, identical concurrent calls of these share one request.
+COALESCE_METHODS = {
+    "getaddressbalance",
+    "getaddressutxos",
+    "getbestblockhash",
+    "getblock",
+    "getblockchaininfo",
+    "getblockhash",
+    "getblockheader",
+    "getinfo",
+    "getmempoolinfo",
+    "getnetworkinfo",
+    "getpeerinfo",
+    "getrawmempool",
+    "getrawtransaction",
+}
+
+
+# Helps to read an integer setting from the env variables, falls back to the default value.
+def env_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# Helps to read a True/False setting from the env variables, only "True" and "true" turn it on.
+def env_flag(value):
+    return value in ("True", "true")
+
+
+# Helps to build a JSON-RPC batch payload, takes in a list of (method, params) entries.
+def batch_payload(calls):
+    return [
+        {
+            "jsonrpc": "1.0",
+            "id": index,
+            "method": method,
+            "params": params
+        }
+        for index, (method, params) in enumerate(calls)
+    ]
+
+
+# Helps to put the responses of a batch back into the order of the calls.
+# Every entry keeps its own result and error, an entry that is missing from the
+# response (or a batch rejected as a whole) gets an error entry instead.
+def batch_results(response_json, count):
+    if isinstance(response_json, dict):
+        error = response_json.get("error") or {"code": -32603, "message": "Invalid batch response"}
+        return [{"result": None, "error": error, "id": index} for index in range(count)]
+    results = [None] * count
+    for entry in response_json:
+        index = entry.get("id")
+        if isinstance(index, int) and 0 <= index < count:
+            results[index] = entry
+    for index in range(count):
+        if results[index] is None:
+            results[index] = {"result": None, "error": {"code": -32603, "message": "Missing response in batch"}, "id": index}
+    return results
+
+
+# Helps to read a single JSON-RPC response, returns the result, the error message or None.
+def result_or_error(response_json):
+    if "result" in response_json:
+        return response_json["result"]
+    elif "error" in response_json:
+        return response_json["error"]["message"]
+    else:
+        return None
+
+
+# Helps to build the key identical RPC requests share, returns None for requests that must not be coalesced.
+def coalesce_key(url, data):
+    calls = data if isinstance(data, list) else [data]
+    for call in calls:
+        if not isinstance(call, dict) or call.get("method") not in COALESCE_METHODS:
+            return None
+    return f"{url} {dumps(data, sort_keys=True).decode()}"
+
+
+# Memo of the read-only RPC responses of the API request that is being handled.
+# The API sets a new RequestMemo for every request, background tasks run without one.
+request_memo = contextvars.ContextVar("request_memo", default=None)
+
+
+# Read-only RPC responses memoized for the life of one API request, keyed by method and params.
+# Helpers that ask for the same block or chain info within one request share the first response.
+class RequestMemo:
+    def __init__(self):
+        self.responses = {}
+        self.hits = 0
+
+    # Helps to build the memo key of a call, returns None for calls that must not be memoized.
+    @staticmethod
+    def key(method, params):
+        if method not in COALESCE_METHODS:
+            return None
+        return f"{method} {dumps(params, sort_keys=True).decode()}"
+
+    # Returns the memoized response of a call or None.
+    def get(self, method, params):
+        key = self.key(method, params)
+        response = self.responses.get(key) if key is not None else None
+        if response is not None:
+            self.hits += 1
+        return response
+
+    # Memoizes the response of a call.
+    def put(self, method, params, response):
+        key = self.key(method, params)
+        if key is not None and isinstance(response, dict):
+            self.responses[key] = response
+
+    # Helps to serve the calls of a batch from the memo.
+    # Returns one entry per call, the memoized response or None when it has to be fetched.
+    def lookup_calls(self, calls):
+        return [self.get(method, params) for method, params in calls]
+
+    # Helps to memoize the responses of a batch.
+    def store_calls(self, calls, responses):
+        for (method, params), response in zip(calls, responses):
+            self.put(method, params, response)
+
+
+# Helps to split a batch into the responses the request memo already has and the calls that have to be sent.
+def memo_lookup_calls(calls):
+    memo = request_memo.get()
+    if memo is None:
+        return None, [None] * len(calls)
+    return memo, memo.lookup_calls(calls)
+
+
+# In-flight call shared by the callers of SingleFlight.
+class FlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Coalesces identical concurrent calls for threads and greenlets (Flask API).
+# The first caller of a key runs the call, every caller that arrives while it is in
+# flight waits for it and gets the same result (or exception).
+# With gevent monkey patching the lock and the event are greenlet friendly.
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    # Runs fn() once for all concurrent callers of the same key.
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = FlightCall()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    # Returns how many calls ran and how many were saved.
+    def stats(self):
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.calls),
+        }
+
+
+# Coalesces identical concurrent calls for asyncio tasks (FastAPI API).
+class AsyncSingleFlight(SingleFlight):
+    # Awaits fn() once for all concurrent callers of the same key.
+    # The call runs in its own task that no caller owns, so a cancelled caller (a client that disconnected)
+    # stops waiting for it without cancelling it for the others.
+    async def do(self, key, fn):
+        task = self.calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.get_running_loop().create_task(fn())
+            task.add_done_callback(lambda done: self.finished(key, done))
+            self.calls[key] = task
+            self.executed += 1
+        return await asyncio.shield(task)
+
+    # Forgets a finished call, its exception is read so a failed call nobody waited for is not reported as unretrieved.
+    def finished(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()
+
+
+# Pooled HTTP transport to the verusd RPC.
+# pool_connections is the number of hosts a pool is kept for, pool_maxsize is the
+# number of keep-alive connections kept per host and pool_block makes callers wait
+# for a free connection instead of opening extra ones when the pool is exhausted.
+class RPCTransport:
+    def __init__(self, url, user, password, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=True, timeout=None):
+        self.url = url
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.lock = threading.Lock()
+        self.singleflight = SingleFlight()
+        self.requests = 0
+        self.errors = 0
+        self.memoized = 0
+
+    # Sends a single HTTP request through the pool and returns the decoded JSON body.
+    # A read-only call that was already made during the current API request is answered from the request memo,
+    # identical read-only requests that are already in flight share that request's result.
+    def request(self, method, url, headers, data):
+        memo = request_memo.get() if isinstance(data, dict) else None
+        if memo is not None:
+            response = memo.get(data.get("method"), data.get("params", []))
+            if response is not None:
+                with self.lock:
+                    self.memoized += 1
+                return response
+        key = coalesce_key(url or self.url, data)
+        if key is None:
+            response = self.send(method, url, headers, data)
+        else:
+            response = self.singleflight.do(key, lambda: self.send(method, url, headers, data))
+        if memo is not None:
+            memo.put(data.get("method"), data.get("params", []), response)
+        return response
+
+    # Sends a single HTTP request through the pool.
+    def send(self, method, url, headers, data):
+        with self.lock:
+            self.requests += 1
+        try:
+            response = self.session.request(method, url or self.url, headers=headers, data=dumps(data), timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            with self.lock:
+                self.errors += 1
+            raise
+        return loads(response.content)
+
+    # Sends several RPC calls in a single HTTP request, takes in a list of (method, params) entries.
+    # Returns one response per call in the same order.
+    def batch(self, url, headers, calls):
+        memo, responses = memo_lookup_calls(calls)
+        pending = [index for index, response in enumerate(responses) if response is None]
+        with self.lock:
+            self.memoized += len(calls) - len(pending)
+        if pending:
+            response_json = self.request("POST", url, headers, batch_payload([calls[index] for index in pending]))
+            for index, response in zip(pending, batch_results(response_json, len(pending))):
+                responses[index] = response
+            if memo is not None:
+                memo.store_calls(calls, responses)
+        return responses
+
+    # Returns the connection reuse statistics of the pool.
+    def stats(self):
+        opened = 0
+        served = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        reused = max(served - opened, 0)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections_opened": opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / served, 4) if served else 0.0,
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "memoized": self.memoized,
+            "singleflight": self.singleflight.stats(),
+        }
+
+    # Closes every pooled connection.
+    def close(self):
+        self.session.close()
+
+
+# Non-blocking pooled transport to the verusd RPC, used by the asyncio (FastAPI) API.
+# max_connections bounds the number of connections to the RPC and max_keepalive is
+# the number of idle keep-alive connections kept open between calls.
+class AsyncRPCTransport:
+    def __init__(self, url, user, password, max_connections=DEFAULT_POOL_MAXSIZE,
+                 max_keepalive=DEFAULT_POOL_MAXSIZE, timeout=None):
+        self.url = url
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.client = httpx.AsyncClient(auth=(user or "", password or ""), limits=limits, timeout=timeout)
+        self.singleflight = AsyncSingleFlight()
+        self.requests = 0
+        self.errors = 0
+        self.memoized = 0
+        self.connections_opened = 0
+
+    # Counts the new TCP connections opened by the pool.
+    async def trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    # Sends a single HTTP request through the pool and returns the decoded JSON body.
+    # Identical read-only requests that are already in flight share that request's result.
+    async def request(self, method, url, headers, data):
+        memo = request_memo.get() if isinstance(data, dict) else None
+        if memo is not None:
+            response = memo.get(data.get("method"), data.get("params", []))
+            if response is not None:
+                self.memoized += 1
+                return response
+        key = coalesce_key(url or self.url, data)
+        if key is None:
+            response = await self.send(method, url, headers, data)
+        else:
+            response = await self.singleflight.do(key, lambda: self.send(method, url, headers, data))
+        if memo is not None:
+            memo.put(data.get("method"), data.get("params", []), response)
+        return response
+
+    # Sends a single HTTP request through the pool.
+    async def send(self, method, url, headers, data):
+        self.requests += 1
+        try:
+            response = await self.client.request(method, url or self.url, headers=headers, content=dumps(data),
+                                                 extensions={"trace": self.trace})
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+        return loads(response.content)
+
+    # Sends several RPC calls in a single HTTP request, takes in a list of (method, params) entries.
+    # Returns one response per call in the same order.
+    async def batch(self, url, headers, calls):
+        memo, responses = memo_lookup_calls(calls)
+        pending = [index for index, response in enumerate(responses) if response is None]
+        self.memoized += len(calls) - len(pending)
+        if pending:
+            response_json = await self.request("POST", url, headers, batch_payload([calls[index] for index in pending]))
+            for index, response in zip(pending, batch_results(response_json, len(pending))):
+                responses[index] = response
+            if memo is not None:
+                memo.store_calls(calls, responses)
+        return responses
+
+    # Returns the connection reuse statistics of the pool.
+    def stats(self):
+        served = self.requests - self.errors
+        reused = max(served - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / served, 4) if served else 0.0,
+            "pool_connections": 1,
+            "pool_maxsize": self.max_connections,
+            "memoized": self.memoized,
+            "singleflight": self.singleflight.stats(),
+        }
+
+    # Closes every pooled connection.
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,288 @@
+# Verus Network Data API - local block store
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Optional SQLite database of confirmed blocks and transactions. Every row keeps the
+# encoded /block or /block/transaction response, so confirmed data is answered from disk
+# without any RPC call (getrawtransaction needs -txindex and is slow on archival nodes).
+# Blocks near the tip can still be replaced by a reorg, they are not stored and keep
+# being served from the RPC.
+
+
+# Module imports.
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from rosettaapi_builders import encode_response
+
+
+# Default store settings, used when the env variables are not set.
+DEFAULT_STORE_CONFIRMATIONS = 101
+DEFAULT_STORE_READERS = 4
+
+# Tables and indexes of the store, the block height and the txid are the primary keys.
+# checkpoints keeps the last height written by a backfill, so it can resume after a crash.
+# block_events keeps the numbered block_added / block_removed events of the /events/blocks endpoint.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    response BLOB NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS blocks_hash ON blocks (hash);
+CREATE TABLE IF NOT EXISTS transactions (
+    txid TEXT PRIMARY KEY,
+    height INTEGER NOT NULL,
+    response BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS transactions_height ON transactions (height);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    height INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS block_events (
+    sequence INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+
+# SQLite database file in WAL mode, so readers never wait for the writer. Writes go through a
+# single connection guarded by a lock, lookups borrow one of up to `readers` read-only
+# connections. Subclasses set the schema, a database without a path is disabled.
+# A subclass with a schema version runs its reset script first when the file was written with
+# another version, for data that can simply be thrown away like a cache.
+class SQLiteDatabase:
+    schema = ""
+    version = 0
+    reset = ""
+
+    def __init__(self, path=None, readers=DEFAULT_STORE_READERS):
+        self.path = path
+        self.readers = queue.LifoQueue()
+        self.max_readers = max(1, readers)
+        self.opened_readers = 0
+        self.writer = None
+        self.lock = threading.Lock()
+
+    # Returns True when a database path is configured.
+    def enabled(self):
+        return bool(self.path)
+
+    # Helps to open a connection to the database.
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # Opens the write connection and creates the tables, called on the first write or lookup.
+    def open(self):
+        with self.lock:
+            if self.writer is None:
+                writer = self.connect()
+                if self.version and writer.execute("PRAGMA user_version").fetchone()[0] != self.version:
+                    writer.executescript(self.reset)
+                    writer.execute(f"PRAGMA user_version = {int(self.version)}")
+                writer.executescript(self.schema)
+                self.writer = writer
+        return self.writer
+
+    # Lends a read connection, a new one is opened while fewer than max_readers exist.
+    @contextmanager
+    def reader(self):
+        if self.writer is None:
+            self.open()
+        try:
+            connection = self.readers.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self.lock:
+                if self.opened_readers < self.max_readers:
+                    self.opened_readers += 1
+                    connection = self.connect()
+                    connection.execute("PRAGMA query_only=ON")
+            if connection is None:
+                connection = self.readers.get()
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+    # Closes every connection of the database.
+    def close(self):
+        with self.lock:
+            while True:
+                try:
+                    self.readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.opened_readers = 0
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+
+# SQLite store of encoded /block and /block/transaction responses.
+# A store without a path is disabled and every lookup returns None.
+class BlockStore(SQLiteDatabase):
+    schema = SCHEMA
+
+    def __init__(self, path=None, confirmations=DEFAULT_STORE_CONFIRMATIONS, readers=DEFAULT_STORE_READERS):
+        super().__init__(path, readers)
+        self.confirmations = confirmations
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # Returns True when data with this many confirmations is final enough to be stored.
+    def is_final(self, confirmations):
+        return self.enabled() and confirmations is not None and int(confirmations) >= self.confirmations
+
+    # Helps to run a lookup that returns a single row or None.
+    def fetch_row(self, sql, params):
+        if not self.enabled():
+            return None
+        with self.reader() as connection:
+            row = connection.execute(sql, params).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row
+
+    # Helps to run a lookup that returns a single value or None.
+    def fetch(self, sql, params):
+        row = self.fetch_row(sql, params)
+        return row[0] if row is not None else None
+
+    # Returns the height, hash and encoded /block response of a block height or block hash or None.
+    def block_row(self, identifier):
+        identifier = str(identifier)
+        if identifier.isdigit() and len(identifier) < 64:
+            return self.fetch_row("SELECT height, hash, response FROM blocks WHERE height = ?", (int(identifier),))
+        return self.fetch_row("SELECT height, hash, response FROM blocks WHERE hash = ?", (identifier,))
+
+    # Returns the encoded /block response of a block height or block hash or None.
+    def block_body(self, identifier):
+        row = self.block_row(identifier)
+        return row[2] if row is not None else None
+
+    # Returns the block height and encoded /block/transaction response of a txid or None.
+    def transaction_row(self, txid):
+        return self.fetch_row("SELECT height, response FROM transactions WHERE txid = ?", (str(txid),))
+
+    # Returns the encoded /block/transaction response of a txid or None.
+    def transaction_body(self, txid):
+        row = self.transaction_row(txid)
+        return row[1] if row is not None else None
+
+    # Stores the encoded /block response of a block with the /block/transaction responses of its transactions.
+    # transactions may be a generator, every response is encoded and written before the next one is built.
+    def put_block(self, height, block_hash, body, transactions=()):
+        self.put_many([(height, block_hash, body)],
+                      ((str(txid), height, encode_response(tx_response)) for txid, tx_response in transactions))
+
+    # Stores the /block/transaction response of a transaction.
+    def put_transaction(self, txid, height, response):
+        self.put_many([], [(str(txid), height, encode_response(response))])
+
+    # Writes encoded block rows (height, hash, body) and transaction rows (txid, height, body) in one SQLite transaction.
+    # The transaction rows may be a generator, SQLite reads them one at a time.
+    # checkpoint is an optional (name, height) tuple that is saved in the same transaction as the rows.
+    def put_many(self, blocks, transactions, checkpoint=None):
+        if not self.enabled() or (not blocks and not transactions and checkpoint is None):
+            return
+        written = len(blocks)
+        writer = self.open()
+        with self.lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                if blocks:
+                    # A block replaced by a reorg leaves its old hash behind, the hash index is unique
+                    writer.executemany("DELETE FROM blocks WHERE hash = ? AND height != ?",
+                                       [(block_hash, height) for height, block_hash, body in blocks])
+                    writer.executemany("INSERT OR REPLACE INTO blocks (height, hash, response) VALUES (?, ?, ?)", blocks)
+                if transactions:
+                    written += writer.executemany("INSERT OR REPLACE INTO transactions (txid, height, response) VALUES (?, ?, ?)", transactions).rowcount
+                if checkpoint is not None:
+                    writer.execute("INSERT OR REPLACE INTO checkpoints (name, height) VALUES (?, ?)", checkpoint)
+                writer.execute("COMMIT")
+            except Exception:
+                writer.execute("ROLLBACK")
+                raise
+        self.writes += written
+
+    # Deletes the blocks and transactions from `height` up in one SQLite transaction, called when the node switched to
+    # another chain. Checkpoints above the fork move back below it, so a backfill writes the new blocks again.
+    def rollback(self, height):
+        if not self.enabled():
+            return
+        writer = self.open()
+        with self.lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                writer.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+                writer.execute("DELETE FROM transactions WHERE height >= ?", (height,))
+                writer.execute("UPDATE checkpoints SET height = ? WHERE height >= ?", (height - 1, height))
+                writer.execute("COMMIT")
+            except Exception:
+                writer.execute("ROLLBACK")
+                raise
+
+    # Writes block event rows (sequence, type, height, hash) in one SQLite transaction.
+    def put_events(self, rows):
+        if not self.enabled() or not rows:
+            return
+        writer = self.open()
+        with self.lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                writer.executemany("INSERT OR REPLACE INTO block_events (sequence, type, height, hash) VALUES (?, ?, ?, ?)", rows)
+                writer.execute("COMMIT")
+            except Exception:
+                writer.execute("ROLLBACK")
+                raise
+
+    # Returns the (sequence, type, height, hash) rows of the block events from `start` up to `stop` (excluded).
+    def events(self, start, stop):
+        if not self.enabled():
+            return []
+        with self.reader() as connection:
+            return connection.execute("SELECT sequence, type, height, hash FROM block_events WHERE sequence >= ? AND sequence < ? ORDER BY sequence",
+                                      (start, stop)).fetchall()
+
+    # Returns the sequence number of the last stored block event or None.
+    def last_event_sequence(self):
+        if not self.enabled():
+            return None
+        with self.reader() as connection:
+            return connection.execute("SELECT MAX(sequence) FROM block_events").fetchone()[0]
+
+    # Returns the height saved for a checkpoint name or None.
+    def checkpoint(self, name):
+        if not self.enabled():
+            return None
+        with self.reader() as connection:
+            row = connection.execute("SELECT height FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # Returns the height of the highest stored block or None.
+    def tip_height(self):
+        if not self.enabled():
+            return None
+        with self.reader() as connection:
+            return connection.execute("SELECT MAX(height) FROM blocks").fetchone()[0]
+
+    # Returns the lookup counters and the height of the highest stored block.
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled(),
+            "tip_height": self.tip_height(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
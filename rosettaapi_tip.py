@@ -0,0 +1,160 @@
+# Verus Network Data API - chain tip tracker
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Polls the RPC in the background with a cheap getbestblockhash and keeps an immutable
+# snapshot of the tip, sync state and peers, so /network/status is answered from memory.
+
+
+# Module imports.
+import asyncio
+import threading
+import time
+from collections import namedtuple
+
+
+# Default tracker settings, used when the env variables are not set.
+DEFAULT_TIP_POLL_INTERVAL = 2
+DEFAULT_TIP_MAX_STALENESS = 10
+DEFAULT_TIP_PEERS_INTERVAL = 30
+
+
+# Immutable view of the chain tip, checked_at is the time.monotonic() of the last successful poll.
+TipSnapshot = namedtuple("TipSnapshot", ["hash", "height", "time", "blocks", "peers", "refreshed_at", "checked_at"])
+
+
+# Keeps the latest TipSnapshot up to date.
+# Every poll asks the RPC for the best block hash only, the tip block, the chain info
+# and the peers are fetched when the tip changed or the peers are older than peers_interval.
+# The API passes in its own send_batch function, so the tracker runs as a thread for the
+# Flask API and as an asyncio task for the FastAPI API.
+# on_tip is called with the new snapshot every time the tip hash changed.
+class TipTracker:
+    def __init__(self, poll_interval=DEFAULT_TIP_POLL_INTERVAL, max_staleness=DEFAULT_TIP_MAX_STALENESS,
+                 peers_interval=DEFAULT_TIP_PEERS_INTERVAL, on_tip=None):
+        self.poll_interval = poll_interval
+        self.max_staleness = max_staleness
+        self.peers_interval = peers_interval
+        self.on_tip = on_tip
+        self.current = None
+        self.wakeup = threading.Event()
+        self.async_wakeup = None
+        self.loop = None
+        self.polls = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    # Returns True when the snapshot is missing or older than max_staleness seconds.
+    def is_stale(self):
+        current = self.current
+        return current is None or time.monotonic() - current.checked_at > self.max_staleness
+
+    # Returns the RPC calls that refresh the snapshot for a best block hash.
+    def refresh_calls(self, besthash):
+        return [
+            ("getblock", [f"{besthash}"]),
+            ("getblockchaininfo", []),
+            ("getpeerinfo", [])
+        ]
+
+    # Returns True when the snapshot has to be refreshed for a best block hash.
+    def needs_refresh(self, besthash):
+        current = self.current
+        if current is None or current.hash != besthash:
+            return True
+        return time.monotonic() - current.refreshed_at >= self.peers_interval
+
+    # Builds a new snapshot from the responses of refresh_calls().
+    def update(self, responses):
+        block, blockchain_info, peers = [response.get("result") for response in responses]
+        if not isinstance(block, dict) or not blockchain_info or peers is None:
+            raise Exception("Failed to refresh the chain tip from the RPC")
+        now = time.monotonic()
+        previous = self.current
+        self.current = TipSnapshot(
+            hash=block["hash"],
+            height=block["height"],
+            time=block["time"],
+            blocks=blockchain_info["blocks"],
+            peers=[peer["id"] for peer in peers],
+            refreshed_at=now,
+            checked_at=now
+        )
+        self.refreshes += 1
+        if self.on_tip is not None and (previous is None or previous.hash != self.current.hash):
+            self.on_tip(self.current)
+
+    # Marks the snapshot as checked against the RPC.
+    def touch(self):
+        if self.current is not None:
+            self.current = self.current._replace(checked_at=time.monotonic())
+
+    # Polls the RPC once, send_batch is the batch function of the Flask API.
+    def poll(self, send_batch):
+        self.polls += 1
+        besthash = send_batch([("getbestblockhash", [])])[0].get("result")
+        if self.needs_refresh(besthash):
+            self.update(send_batch(self.refresh_calls(besthash)))
+        else:
+            self.touch()
+        return self.current
+
+    # Polls the RPC once, send_batch is the batch coroutine of the FastAPI API.
+    async def poll_async(self, send_batch):
+        self.polls += 1
+        besthash = (await send_batch([("getbestblockhash", [])]))[0].get("result")
+        if self.needs_refresh(besthash):
+            self.update(await send_batch(self.refresh_calls(besthash)))
+        else:
+            self.touch()
+        return self.current
+
+    # Wakes the tracker up so it polls right away, for example when a new block was announced.
+    # Safe to call from any thread.
+    def notify(self):
+        self.wakeup.set()
+        if self.loop is not None and self.async_wakeup is not None:
+            self.loop.call_soon_threadsafe(self.async_wakeup.set)
+
+    # Starts polling in a background thread.
+    def start(self, send_batch):
+        thread = threading.Thread(target=self.run, args=(send_batch,), name="tip-tracker", daemon=True)
+        thread.start()
+        return thread
+
+    # Polls the RPC every poll_interval seconds or as soon as notify() is called.
+    def run(self, send_batch):
+        while True:
+            try:
+                self.poll(send_batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to poll the chain tip: {e}")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    # Polls the RPC every poll_interval seconds or as soon as notify() is called, runs as an asyncio task.
+    async def run_async(self, send_batch):
+        self.loop = asyncio.get_running_loop()
+        self.async_wakeup = asyncio.Event()
+        while True:
+            try:
+                await self.poll_async(send_batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to poll the chain tip: {e}")
+            try:
+                await asyncio.wait_for(self.async_wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.async_wakeup.clear()
+
+    # Returns the tracker counters and the age of the snapshot.
+    def stats(self):
+        current = self.current
+        return {
+            "hash": current.hash if current else None,
+            "height": current.height if current else None,
+            "age": round(time.monotonic() - current.checked_at, 3) if current else None,
+            "polls": self.polls,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
@@ -0,0 +1,125 @@
+# Verus Network Data API - ZMQ notifications
+# Shared by rosettaapi_fastapi.py and rosettaapi_flask.py
+# Optional subscriber to the zmqpubhashblock / zmqpubhashtx notifications of verusd.
+# New blocks and transactions are pushed into the API as soon as the node sees them
+# instead of waiting for the next poll. Needs pyzmq (pip install pyzmq), the API falls
+# back to polling when it is not installed or no ZMQ url is configured.
+
+
+# Module imports.
+import threading
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+
+# Helps to pick the pyzmq module, the gevent compatible zmq.green when the threads are gevent greenlets.
+# A blocking zmq poll would otherwise stop every greenlet of the Flask API in production mode.
+def zmq_module():
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            from zmq import green
+            return green
+    except ImportError:
+        pass
+    return zmq
+
+
+# ZMQ topics published by verusd.
+HASHBLOCK_TOPIC = b"hashblock"
+HASHTX_TOPIC = b"hashtx"
+
+
+# Subscribes to the hashblock and hashtx notifications of one or more ZMQ publishers.
+# on_block and on_tx are called with the hex hash of every announced block / transaction.
+class ZMQSubscriber:
+    def __init__(self, urls, on_block=None, on_tx=None, context=None):
+        self.urls = [url for url in urls if url]
+        self.on_block = on_block
+        self.on_tx = on_tx
+        self.context = context
+        self.socket = None
+        self.running = False
+        self.blocks = 0
+        self.transactions = 0
+        self.errors = 0
+        self.sequence = {}
+        self.missed = 0
+
+    # Returns True when pyzmq is installed and at least one url is configured.
+    def enabled(self):
+        return zmq is not None and len(self.urls) > 0
+
+    # Connects the SUB socket to every publisher.
+    def connect(self):
+        if self.context is None:
+            self.context = zmq_module().Context.instance()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.setsockopt(zmq.RCVHWM, 0)
+        if self.on_block is not None:
+            self.socket.setsockopt(zmq.SUBSCRIBE, HASHBLOCK_TOPIC)
+        if self.on_tx is not None:
+            self.socket.setsockopt(zmq.SUBSCRIBE, HASHTX_TOPIC)
+        # The same publisher can be configured for both topics
+        for url in dict.fromkeys(self.urls):
+            self.socket.connect(url)
+
+    # Handles one multipart notification: topic, 32 byte hash and a little endian sequence number.
+    def handle(self, parts):
+        if len(parts) < 2:
+            return
+        topic, body = parts[0], parts[1]
+        if len(parts) > 2 and len(parts[2]) == 4:
+            sequence = int.from_bytes(parts[2], "little")
+            last = self.sequence.get(topic)
+            if last is not None and sequence > last + 1:
+                self.missed += sequence - last - 1
+            self.sequence[topic] = sequence
+        if topic == HASHBLOCK_TOPIC and self.on_block is not None:
+            self.blocks += 1
+            self.on_block(body.hex())
+        elif topic == HASHTX_TOPIC and self.on_tx is not None:
+            self.transactions += 1
+            self.on_tx(body.hex())
+
+    # Receives notifications until stop() is called.
+    def run(self):
+        poller = zmq_module().Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        while self.running:
+            try:
+                if not poller.poll(1000):
+                    continue
+                self.handle(self.socket.recv_multipart())
+            except Exception as e:
+                self.errors += 1
+                print(f"Failed to handle a ZMQ notification: {e}")
+        self.socket.close(linger=0)
+
+    # Connects and starts receiving notifications in a background thread.
+    def start(self):
+        if not self.enabled():
+            return None
+        self.connect()
+        self.running = True
+        thread = threading.Thread(target=self.run, name="zmq-subscriber", daemon=True)
+        thread.start()
+        return thread
+
+    # Stops receiving notifications.
+    def stop(self):
+        self.running = False
+
+    # Returns the notification counters.
+    def stats(self):
+        return {
+            "enabled": self.enabled(),
+            "running": self.running,
+            "blocks": self.blocks,
+            "transactions": self.transactions,
+            "missed": self.missed,
+            "errors": self.errors,
+        }
@@ -0,0 +1,9 @@
+# Verus Network Data API - test setup
+# The API modules live at the top of the repository, the tests import them from there.
+
+
+# Module imports.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+# Verus Network Data API - backfill tests
+# Checks the retries of the historical backfill against a fake RPC transport and that its bodies match the live ones.
+
+
+# Module imports.
+import importlib
+import pytest
+from types import SimpleNamespace
+from rosettaapi_backfill import Backfill, convert_blocks
+from rosettaapi_rpc import env_flag
+
+
+# Answers getblock batches, batches larger than max_calls fail like a node that runs out of resources.
+class FakeTransport:
+    def __init__(self, max_calls):
+        self.max_calls = max_calls
+        self.batches = []
+
+    def batch(self, session, headers, calls):
+        self.batches.append([int(params[0]) for method, params in calls])
+        if len(calls) > self.max_calls:
+            return [{"result": None, "error": {"code": -1, "message": "work queue depth exceeded"}} for _ in calls]
+        return [{"result": {"height": int(params[0])}, "error": None} for method, params in calls]
+
+
+def test_failed_range_is_split_into_halves():
+    transport = FakeTransport(max_calls=2)
+    backfill = Backfill(transport, None, 1, batch_size=8)
+    blocks = backfill.fetch(0, 7)
+    assert [block["height"] for block in blocks] == list(range(8))
+    assert transport.batches[:3] == [list(range(8)), list(range(4)), [0, 1]]
+    assert backfill.rpc_errors == 3
+
+
+def test_split_fetch_gives_up_after_the_retries():
+    transport = FakeTransport(max_calls=0)
+    backfill = Backfill(transport, None, 1, batch_size=8, retries=2)
+    with pytest.raises(Exception):
+        backfill.fetch(0, 7)
+    assert transport.batches == [list(range(8)), list(range(4)), [0, 1]]
+
+
+# Final block with a spending transaction, its values differ between the production and the development responses.
+SPENDING_BLOCK = {"hash": "ef" * 32, "height": 10, "previousblockhash": "01" * 32, "time": 1707138632, "confirmations": 5,
+                  "blocktype": "minted", "tx": [{"txid": "cd" * 32, "vin": [{"txid": "ab" * 32, "vout": 0, "address": "RSpender",
+                  "value": 0.000005, "valueSat": 500}], "vout": [{"value": 0.000005, "valueSat": 500, "n": 0,
+                  "scriptPubKey": {"addresses": ["RReceiver"]}}]}]}
+
+
+@pytest.mark.parametrize("run_production", ["True", "true", "False"])
+def test_backfilled_block_matches_the_live_block(monkeypatch, run_production):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+    monkeypatch.setenv("RUN_PRODUCTION", run_production)
+    import rosettaapi_fastapi
+    api = importlib.reload(rosettaapi_fastapi)
+
+    async def send_batch(calls):
+        return [{"result": SPENDING_BLOCK, "error": None}]
+
+    async def get_chain_constants():
+        return SimpleNamespace(chainid="iChainId")
+
+    monkeypatch.setattr(api, "send_batch", send_batch)
+    monkeypatch.setattr(api, "get_chain_constants", get_chain_constants)
+    monkeypatch.setattr(api.prefetcher, "enabled", lambda: False)
+    live = TestClient(api.app).post("/block", json={"block_identifier": {"index": 10}}).content
+
+    production = env_flag(run_production)
+    block_rows, transaction_rows = convert_blocks([SPENDING_BLOCK], "iChainId", production, production)
+    assert block_rows[0][2] == live
@@ -0,0 +1,51 @@
+# Verus Network Data API - response builder tests
+# Builds /block and /block/transaction responses from getblock verbosity 2 results without a node.
+
+
+# Module imports.
+from rosettaapi_builders import block_response_body, block_transaction_responses, transaction_values
+from rosettaapi_json import loads
+
+
+# Fully shielded transaction: no transparent inputs or outputs.
+SHIELDED = {"txid": "ab" * 32, "version": 4, "vin": [], "vout": [], "vShieldedSpend": [{}], "vShieldedOutput": [{}, {}]}
+
+# Transparent transaction with one output.
+TRANSPARENT = {"txid": "cd" * 32, "version": 4, "vin": [], "vout": [
+    {"value": 1.0, "valueSat": 100000000, "n": 0, "scriptPubKey": {"addresses": ["RAddressOfTheOutput"]}}
+]}
+
+
+# Helps to build a final getblock verbosity 2 result.
+def final_block(transactions):
+    return {"hash": "ef" * 32, "height": 1000, "previousblockhash": "01" * 32, "time": 1707138632,
+            "confirmations": 500, "blocktype": "minted", "tx": transactions}
+
+
+def test_shielded_transaction_has_zero_value_in_production():
+    txid, value, address = transaction_values(SHIELDED, True)
+    assert txid == SHIELDED["txid"]
+    assert value == 0
+
+
+def test_output_without_value_has_zero_value_in_production():
+    transaction = {"txid": "12" * 32, "vout": [{"n": 0, "scriptPubKey": {}}]}
+    assert transaction_values(transaction, True)[1] == 0
+
+
+def test_transparent_transaction_value_in_production():
+    assert transaction_values(TRANSPARENT, True)[1:] == (100000000, ["RAddressOfTheOutput"])
+
+
+def test_block_with_shielded_transaction_in_production():
+    block = final_block([TRANSPARENT, SHIELDED])
+    response = loads(block_response_body(block, True))
+    transactions = response["block"]["transactions"]
+    assert [transaction["transaction_identifier"]["hash"] for transaction in transactions] == [TRANSPARENT["txid"], SHIELDED["txid"]]
+    assert transactions[1]["operations"] == []
+
+
+def test_block_transaction_responses_with_shielded_transaction_in_production():
+    responses = list(block_transaction_responses(final_block([TRANSPARENT, SHIELDED]), "iChainId", True))
+    assert [txid for txid, response in responses] == [TRANSPARENT["txid"], SHIELDED["txid"]]
+    assert responses[1][1]["transaction"]["transaction_identifier"]["hash"] == SHIELDED["txid"]
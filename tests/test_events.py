@@ -0,0 +1,70 @@
+# Verus Network Data API - block event log tests
+# Pages through the block events of the ring buffer and of the block store.
+
+
+# Module imports.
+import pytest
+from rosettaapi_events import MAX_EVENTS_LIMIT, BlockEventLog, block_events_response
+from rosettaapi_reorg import BLOCK_ADDED, BLOCK_REMOVED, BlockEvent
+from rosettaapi_store import BlockStore
+
+
+# Helps to build the block_added events of a range of heights.
+def added(heights):
+    return [BlockEvent(BLOCK_ADDED, height, f"hash{height}") for height in heights]
+
+
+# Helps to read the sequence numbers of a response.
+def sequences(response):
+    return [event["sequence"] for event in response["events"]]
+
+
+def test_pages_from_the_ring():
+    log = BlockEventLog(capacity=10)
+    log.extend(added(range(8)))
+    response = block_events_response(log, {"offset": 2, "limit": 3})
+    assert response["max_sequence"] == 7
+    assert sequences(response) == [2, 3, 4]
+    assert response["events"][0] == {"sequence": 2, "block_identifier": {"index": 2, "hash": "hash2"}, "type": BLOCK_ADDED}
+
+
+def test_without_offset_returns_the_latest_events():
+    log = BlockEventLog(capacity=10)
+    log.extend(added(range(8)))
+    assert sequences(block_events_response(log, {"limit": 2})) == [6, 7]
+
+
+def test_overflow_is_read_from_the_store(tmp_path):
+    store = BlockStore(str(tmp_path / "blocks.db"))
+    log = BlockEventLog(capacity=4, store=store)
+    log.extend(added(range(10)))
+    assert sequences(block_events_response(log, {"offset": 1, "limit": 8})) == list(range(1, 9))
+    assert log.stats()["store_reads"] == 1
+    # The sequence numbers continue from the stored events after a restart
+    restarted = BlockEventLog(capacity=4, store=store)
+    restarted.extend([BlockEvent(BLOCK_REMOVED, 9, "hash9")])
+    response = block_events_response(restarted, {"offset": 8})
+    assert [(event["sequence"], event["type"]) for event in response["events"]] == [(8, BLOCK_ADDED), (9, BLOCK_ADDED), (10, BLOCK_REMOVED)]
+    store.close()
+
+
+def test_without_store_pages_start_at_the_oldest_kept_event():
+    log = BlockEventLog(capacity=4)
+    log.extend(added(range(10)))
+    assert sequences(block_events_response(log, {"offset": 0, "limit": 2})) == [6, 7]
+
+
+def test_empty_log():
+    assert block_events_response(BlockEventLog(), {}) == {"max_sequence": -1, "events": []}
+
+
+def test_limit_is_capped():
+    log = BlockEventLog(capacity=MAX_EVENTS_LIMIT * 2)
+    log.extend(added(range(MAX_EVENTS_LIMIT + 10)))
+    assert len(block_events_response(log, {"offset": 0, "limit": MAX_EVENTS_LIMIT * 2})["events"]) == MAX_EVENTS_LIMIT
+
+
+@pytest.mark.parametrize("data", [[1], "x", 5, {"offset": -1}, {"limit": -1}, {"limit": "many"}])
+def test_malformed_requests_raise_value_error(data):
+    with pytest.raises(ValueError):
+        block_events_response(BlockEventLog(), data)
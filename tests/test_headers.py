@@ -0,0 +1,112 @@
+# Verus Network Data API - header index tests
+# Syncs an in-memory header index from a fake node, including reorganizations and RPC errors, and checks the /block/time bodies.
+
+
+# Module imports.
+import hashlib
+import pytest
+from rosettaapi_headers import HeaderIndex, block_time_response
+
+
+# Helps to build a block hash from a branch name and a height.
+def block_hash(branch, height):
+    return hashlib.sha256(f"{branch}:{height}".encode()).hexdigest()
+
+
+# Fake node that answers getblockcount, getblockhash and getblockheader from its best chain.
+# Calls of the method in `failing` return an RPC error.
+class FakeNode:
+    def __init__(self, length):
+        self.chain = [block_hash("main", height) for height in range(length)]
+        self.failing = None
+
+    # Replaces the top `depth` blocks with `depth + extra` blocks of another branch.
+    def reorg(self, depth, branch, extra=1):
+        base = len(self.chain) - depth
+        self.chain = self.chain[:base] + [block_hash(branch, height) for height in range(base, base + depth + extra)]
+
+    # Helps to answer one call.
+    def answer(self, method, params):
+        if method == "getblockcount":
+            return len(self.chain) - 1
+        if method == "getblockhash":
+            return self.chain[params[0]] if params[0] < len(self.chain) else None
+        height = self.chain.index(params[0])
+        return {"hash": params[0], "height": height, "previousblockhash": self.chain[height - 1] if height else None,
+                "time": 1700000000 + height * 60, "chainwork": f"{height:064x}"}
+
+    # Batch function of the Flask API.
+    def send_batch(self, calls):
+        return [{"result": None, "error": {"code": -28, "message": "Loading block index..."}} if method == self.failing
+                else {"result": self.answer(method, params), "error": None} for method, params in calls]
+
+
+# Helps to check that the index is the node's best chain.
+def assert_indexed(index, node):
+    assert index.count == len(node.chain)
+    for height, blockhash in enumerate(node.chain):
+        assert index.hash_at(height) == blockhash
+        assert index.height_of(blockhash) == height
+
+
+@pytest.fixture
+def index_and_node():
+    node = FakeNode(300)
+    index = HeaderIndex(sync_batch=64, reorg_depth=50)
+    index.sync(node.send_batch)
+    return index, node
+
+
+def test_sync_indexes_the_chain(index_and_node):
+    index, node = index_and_node
+    assert_indexed(index, node)
+    assert index.time_at(10) == 1700000600
+
+
+def test_rpc_error_is_not_a_fork(index_and_node):
+    index, node = index_and_node
+    node.failing = "getblockhash"
+    with pytest.raises(Exception):
+        index.sync(node.send_batch)
+    assert index.rollbacks == 0
+    assert index.count == 300
+
+
+def test_rewind_raises_on_rpc_error_before_dropping_anything(index_and_node):
+    index, node = index_and_node
+    calls = index.fork_calls()
+    responses = node.send_batch(calls)
+    responses[-1] = {"result": None, "error": {"code": -1, "message": "busy"}}
+    with pytest.raises(Exception):
+        index.rewind(calls, responses)
+    assert index.count == 300
+
+
+@pytest.mark.parametrize("depth", [1, 7, 49])
+def test_reorg_rewinds_to_the_fork_point(index_and_node, depth):
+    index, node = index_and_node
+    node.reorg(depth, f"fork{depth}")
+    index.sync(node.send_batch)
+    assert index.rollbacks == 1
+    assert_indexed(index, node)
+
+
+def test_reorg_deeper_than_reorg_depth(index_and_node):
+    index, node = index_and_node
+    node.reorg(120, "deep")
+    index.sync(node.send_batch)
+    assert_indexed(index, node)
+
+
+def test_reorg_to_a_shorter_chain(index_and_node):
+    index, node = index_and_node
+    node.reorg(5, "short", extra=-3)
+    index.sync(node.send_batch)
+    assert_indexed(index, node)
+
+
+@pytest.mark.parametrize("data", [[1], "1", 1])
+def test_block_time_body_has_to_be_an_object(index_and_node, data):
+    index, node = index_and_node
+    with pytest.raises(ValueError):
+        block_time_response(index, data)
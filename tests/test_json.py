@@ -0,0 +1,20 @@
+# Verus Network Data API - JSON encoding tests
+# Checks the encoder against the json module it falls back to.
+
+
+# Module imports.
+import pytest
+from rosettaapi_json import dumps, loads
+
+
+def test_round_trip():
+    value = {"b": [1, 2.5, None, True], "a": "text", "big": 2 ** 70}
+    assert loads(dumps(value)) == value
+    assert dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+
+
+def test_unsupported_options_are_rejected():
+    with pytest.raises(TypeError):
+        dumps({"a": 1}, indent=2)
+    with pytest.raises(TypeError):
+        loads(b"{}", object_hook=dict)
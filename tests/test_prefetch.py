@@ -0,0 +1,31 @@
+# Verus Network Data API - prefetcher tests
+# Checks which heights the /block prefetcher fetches for the clients that sync sequentially.
+
+
+# Module imports.
+from rosettaapi_prefetch import BlockPrefetcher
+
+
+# Helps to register a client that asked for the heights first..last one after another.
+def syncing_client(prefetcher, client, first, last, tip_height):
+    heights = []
+    for height in range(first, last + 1):
+        heights = prefetcher.observe(client, height, tip_height)
+    return heights
+
+
+def test_new_tip_prefetches_the_newly_confirmed_blocks():
+    prefetcher = BlockPrefetcher(min_ahead=4, max_ahead=8, confirmations=10)
+    # The client is at the last confirmed height, there is nothing to prefetch yet
+    assert syncing_client(prefetcher, "client", 88, 90, 99) == []
+    assert prefetcher.advance(101) == [91, 92]
+    assert prefetcher.stats()["pending"] == 2
+    # Pending heights are not fetched twice
+    assert prefetcher.advance(102) == [93]
+
+
+def test_new_tip_without_syncing_clients():
+    prefetcher = BlockPrefetcher(min_ahead=4, max_ahead=8, confirmations=10)
+    prefetcher.observe("client", 90, 99)
+    assert prefetcher.advance(120) == []
+    assert BlockPrefetcher(max_bytes=0).advance(120) == []
@@ -0,0 +1,234 @@
+# Verus Network Data API - reorg engine tests
+# Runs the reorg engine against a fake node whose best chain is rewritten to simulate reorganizations
+# of different depths, and checks the fork points, the events and the rollback of the caches and stores.
+
+
+# Module imports.
+import asyncio
+import hashlib
+import pytest
+from rosettaapi_cache import BlockCache, ResponseCache, TransactionCache
+from rosettaapi_diskcache import DiskCache
+from rosettaapi_reorg import BLOCK_ADDED, BLOCK_REMOVED, ReorgEngine
+from rosettaapi_store import BlockStore
+from rosettaapi_tip import TipSnapshot
+
+
+# Helps to build a block hash from a branch name and a height.
+def block_hash(branch, height):
+    return hashlib.sha256(f"{branch}:{height}".encode()).hexdigest()
+
+
+# Fake node that answers getblockhash from its best chain, the chain can be extended and reorganized.
+class FakeNode:
+    def __init__(self, length):
+        self.chain = [block_hash("main", height) for height in range(length)]
+        self.calls = 0
+
+    # Appends `count` blocks of a branch.
+    def extend(self, count, branch="main"):
+        self.chain += [block_hash(branch, height) for height in range(len(self.chain), len(self.chain) + count)]
+
+    # Replaces the top `depth` blocks with `depth + extra` blocks of another branch.
+    def reorg(self, depth, branch, extra=1):
+        base = len(self.chain) - depth
+        self.chain = self.chain[:base] + [block_hash(branch, height) for height in range(base, base + depth + extra)]
+
+    # Batch function of the Flask API.
+    def send_batch(self, calls):
+        self.calls += len(calls)
+        responses = []
+        for method, params in calls:
+            assert method == "getblockhash"
+            height = params[0]
+            if height < len(self.chain):
+                responses.append({"result": self.chain[height], "error": None})
+            else:
+                responses.append({"result": None, "error": {"code": -8, "message": "Block height out of range"}})
+        return responses
+
+    # Batch coroutine of the FastAPI API.
+    async def send_batch_async(self, calls):
+        return self.send_batch(calls)
+
+    # Snapshot of the tip as the tip tracker hands it to the engine.
+    def tip(self):
+        return TipSnapshot(self.chain[-1], len(self.chain) - 1, 0, 0, [], 0, 0)
+
+
+# Engine seeded with the chain of a fake node, the rollbacks and events are recorded.
+@pytest.fixture
+def engine_and_node():
+    node = FakeNode(1000)
+    rollbacks, events = [], []
+    engine = ReorgEngine(depth=100, on_rollback=rollbacks.append, on_events=events.extend)
+    engine.check(node.send_batch, node.tip())
+    node.calls = 0
+    return engine, node, rollbacks, events
+
+
+# Helps to check that the known window is the node's best chain.
+def assert_follows(engine, node):
+    assert engine.tip() == (len(node.chain) - 1, node.chain[-1])
+    for height, known in engine.hashes.items():
+        assert node.chain[height] == known
+
+
+def test_seeding_announces_nothing(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    assert events == []
+    assert rollbacks == []
+    assert len(engine.hashes) == 100
+    assert_follows(engine, node)
+
+
+def test_new_block_costs_one_call(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    node.extend(1)
+    engine.check(node.send_batch, node.tip())
+    assert node.calls == 1
+    assert rollbacks == []
+    assert [(event.type, event.height) for event in events] == [(BLOCK_ADDED, 1000)]
+    assert_follows(engine, node)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 5, 17, 60, 99])
+def test_reorg_finds_the_fork_point(engine_and_node, depth):
+    engine, node, rollbacks, events = engine_and_node
+    old_chain = list(node.chain)
+    node.reorg(depth, f"fork{depth}")
+    engine.check(node.send_batch, node.tip())
+    fork = len(old_chain) - depth - 1
+    assert rollbacks == [fork + 1]
+    removed = [event for event in events if event.type == BLOCK_REMOVED]
+    added = [event for event in events if event.type == BLOCK_ADDED]
+    # The old blocks are removed highest first before the new ones are added lowest first
+    assert events == removed + added
+    assert [(event.height, event.hash) for event in removed] == [(height, old_chain[height]) for height in range(len(old_chain) - 1, fork, -1)]
+    assert [(event.height, event.hash) for event in added] == [(height, node.chain[height]) for height in range(fork + 1, len(node.chain))]
+    assert engine.stats()["deepest"] == depth
+    assert_follows(engine, node)
+
+
+def test_reorg_to_a_shorter_chain(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    node.reorg(3, "short", extra=-1)
+    engine.check(node.send_batch, node.tip())
+    assert rollbacks == [997]
+    assert [event.type for event in events] == [BLOCK_REMOVED] * 3 + [BLOCK_ADDED] * 2
+    assert_follows(engine, node)
+
+
+def test_reorg_deeper_than_the_window_rolls_back_the_window(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    node.reorg(150, "deep")
+    engine.check(node.send_batch, node.tip())
+    assert rollbacks == [900]
+    assert engine.stats()["deep_reorgs"] == 1
+    assert_follows(engine, node)
+
+
+def test_jump_with_reorg_keeps_the_window(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    node.reorg(3, "jump", extra=0)
+    node.extend(500, "jump")
+    engine.check(node.send_batch, node.tip())
+    assert rollbacks == [997]
+    assert len(engine.hashes) == 100
+    assert_follows(engine, node)
+
+
+def test_unchanged_tip_needs_no_check(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    assert not engine.needs_check(node.tip())
+    node.extend(1)
+    assert engine.needs_check(node.tip())
+
+
+def test_rpc_error_is_not_a_fork(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    node.extend(1)
+    failing = lambda calls: [{"result": None, "error": {"code": -1, "message": "busy"}} for call in calls]
+    with pytest.raises(Exception):
+        engine.check(failing, node.tip())
+    assert rollbacks == []
+    assert_follows(engine, FakeNode(1000))
+
+
+def test_failed_rollback_is_retried(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    failures = []
+
+    def on_rollback(height):
+        if not failures:
+            failures.append(height)
+            raise Exception("The store is locked")
+        rollbacks.append(height)
+
+    engine.on_rollback = on_rollback
+    old_tip = engine.tip()
+    node.reorg(2, "retry")
+    with pytest.raises(Exception):
+        engine.check(node.send_batch, node.tip())
+    assert engine.tip() == old_tip
+    engine.check(node.send_batch, node.tip())
+    assert failures == [998]
+    assert rollbacks == [998]
+    assert_follows(engine, node)
+
+
+def test_check_async(engine_and_node):
+    engine, node, rollbacks, events = engine_and_node
+    node.reorg(5, "async")
+    asyncio.run(engine.check_async(node.send_batch_async, node.tip()))
+    assert rollbacks == [995]
+    assert_follows(engine, node)
+
+
+def test_rollback_invalidates_caches_and_stores(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.db"))
+    blockcache = BlockCache(disk=disk)
+    txcache = TransactionCache(disk=disk)
+    responsecache = ResponseCache(disk=disk)
+    store = BlockStore(str(tmp_path / "blocks.db"))
+    node = FakeNode(20)
+    for height, blockhash in enumerate(node.chain):
+        blockcache.put({"hash": blockhash, "height": height, "confirmations": 200})
+        txcache.store(f"tx{height}", {"result": {"txid": f"tx{height}", "height": height, "confirmations": 200}, "error": None})
+        responsecache.put_block(height, blockhash, b'{"block":%d}' % height)
+        responsecache.put_transaction(f"tx{height}", b"{}", height)
+        store.put_block(height, blockhash, b"{}", [(f"tx{height}", {})])
+    store.put_many([], [], checkpoint=("backfill", 19))
+
+    # Same order as the APIs: the files first, then the memory caches
+    def rollback(height):
+        store.rollback(height)
+        disk.rollback(height)
+        blockcache.rollback(height)
+        txcache.rollback(height)
+        responsecache.rollback(height)
+
+    engine = ReorgEngine(depth=10, on_rollback=rollback)
+    engine.check(node.send_batch, node.tip())
+    node.reorg(4, "replaced")
+    engine.check(node.send_batch, node.tip())
+
+    for height in range(16):
+        assert blockcache.get(height) is not None
+        assert responsecache.block(height) is not None
+        assert store.block_body(height) is not None
+    for height in range(16, 20):
+        assert blockcache.get(height) is None
+        assert blockcache.get(block_hash("main", height)) is None
+        assert txcache.response(f"tx{height}") is None
+        assert responsecache.block(height) is None
+        assert responsecache.transaction(f"tx{height}") is None
+        assert store.block_body(height) is None
+        assert store.transaction_body(f"tx{height}") is None
+    assert store.checkpoint("backfill") == 15
+    # Nothing of the replaced blocks comes back from disk after a restart
+    disk.close()
+    restarted = BlockCache(disk=DiskCache(str(tmp_path / "cache.db")))
+    assert restarted.get(15) is not None
+    assert restarted.get(16) is None
+    store.close()
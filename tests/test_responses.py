@@ -0,0 +1,40 @@
+# Verus Network Data API - response helper tests
+# Checks the content negotiation of the cached responses and the /network/options body.
+
+
+# Module imports.
+from rosettaapi_builders import block_response_body
+from rosettaapi_json import loads
+from rosettaapi_responses import accepts_gzip, network_options_body
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip, deflate")
+    assert accepts_gzip("br;q=1.0, gzip;q=0.5")
+    assert accepts_gzip("*")
+    assert not accepts_gzip(None)
+    assert not accepts_gzip("deflate, br")
+    assert not accepts_gzip("gzip;q=0")
+
+
+def test_malformed_quality_is_not_accepted():
+    assert not accepts_gzip("gzip;q=abc")
+    assert not accepts_gzip("gzip;q=1;level=9")
+
+
+def test_network_options_lists_every_block_operation_type():
+    transfer = {"txid": "cd" * 32, "vin": [{"txid": "ab" * 32, "vout": 0, "address": "RSpender", "valueSat": 5}],
+                "vout": [{"valueSat": 5, "n": 0, "scriptPubKey": {"addresses": ["RReceiver"]}}]}
+    coinbase = {"txid": "ef" * 32, "vin": [{"coinbase": "03"}],
+                "vout": [{"valueSat": 5, "n": 0, "scriptPubKey": {"addresses": ["RStaker"]}}]}
+    emitted = set()
+    for blocktype in ("mined", "minted", None):
+        block = {"hash": "01" * 32, "height": 10, "time": 1707138632, "confirmations": 500, "blocktype": blocktype,
+                 "tx": [coinbase, transfer]}
+        for transaction in loads(block_response_body(block, False))["block"]["transactions"]:
+            emitted.update(operation["type"] for operation in transaction["operations"])
+    body, etag = network_options_body("1.0.0", "iChainId")
+    operation_types = loads(body)["allow"]["operation_types"]
+    assert emitted == {"Transfer", "mined", "minted"}
+    assert emitted <= set(operation_types)
+    assert "mintedpubkey" not in operation_types
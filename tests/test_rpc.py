@@ -0,0 +1,66 @@
+# Verus Network Data API - RPC helper tests
+# Checks the coalescing of identical concurrent RPC calls of the FastAPI API.
+
+
+# Module imports.
+import asyncio
+import pytest
+from rosettaapi_rpc import AsyncSingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        singleflight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[singleflight.do("key", fetch) for _ in range(5)])
+        return results, calls, singleflight
+
+    results, calls, singleflight = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert singleflight.stats() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_cancelled_leader_does_not_cancel_the_followers():
+    async def scenario():
+        singleflight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(singleflight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(singleflight.do("key", fetch))
+        await asyncio.sleep(0)
+        # The client of the leader disconnects while the call is in flight
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await follower
+
+    leader, result = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert result == "result"
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        singleflight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("RPC error")
+
+        return await asyncio.gather(*[singleflight.do("key", fetch) for _ in range(3)], return_exceptions=True), singleflight
+
+    results, singleflight = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert singleflight.stats()["in_flight"] == 0
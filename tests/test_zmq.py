@@ -0,0 +1,86 @@
+# Verus Network Data API - ZMQ subscriber tests
+# Feeds the subscriber hand-built notifications and the notifications of a local PUB socket that stands in for verusd.
+
+
+# Module imports.
+import threading
+import time
+import pytest
+from rosettaapi_zmq import HASHBLOCK_TOPIC, HASHTX_TOPIC, ZMQSubscriber
+
+
+BLOCK_HASH = bytes(range(32))
+TXID = bytes(range(32, 64))
+
+
+# Helps to build a notification the way verusd sends it: topic, hash and a little endian sequence number.
+def notification(topic, digest, sequence):
+    return [topic, digest, sequence.to_bytes(4, "little")]
+
+
+def test_handle_calls_the_callbacks():
+    blocks, transactions = [], []
+    subscriber = ZMQSubscriber(["tcp://127.0.0.1:1"], on_block=blocks.append, on_tx=transactions.append)
+    subscriber.handle(notification(HASHBLOCK_TOPIC, BLOCK_HASH, 0))
+    subscriber.handle(notification(HASHTX_TOPIC, TXID, 0))
+    assert blocks == [BLOCK_HASH.hex()]
+    assert transactions == [TXID.hex()]
+    assert subscriber.stats()["blocks"] == 1
+    assert subscriber.stats()["transactions"] == 1
+
+
+def test_handle_counts_missed_notifications_per_topic():
+    subscriber = ZMQSubscriber(["tcp://127.0.0.1:1"], on_block=lambda blockhash: None, on_tx=lambda txid: None)
+    for sequence in (0, 1, 4):
+        subscriber.handle(notification(HASHBLOCK_TOPIC, BLOCK_HASH, sequence))
+    subscriber.handle(notification(HASHTX_TOPIC, TXID, 7))
+    subscriber.handle(notification(HASHTX_TOPIC, TXID, 8))
+    assert subscriber.missed == 2
+
+
+def test_handle_ignores_topics_without_callback_and_short_messages():
+    blocks = []
+    subscriber = ZMQSubscriber(["tcp://127.0.0.1:1"], on_block=blocks.append)
+    subscriber.handle(notification(HASHTX_TOPIC, TXID, 0))
+    subscriber.handle([HASHBLOCK_TOPIC])
+    assert blocks == []
+
+
+def test_disabled_without_urls():
+    subscriber = ZMQSubscriber([None, ""], on_block=lambda blockhash: None)
+    assert not subscriber.enabled()
+    assert subscriber.start() is None
+
+
+def test_receives_from_a_local_publisher():
+    zmq = pytest.importorskip("zmq")
+    context = zmq.Context()
+    publisher = context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+    received = threading.Event()
+    blocks, transactions = [], []
+
+    def on_block(blockhash):
+        blocks.append(blockhash)
+        received.set()
+
+    subscriber = ZMQSubscriber([f"tcp://127.0.0.1:{port}"], on_block=on_block, on_tx=transactions.append, context=context)
+    try:
+        assert subscriber.start() is not None
+        # A SUB socket only gets the messages published after it joined, so the block is sent until it arrives
+        sequence = 0
+        deadline = time.monotonic() + 10
+        while not received.is_set() and time.monotonic() < deadline:
+            publisher.send_multipart(notification(HASHTX_TOPIC, TXID, sequence))
+            publisher.send_multipart(notification(HASHBLOCK_TOPIC, BLOCK_HASH, sequence))
+            sequence += 1
+            received.wait(0.05)
+        assert received.is_set()
+        assert blocks[0] == BLOCK_HASH.hex()
+        assert all(txid == TXID.hex() for txid in transactions)
+        assert subscriber.stats()["running"]
+    finally:
+        subscriber.stop()
+        time.sleep(1.2)
+        publisher.close(linger=0)
+        context.term()